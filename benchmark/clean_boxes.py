@@ -0,0 +1,70 @@
+import time
+
+import click
+import numpy as np
+from tabulate import tabulate
+
+from surya.common.polygon import PolygonBox
+from surya.common.util import clean_boxes
+
+
+def pairwise_clean_boxes(boxes):
+    # Previous implementation, which compared every pair of boxes
+    new_boxes = []
+    for box_obj in boxes:
+        xs = [point[0] for point in box_obj.polygon]
+        ys = [point[1] for point in box_obj.polygon]
+        if max(xs) == min(xs) or max(ys) == min(ys):
+            continue
+
+        box = box_obj.bbox
+        contained = False
+        for other_box_obj in boxes:
+            if other_box_obj.polygon == box_obj.polygon:
+                continue
+
+            other_box = other_box_obj.bbox
+            if box == other_box:
+                continue
+            if box[0] >= other_box[0] and box[1] >= other_box[1] and box[2] <= other_box[2] and box[3] <= other_box[3]:
+                contained = True
+                break
+        if not contained:
+            new_boxes.append(box_obj)
+    return new_boxes
+
+
+def synthetic_boxes(rng, count: int, page_size: int):
+    # Text lines, with some nested fragments and a few large blocks
+    boxes = []
+    for _ in range(count):
+        x, y = rng.integers(0, page_size, 2)
+        w, h = rng.integers(10, 300), rng.integers(8, 30)
+        if rng.random() < .01:
+            w, h = rng.integers(300, page_size // 10, 2)
+        boxes.append(PolygonBox(polygon=[int(x), int(y), int(x + w), int(y + h)]))
+    return boxes
+
+
+@click.command(help="Benchmark clean_boxes containment filtering on synthetic boxes.")
+@click.option("--boxes", type=int, help="Number of boxes.", default=10000)
+@click.option("--page_size", type=int, help="Width and height of the synthetic page.", default=20000)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(boxes: int, page_size: int, seed: int):
+    rng = np.random.default_rng(seed)
+    synthetic = synthetic_boxes(rng, boxes, page_size)
+
+    results = {}
+    times = {}
+    for name, func in [("pairwise", pairwise_clean_boxes), ("grid index", clean_boxes)]:
+        start = time.time()
+        results[name] = func(synthetic)
+        times[name] = time.time() - start
+
+    identical = [id(b) for b in results["pairwise"]] == [id(b) for b in results["grid index"]]
+    print(f"{boxes} boxes, {len(results['grid index'])} kept, identical output: {identical}")
+    print(tabulate([[name, f"{elapsed:.3f}"] for name, elapsed in times.items()], headers=["Implementation", "Time (s)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import time
+
+import click
+import cv2
+import numpy as np
+from tabulate import tabulate
+
+from surya.detection.heatmap import detect_boxes, get_dynamic_thresholds
+from surya.settings import settings
+
+
+def loop_detect_boxes(linemap, text_threshold, low_text):
+    # Previous implementation, which dilated and fit every connected component separately
+    img_h, img_w = linemap.shape
+
+    text_threshold, low_text = get_dynamic_thresholds(linemap, text_threshold, low_text)
+
+    text_score_comb = (linemap > low_text).astype(np.uint8)
+    label_count, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb, connectivity=4)
+
+    det = []
+    confidences = []
+    max_confidence = 0
+
+    for k in range(1, label_count):
+        size = stats[k, cv2.CC_STAT_AREA]
+        if size < 10:
+            continue
+
+        x, y, w, h = stats[k, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]]
+        niter = int(np.sqrt(min(w, h)))
+
+        buffer = 1
+        sx, sy = max(0, x - niter - buffer), max(0, y - niter - buffer)
+        ex, ey = min(img_w, x + w + niter + buffer), min(img_h, y + h + niter + buffer)
+
+        mask = (labels[sy:ey, sx:ex] == k)
+        line_max = np.max(linemap[sy:ey, sx:ex][mask])
+        if line_max < text_threshold:
+            continue
+
+        ksize = buffer + niter
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize, ksize))
+        selected_segmap = cv2.dilate(mask.astype(np.uint8), kernel)
+
+        y_inds, x_inds = np.nonzero(selected_segmap)
+        x_inds += sx
+        y_inds += sy
+        np_contours = np.column_stack((x_inds, y_inds))
+        box = cv2.boxPoints(cv2.minAreaRect(np_contours))
+
+        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
+        box_ratio = max(w, h) / (min(w, h) + 1e-5)
+        if abs(1 - box_ratio) <= 0.1:
+            l, r = np_contours[:, 0].min(), np_contours[:, 0].max()
+            t, b = np_contours[:, 1].min(), np_contours[:, 1].max()
+            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
+
+        startidx = box.sum(axis=1).argmin()
+        box = np.roll(box, 4 - startidx, 0)
+
+        max_confidence = max(max_confidence, line_max)
+        confidences.append(line_max)
+        det.append(box)
+
+    if max_confidence > 0:
+        confidences = [c / max_confidence for c in confidences]
+    return det, confidences
+
+
+def dense_heatmap(rng, height: int, width: int, line_height: int, line_gap: int):
+    # Rows of slightly rotated word blobs, like a dense text page
+    heatmap = np.zeros((height, width), dtype=np.float32)
+    y = int(rng.integers(-5, 5))
+    while y < height:
+        x = int(rng.integers(-10, 10))
+        h = int(rng.integers(max(2, line_height - 4), line_height + 4))
+        while x < width:
+            w = int(rng.integers(3, 120))
+            rect = ((x + w / 2, y + h / 2), (float(w), float(h)), float(rng.uniform(-3, 3)))
+            cv2.fillPoly(heatmap, [cv2.boxPoints(rect).astype(np.int32)], float(rng.uniform(0.3, 1.0)))
+            x += w + int(rng.integers(3, 15))
+        y += h + line_gap + int(rng.integers(0, 4))
+    return cv2.GaussianBlur(heatmap, (3, 3), 0)
+
+
+@click.command(help="Benchmark detection heatmap postprocessing on synthetic dense heatmaps.")
+@click.option("--pages", type=int, help="Number of synthetic heatmaps.", default=20)
+@click.option("--size", type=int, help="Heatmap height and width.", default=1200)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(pages: int, size: int, seed: int):
+    rng = np.random.default_rng(seed)
+    heatmaps = [dense_heatmap(rng, size, size, int(rng.integers(4, 20)), int(rng.integers(2, 10))) for _ in range(pages)]
+
+    results = {}
+    times = {}
+    for name, func in [("loop", loop_detect_boxes), ("vectorized", detect_boxes)]:
+        start = time.time()
+        results[name] = [func(heatmap, settings.DETECTOR_TEXT_THRESHOLD, settings.DETECTOR_BLANK_THRESHOLD) for heatmap in heatmaps]
+        times[name] = time.time() - start
+
+    box_count = sum(len(boxes) for boxes, _ in results["loop"])
+    identical = all(
+        len(loop_boxes) == len(boxes)
+        and all(a.tobytes() == b.tobytes() for a, b in zip(loop_boxes, boxes))
+        and np.array(loop_conf).tobytes() == np.array(conf).tobytes()
+        for (loop_boxes, loop_conf), (boxes, conf) in zip(results["loop"], results["vectorized"])
+    )
+
+    table = [[name, f"{elapsed:.2f}", f"{elapsed / pages * 1000:.1f}", f"{box_count / elapsed:.0f}"] for name, elapsed in times.items()]
+    print(f"{pages} heatmaps of {size}x{size}, {box_count} boxes, identical output: {identical}")
+    print(tabulate(table, headers=["Implementation", "Time (s)", "ms/page", "Boxes/sec"]))
+
+
+if __name__ == "__main__":
+    main()
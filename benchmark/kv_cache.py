@@ -0,0 +1,78 @@
+import time
+
+import click
+import torch
+from tabulate import tabulate
+
+from surya.common.adetr.decoder import SuryaADETRDecoderSdpaAttention
+from surya.recognition.model.config import SuryaOCRDecoderConfig
+from surya.settings import settings
+
+
+class ConcatCacheAttention(SuryaADETRDecoderSdpaAttention):
+    # Previous dynamic cache, which concatenated the full cache at every step
+    def _update_dynamic_cache(self, key_states, value_states, **cache_kwargs):
+        k_out = key_states
+        if self.key_states is not None:
+            k_out = torch.cat([self.key_states, key_states], dim=2)
+
+        v_out = value_states
+        if self.value_states is not None:
+            v_out = torch.cat([self.value_states, value_states], dim=2)
+
+        self.key_states, self.value_states = k_out, v_out
+        return k_out, v_out
+
+
+def decode(layers, hidden_states, max_tokens: int, device, dtype):
+    batch_size, prefix_length, hidden_size = hidden_states.shape
+    for layer in layers:
+        layer._setup_cache(batch_size, device, dtype)
+
+    with torch.inference_mode():
+        inputs = hidden_states
+        cache_position = torch.arange(prefix_length, device=device)
+        for step in range(max_tokens):
+            for layer in layers:
+                inputs = layer(inputs, position_ids=cache_position.unsqueeze(0), cache_position=cache_position, use_cache=True)
+            position = prefix_length + step
+            cache_position = torch.tensor([position], device=device)
+            inputs = hidden_states[:, :1]
+
+
+def time_decode(layers, hidden_states, max_tokens: int, device, dtype, runs: int):
+    decode(layers, hidden_states, 8, device, dtype)  # Warmup
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(runs):
+        decode(layers, hidden_states, max_tokens, device, dtype)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.time() - start) / runs
+
+
+@click.command(help="Benchmark the dynamic KV cache of the ADETR decoder.")
+@click.option("--batch_size", type=int, help="Number of sequences decoded together.", default=64)
+@click.option("--max_tokens", type=int, help="Number of tokens to decode.", default=175)
+@click.option("--runs", type=int, help="Number of timed runs.", default=3)
+def main(batch_size: int, max_tokens: int, runs: int):
+    device = torch.device(settings.TORCH_DEVICE_MODEL)
+    dtype = settings.MODEL_DTYPE
+    config = SuryaOCRDecoderConfig()
+    layer_count = len(config.self_attn_layers)
+
+    hidden_states = torch.randn((batch_size, 4, config.hidden_size), device=device, dtype=dtype)
+    table = []
+    for name, cls in [("concat", ConcatCacheAttention), ("preallocated", SuryaADETRDecoderSdpaAttention)]:
+        torch.manual_seed(0)
+        layers = [cls(config).to(device, dtype).eval() for _ in range(layer_count)]
+        elapsed = time_decode(layers, hidden_states, max_tokens, device, dtype, runs)
+        table.append([name, f"{elapsed:.2f}", f"{batch_size * max_tokens / elapsed:.1f}"])
+
+    print(f"Decoded {max_tokens} tokens for {batch_size} sequences with {layer_count} self-attention layers")
+    print(tabulate(table, headers=["Cache", "Time per run (s)", "Tokens/sec"]))
+
+
+if __name__ == "__main__":
+    main()
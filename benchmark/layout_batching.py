@@ -0,0 +1,87 @@
+import math
+import time
+
+import click
+import numpy as np
+from PIL import Image
+from tabulate import tabulate
+
+from surya.layout.slicer import ImageSlicer
+from surya.settings import settings
+
+
+def old_slice_count(slicer: ImageSlicer, image: Image.Image) -> int:
+    # Previous count, which also counted slices for images that aren't sliced
+    width, height = image.size
+    if width > height:
+        return math.ceil(width / slicer._calculate_slice_size(width, "width"))
+    return math.ceil(height / slicer._calculate_slice_size(height, "height"))
+
+
+def old_batches(slicer: ImageSlicer, images, batch_size: int):
+    # Previous planner, which split the images into contiguous ranges by their estimated slice counts
+    img_counts = [old_slice_count(slicer, image) for image in images]
+    ranges = []
+    start_idx = 0
+    end_idx = 1
+    while end_idx < len(img_counts):
+        if any([
+            sum(img_counts[start_idx:end_idx]) >= batch_size,
+            sum(img_counts[start_idx:end_idx + 1]) > batch_size,
+        ]):
+            ranges.append((start_idx, end_idx))
+            start_idx = end_idx
+        end_idx += 1
+    if start_idx < len(img_counts):
+        ranges.append((start_idx, len(img_counts)))
+
+    for start_idx, end_idx in ranges:
+        yield slicer.slice(images[start_idx:end_idx])
+
+
+def synthetic_pages(rng, pages: int):
+    # Mostly letter sized renders, with some small crops, and some tall or wide scans that get sliced
+    sizes = [(816, 1056), (1024, 1024), (600, 400), (1275, 1650), (1700, 2200), (2550, 1100), (900, 3300)]
+    weights = [.35, .1, .15, .15, .1, .1, .05]
+    choices = rng.choice(len(sizes), size=pages, p=weights)
+    # Blank pages, since only the sizes matter for batching
+    return [Image.new("RGB", sizes[choice]) for choice in choices]
+
+
+@click.command(help="Benchmark packing layout slices of mixed page sizes into batches.")
+@click.option("--pages", type=int, help="Number of synthetic pages.", default=256)
+@click.option("--batch_size", type=int, help="Layout batch size.", default=None)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(pages: int, batch_size: int, seed: int):
+    if batch_size is None:
+        batch_size = 4 if settings.TORCH_DEVICE_MODEL == "cpu" else 32
+
+    rng = np.random.default_rng(seed)
+    images = synthetic_pages(rng, pages)
+    slicer = ImageSlicer(settings.LAYOUT_SLICE_MIN, settings.LAYOUT_SLICE_SIZE)
+    slice_total = sum(slicer.slice_count(image) for image in images)
+
+    implementations = [
+        ("contiguous pages", lambda: old_batches(slicer, images, batch_size)),
+        ("packed slices", lambda: slicer.batches(images, batch_size)),
+    ]
+    table = []
+    for name, batches in implementations:
+        start = time.time()
+        sizes = [len(batch_slices) for batch_slices, _ in batches()]
+        elapsed = time.time() - start
+        table.append([
+            name,
+            len(sizes),
+            f"{sum(sizes) / (len(sizes) * batch_size):.1%}",
+            sum(size < batch_size for size in sizes[:-1]),
+            sum(size > batch_size for size in sizes),
+            f"{elapsed:.3f}",
+        ])
+
+    print(f"{pages} pages, {slice_total} slices, batch size {batch_size}, {math.ceil(slice_total / batch_size)} batches at best")
+    print(tabulate(table, headers=["Planner", "Batches", "Fill", "Partial batches", "Oversized batches", "Slicing time (s)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import time
+
+import click
+import cv2
+import numpy as np
+from PIL import Image
+from tabulate import tabulate
+
+from surya.common.donut.processor import SuryaEncoderImageProcessor
+from surya.input.processing import slice_polys_from_image
+from surya.settings import settings
+
+
+def pil_slice_polys_from_image(image: Image.Image, polys):
+    # Previous implementation, which masked a copy of every crop with a 3 channel mask, and returned PIL images
+    image_array = np.array(image, dtype=np.uint8)
+    lines = []
+    for coordinates in polys:
+        coordinates = [(corner[0], corner[1]) for corner in coordinates]
+        bbox = [min([x[0] for x in coordinates]), min([x[1] for x in coordinates]), max([x[0] for x in coordinates]), max([x[1] for x in coordinates])]
+        cropped_polygon = image_array[bbox[1]:bbox[3], bbox[0]:bbox[2]].copy()
+        coordinates = [(x - bbox[0], y - bbox[1]) for x, y in coordinates]
+        mask = np.zeros(cropped_polygon.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [np.int32(coordinates)], 1)
+        mask = np.stack([mask] * 3, axis=-1)
+        cropped_polygon[mask == 0] = settings.RECOGNITION_PAD_VALUE
+        lines.append(Image.fromarray(cropped_polygon))
+    return lines
+
+
+def synthetic_page(rng, line_count: int, skewed_fraction: float):
+    # A highres page with dense text lines, some of them slightly skewed
+    width, height = 1632, 2112
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    line_height = max(4, height // line_count)
+    polygons = []
+    for idx in range(line_count):
+        y = idx * line_height
+        x0, x1 = int(rng.integers(0, width // 4)), int(rng.integers(width // 2, width))
+        y0, y1 = y, min(y + line_height - 1, height)
+        if rng.random() < skewed_fraction:
+            skew = int(rng.integers(1, 4))
+            polygons.append([[x0, y0 + skew], [x1, y0], [x1, y1 - skew], [x0, y1]])
+        else:
+            polygons.append([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    return image, polygons
+
+
+@click.command(help="Benchmark slicing text line polygons into the recognition input batch.")
+@click.option("--pages", type=int, help="Number of synthetic pages.", default=4)
+@click.option("--lines", type=int, help="Number of text lines per page.", default=320)
+@click.option("--skewed", type=float, help="Fraction of lines that aren't axis aligned rectangles.", default=0.2)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(pages: int, lines: int, skewed: float, seed: int):
+    rng = np.random.default_rng(seed)
+    synthetic = [synthetic_page(rng, lines, skewed) for _ in range(pages)]
+    processor = SuryaEncoderImageProcessor(do_normalize=True, image_mean=[0.5] * 3, image_std=[0.5] * 3, max_size=settings.RECOGNITION_IMAGE_SIZE)
+    processor.do_align_long_axis = True
+
+    def pil_slices(image, polygons):
+        return [np.asarray(line.convert("RGB")) for line in pil_slice_polys_from_image(image, polygons)]
+
+    implementations = [("PIL crops", pil_slices), ("array views", slice_polys_from_image)]
+    slice_times = {name: 0 for name, _ in implementations}
+    total_times = {name: 0 for name, _ in implementations}
+    identical = True
+    for image, polygons in synthetic:
+        # One page at a time, since a full input batch of several pages takes gigabytes
+        batches = []
+        for name, func in implementations:
+            start = time.time()
+            slices = func(image, polygons)
+            slice_times[name] += time.time() - start
+            batches.append(processor.process_batch(slices))
+            total_times[name] += time.time() - start
+        identical = identical and bool((batches[0] == batches[1]).all())
+        del batches
+
+    table = [
+        [name, f"{slice_times[name]:.3f}", f"{total_times[name]:.3f}", f"{pages * lines / slice_times[name]:.0f}"]
+        for name, _ in implementations
+    ]
+    print(f"{pages} pages with {lines} lines, identical input batch: {identical}")
+    print(tabulate(table, headers=["Slicing", "Slice time (s)", "Slice + batch time (s)", "Lines/sec sliced"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+from PIL import Image
+from tabulate import tabulate
+
+from surya.server.app import make_server
+from surya.server.batcher import PageBatcher
+from surya.server.client import OCRClient
+
+
+def stand_in_ocr(batch_overhead: float, page_time: float):
+    # Stands in for the models: a fixed cost per batch, like the kernel launches and host syncs, plus a cost per page
+    def process(pages):
+        time.sleep(batch_overhead + page_time * len(pages))
+        return [{"text_lines": [], "image_bbox": [0, 0, page.image.width, page.image.height]} for page in pages]
+    return process
+
+
+def synthetic_document(rng) -> bytes:
+    image = Image.fromarray(rng.integers(0, 256, (256, 192, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def run_load(client: OCRClient, documents, clients: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def send(document):
+        start = time.time()
+        pages = list(client.ocr(document))
+        with lock:
+            latencies.append(time.time() - start)
+        return len(pages)
+
+    start = time.time()
+    with ThreadPoolExecutor(clients) as executor:
+        page_count = sum(executor.map(send, documents))
+    return page_count, time.time() - start, latencies
+
+
+@click.command(help="Load test the OCR server, with a stand-in for the models, batching pages across clients or not.")
+@click.option("--clients", type=int, help="Number of concurrent clients.", default=16)
+@click.option("--requests", type=int, help="Number of single page requests.", default=256)
+@click.option("--batch_pages", type=int, help="Max pages per batch.", default=8)
+@click.option("--max_wait", type=float, help="Max seconds a page waits for a batch.", default=0.05)
+@click.option("--batch_overhead", type=float, help="Stand-in seconds per batch.", default=0.05)
+@click.option("--page_time", type=float, help="Stand-in seconds per page.", default=0.01)
+@click.option("--socket", "use_socket", is_flag=True, help="Connect over a UNIX socket instead of TCP.", default=False)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(clients: int, requests: int, batch_pages: int, max_wait: float, batch_overhead: float, page_time: float, use_socket: bool, seed: int):
+    rng = np.random.default_rng(seed)
+    documents = [synthetic_document(rng) for _ in range(requests)]
+
+    table = []
+    for name, size, wait in [("one page at a time", 1, 0.), ("batched across clients", batch_pages, max_wait)]:
+        batcher = PageBatcher(stand_in_ocr(batch_overhead, page_time), size, wait)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, "surya.sock") if use_socket else None
+            server = make_server(batcher, port=0, socket_path=socket_path)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            if socket_path:
+                client = OCRClient(socket_path=socket_path)
+            else:
+                client = OCRClient(f"http://127.0.0.1:{server.server_address[1]}")
+
+            page_count, elapsed, latencies = run_load(client, documents, clients)
+            server.shutdown()
+            server.server_close()
+            batcher.close()
+
+        table.append([
+            name,
+            f"{page_count / elapsed:.1f}",
+            f"{np.percentile(latencies, 50) * 1000:.0f}",
+            f"{np.percentile(latencies, 95) * 1000:.0f}",
+            f"{np.mean(batcher.batch_sizes):.1f}"
+        ])
+
+    print(f"{requests} requests from {clients} clients, stand-in cost {batch_overhead * 1000:.0f}ms per batch + {page_time * 1000:.0f}ms per page")
+    print(tabulate(table, headers=["Server", "Pages/sec", "p50 latency (ms)", "p95 latency (ms)", "Mean batch size"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import time
+
+import click
+import numpy as np
+import torch
+from tabulate import tabulate
+from transformers.image_utils import ChannelDimension
+
+from surya.common.donut.processor import SuryaEncoderImageProcessor
+from surya.settings import settings
+
+
+def per_image_process(processor: SuryaEncoderImageProcessor, images):
+    # Previous implementation, which resized, padded, rescaled through float64 and normalized one line at a time
+    images = [SuryaEncoderImageProcessor.align_long_axis(image, size=processor.max_size, input_data_format=ChannelDimension.LAST) for image in images]
+    images = [SuryaEncoderImageProcessor.numpy_resize(image, processor.max_size, processor.resample) for image in images]
+    images = [image.astype(np.float32) for image in images]
+    images = [
+        SuryaEncoderImageProcessor.pad_image(image=image, size=processor.max_size, input_data_format=ChannelDimension.FIRST, pad_value=settings.RECOGNITION_PAD_VALUE)
+        for image in images
+    ]
+    images = [(image.astype(np.float64) * processor.rescale_factor).astype(np.float32) for image in images]
+    images = [
+        SuryaEncoderImageProcessor.normalize(image, mean=processor.image_mean, std=processor.image_std, input_data_format=ChannelDimension.FIRST)
+        for image in images
+    ]
+    return torch.tensor(np.stack(images, axis=0))
+
+
+def synthetic_lines(rng, count: int):
+    # Line crops of varying width, with some taller than wide so they get rotated
+    lines = []
+    for _ in range(count):
+        height = int(rng.integers(16, 80))
+        width = int(rng.integers(8, 1200))
+        lines.append(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    return lines
+
+
+@click.command(help="Benchmark batched recognition image preprocessing on synthetic line crops.")
+@click.option("--lines", type=int, help="Number of line crops per batch.", default=256)
+@click.option("--runs", type=int, help="Number of timed runs.", default=3)
+@click.option("--seed", type=int, help="Random seed.", default=0)
+def main(lines: int, runs: int, seed: int):
+    rng = np.random.default_rng(seed)
+    images = synthetic_lines(rng, lines)
+    processor = SuryaEncoderImageProcessor(do_normalize=True, image_mean=[0.5] * 3, image_std=[0.5] * 3, max_size=settings.RECOGNITION_IMAGE_SIZE)
+    processor.do_align_long_axis = True
+    device = torch.device(settings.TORCH_DEVICE_MODEL)
+
+    implementations = [
+        ("per image", lambda: per_image_process(processor, images)),
+        ("batched", lambda: processor.process_batch(images)),
+    ]
+    if device.type != "cpu":
+        implementations.append(("batched, on device", lambda: processor.process_batch(images, device=device)))
+
+    results = {}
+    table = []
+    for name, func in implementations:
+        func()  # Warmup
+        start = time.time()
+        for _ in range(runs):
+            results[name] = func()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        elapsed = (time.time() - start) / runs
+        table.append([name, f"{elapsed * 1000:.1f}", f"{lines / elapsed:.0f}"])
+
+    max_diff = max((results[name].cpu() - results["per image"]).abs().max().item() for name in results)
+    print(f"{lines} line crops, max difference from per image: {max_diff:.2e}")
+    print(tabulate(table, headers=["Implementation", "ms/batch", "Lines/sec"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+from PIL import Image
+from tabulate import tabulate
+
+# CLI name, script module, click command
+CLIS = [
+    ("surya_detect", "surya.scripts.detect_text", "detect_text_cli"),
+    ("surya_ocr", "surya.scripts.ocr_text", "ocr_text_cli"),
+    ("surya_layout", "surya.scripts.detect_layout", "detect_layout_cli"),
+    ("surya_table", "surya.scripts.table_recognition", "table_recognition_cli"),
+]
+
+
+def import_time(module: str, env: dict) -> float:
+    # Each measurement is a fresh interpreter, so nothing is imported yet
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_page_time(module: str, command: str, input_path: str, output_dir: str, env: dict) -> float:
+    # From starting the interpreter to the results of a single page being written
+    code = f"from {module} import {command}; {command}()"
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code, input_path, "--output_dir", output_dir], env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise click.ClickException(f"{command} failed:\n{result.stderr[-2000:]}")
+    return elapsed
+
+
+@click.command(help="Benchmark the import time and first page latency of each CLI.")
+@click.option("--input_path", type=click.Path(exists=True), help="Single page input, a synthetic page by default.", default=None)
+@click.option("--model_cache_dir", type=click.Path(), help="Also time loading the models from this weight cache.", default=None)
+@click.option("--runs", type=int, help="Number of timed runs, the fastest is reported.", default=3)
+@click.option("--clis", type=str, help="Comma separated CLIs to benchmark.", default=",".join(cli for cli, _, _ in CLIS))
+def main(input_path: str, model_cache_dir: str, runs: int, clis: str):
+    clis = clis.split(",")
+    env = os.environ.copy()
+    env.pop("MODEL_CACHE_DIR", None)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if input_path is None:
+            input_path = os.path.join(temp_dir, "page.png")
+            rng = np.random.default_rng(0)
+            Image.fromarray(rng.integers(200, 256, (1100, 850, 3), dtype=np.uint8)).save(input_path)
+        output_dir = os.path.join(temp_dir, "results")
+
+        table = []
+        for cli, module, command in CLIS:
+            if cli not in clis:
+                continue
+
+            row = [cli]
+            row.append(min(import_time(module, env) for _ in range(runs)))
+            row.append(min(first_page_time(module, command, input_path, output_dir, env) for _ in range(runs)))
+            if model_cache_dir:
+                cache_env = {**env, "MODEL_CACHE_DIR": model_cache_dir}
+                first_page_time(module, command, input_path, output_dir, cache_env)  # Fills the cache
+                row.append(min(first_page_time(module, command, input_path, output_dir, cache_env) for _ in range(runs)))
+            table.append([row[0]] + [f"{value:.2f}" for value in row[1:]])
+
+    headers = ["CLI", "Import (s)", "First page (s)"]
+    if model_cache_dir:
+        headers.append("First page, weight cache (s)")
+    print(tabulate(table, headers=headers))
+
+
+if __name__ == "__main__":
+    main()
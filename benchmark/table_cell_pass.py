@@ -0,0 +1,63 @@
+import time
+
+import click
+import datasets
+from tabulate import tabulate
+
+from surya.input.processing import convert_if_not_rgb
+from surya.settings import settings
+from surya.table_rec import TableRecPredictor
+
+
+def cell_signature(result):
+    return [(cell.row_id, cell.col_id, cell.rowspan, cell.colspan) for cell in result.cells]
+
+
+@click.command(help="Benchmark skipping the table rec cell pass for tables without spanning or merged cells.")
+@click.option("--max_rows", type=int, help="Maximum number of tables to run the benchmark on.", default=256)
+@click.option("--thresholds", type=str, help="Comma separated merge probability thresholds to try.", default="0.05,0.2,0.5")
+def main(max_rows: int, thresholds: str):
+    table_rec_predictor = TableRecPredictor()
+
+    # These have already been shuffled randomly, so sampling from the start is fine
+    dataset = datasets.load_dataset(settings.TABLE_REC_BENCH_DATASET_NAME, split=f"train[:{max_rows}]")
+    images = convert_if_not_rgb(list(dataset["image"]))
+
+    # Run through one batch first, so compilation and warmup aren't timed
+    table_rec_predictor(images[:1])
+
+    thresholds = [None] + [float(threshold) for threshold in thresholds.split(",")]
+    table = []
+    exact_results = None
+    for threshold in thresholds:
+        settings.TABLE_REC_CELL_PASS_THRESHOLD = threshold
+        table_rec_predictor.cell_pass_stats = (0, 0)
+
+        start = time.time()
+        results = table_rec_predictor(images)
+        elapsed = time.time() - start
+
+        row_count, cell_pass_count = table_rec_predictor.cell_pass_stats
+        if exact_results is None:
+            exact_results = results
+        # Cells are the only part of the result the cell pass changes
+        same_cells = sum(cell_signature(result) == cell_signature(exact) for result, exact in zip(results, exact_results))
+        spanning_missed = sum(
+            any(cell.colspan > 1 or cell.rowspan > 1 for cell in exact.cells) and cell_signature(result) != cell_signature(exact)
+            for result, exact in zip(results, exact_results)
+        )
+        table.append([
+            "always" if threshold is None else threshold,
+            f"{elapsed:.2f}",
+            f"{len(images) / elapsed:.2f}",
+            f"{cell_pass_count}/{row_count}",
+            f"{same_cells / len(images):.1%}",
+            spanning_missed,
+        ])
+
+    print(f"{len(images)} tables from {settings.TABLE_REC_BENCH_DATASET_NAME}")
+    print(tabulate(table, headers=["Cell pass threshold", "Time (s)", "Tables/s", "Rows with cell pass", "Same cells", "Spanning tables changed"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ from transformers.modeling_outputs import BaseModelOutputWithNoAttention
 from transformers.pytorch_utils import ALL_LAYERNORM_LAYERS
 
 _MAX_SQRT_GRADIENT = 1000.0
+# Attributes of the cache blocks that hold their cache, saved and restored around separate prefills
+_CACHE_STATE = ("key_states", "value_states", "_key_buffer", "_value_buffer", "_key_view")
 
 
 class WrappedEmbedding(nn.Embedding):
@@ -199,6 +201,25 @@ class SuryaADETRDecoderSdpaCrossAttention(nn.Module):
         self.value_states = value_states
         self.key_states = key_states
 
+    def _select_cache_rows(self, rows, columns=None):
+        # Encoder keys/values have a fixed length, so only rows are selected
+        self.key_states = self.key_states[rows]
+        self.value_states = self.value_states[rows]
+
+    def _insert_cache_rows(self, key_states, value_states, slots, batch_size):
+        if self.key_states is None:
+            self.key_states = key_states.new_zeros((batch_size, *key_states.shape[1:]))
+            self.value_states = value_states.new_zeros((batch_size, *value_states.shape[1:]))
+        self.key_states[slots] = key_states[:len(slots)]
+        self.value_states[slots] = value_states[:len(slots)]
+
+    def _append_cache_rows(self, key_states, value_states):
+        if self.key_states is None:
+            self.key_states, self.value_states = key_states, value_states
+            return
+        self.key_states = torch.cat([self.key_states, key_states], dim=0)
+        self.value_states = torch.cat([self.value_states, value_states], dim=0)
+
 
 class SuryaADETRDecoderSdpaAttention(nn.Module):
     """Multi-headed attention from 'Attention Is All You Need' paper"""
@@ -260,7 +281,9 @@ class SuryaADETRDecoderSdpaAttention(nn.Module):
             # Mask is batch, head, seq_len, kv_len
             causal_mask = causal_mask[:, :, :, :key_states.shape[-2]]
             current_cache_position = cache_position[-1] if cache_position is not None else torch.tensor(0, dtype=torch.long, device=causal_mask.device)
-            if current_cache_position and self.static_cache:
+            # Per-row cache positions (continuous batching) come with their own padding mask
+            per_row_positions = cache_position is not None and cache_position.dim() == 2
+            if not per_row_positions and current_cache_position and self.static_cache:
                 # Mask out future cache positions
                 position_mask = torch.ones_like(causal_mask, dtype=torch.bool, device=causal_mask.device)
                 position_mask[:, :, :, :current_cache_position + 1] = False
@@ -289,6 +312,11 @@ class SuryaADETRDecoderSdpaAttention(nn.Module):
         self.value_states = None
         self.key_states = None
 
+        # Preallocated buffers backing the dynamic cache, key_states/value_states are views into them
+        self._key_buffer = None
+        self._value_buffer = None
+        self._key_view = None
+
         if self.static_cache:
             cache_shape = (batch_size, self.num_key_value_heads, self.max_boxes, self.head_dim)
             self.value_states = torch.zeros(cache_shape, dtype=dtype, device=device)
@@ -298,23 +326,49 @@ class SuryaADETRDecoderSdpaAttention(nn.Module):
         cache_position = cache_kwargs.get("cache_position")
         k_out, v_out = self.key_states.to(key_states.device), self.value_states.to(value_states.device)
 
-        k_out[:, :, cache_position] = key_states.to(k_out.dtype)
-        v_out[:, :, cache_position] = value_states.to(v_out.dtype)
+        if cache_position.dim() == 2:
+            # Each row writes at its own position, shape (batch, seq_len)
+            batch_idxs = torch.arange(k_out.shape[0], device=k_out.device).unsqueeze(1)
+            k_out[batch_idxs, :, cache_position] = key_states.transpose(1, 2).to(k_out.dtype)
+            v_out[batch_idxs, :, cache_position] = value_states.transpose(1, 2).to(v_out.dtype)
+        else:
+            k_out[:, :, cache_position] = key_states.to(k_out.dtype)
+            v_out[:, :, cache_position] = value_states.to(v_out.dtype)
 
         self.key_states, self.value_states = k_out, v_out
         return k_out, v_out
 
     def _update_dynamic_cache(self, key_states, value_states, **cache_kwargs):
-        k_out = key_states
-        if self.key_states is not None:
-            k_out = torch.cat([self.key_states, key_states], dim=2)
-
-        v_out = value_states
-        if self.value_states is not None:
-            v_out = torch.cat([self.value_states, value_states], dim=2)
-
-        self.key_states, self.value_states = k_out, v_out
-        return k_out, v_out
+        # Write in place into a preallocated buffer, instead of concatenating the whole cache every step
+        if self.key_states is not self._key_view:
+            # The cache was set from outside, like by a prefill, so it becomes the new buffer
+            self._key_buffer, self._value_buffer = self.key_states, self.value_states
+
+        cache_length = 0 if self.key_states is None else self.key_states.shape[2]
+        new_length = cache_length + key_states.shape[2]
+        if self._key_buffer is None or new_length > self._key_buffer.shape[2]:
+            self._grow_dynamic_cache(key_states, value_states, cache_length, new_length)
+
+        self._key_buffer[:, :, cache_length:new_length] = key_states.to(self._key_buffer.dtype)
+        self._value_buffer[:, :, cache_length:new_length] = value_states.to(self._value_buffer.dtype)
+
+        self.key_states = self._key_view = self._key_buffer[:, :, :new_length]
+        self.value_states = self._value_buffer[:, :, :new_length]
+        return self.key_states, self.value_states
+
+    def _grow_dynamic_cache(self, key_states, value_states, cache_length, new_length):
+        # Double the capacity, so the number of reallocations is logarithmic in the sequence length
+        capacity = new_length
+        if self._key_buffer is not None:
+            capacity = max(new_length, 2 * self._key_buffer.shape[2])
+
+        bsz, num_heads, _, head_dim = key_states.shape
+        key_buffer = key_states.new_empty((bsz, num_heads, capacity, head_dim))
+        value_buffer = value_states.new_empty((bsz, num_heads, capacity, head_dim))
+        if cache_length > 0:
+            key_buffer[:, :, :cache_length] = self.key_states
+            value_buffer[:, :, :cache_length] = self.value_states
+        self._key_buffer, self._value_buffer = key_buffer, value_buffer
 
     @torch.no_grad()
     def _update_cache(self, key_states, value_states, **cache_kwargs):
@@ -323,6 +377,48 @@ class SuryaADETRDecoderSdpaAttention(nn.Module):
 
         return self._update_dynamic_cache(key_states, value_states, **cache_kwargs)
 
+    def _select_cache_rows(self, rows, columns=None):
+        key_states, value_states = self.key_states[rows], self.value_states[rows]
+        if columns is not None:
+            key_states, value_states = key_states[:, :, columns], value_states[:, :, columns]
+        self._replace_dynamic_cache([(key_states, value_states)])
+
+    def _insert_cache_rows(self, key_states, value_states, slots, batch_size):
+        # Static cache - overwrite whole slots, so stale positions from evicted rows are cleared
+        self.key_states[slots] = key_states[:len(slots)].to(self.key_states.dtype)
+        self.value_states[slots] = value_states[:len(slots)].to(self.value_states.dtype)
+
+    def _append_cache_rows(self, key_states, value_states):
+        # Dynamic cache - the shorter cache is padded along the sequence dim, padding is masked out by the caller
+        if self.key_states is None:
+            self.key_states, self.value_states = key_states, value_states
+            return
+        self._replace_dynamic_cache([(self.key_states, self.value_states), (key_states, value_states)])
+
+    def _replace_dynamic_cache(self, parts):
+        # Stack the parts by row into a new buffer with the capacity of the current one, so the next steps write into
+        # its spare capacity instead of growing a buffer that only fits the cache
+        seq_len = max(key_states.shape[2] for key_states, _ in parts)
+        capacity = seq_len
+        if self._key_buffer is not None and self.key_states is self._key_view:
+            capacity = max(capacity, self._key_buffer.shape[2])
+
+        batch_size = sum(key_states.shape[0] for key_states, _ in parts)
+        _, num_heads, _, head_dim = parts[0][0].shape
+        key_buffer = parts[0][0].new_empty((batch_size, num_heads, capacity, head_dim))
+        value_buffer = parts[0][1].new_empty((batch_size, num_heads, capacity, head_dim))
+        start = 0
+        for key_states, value_states in parts:
+            end, length = start + key_states.shape[0], key_states.shape[2]
+            for buffer, states in ((key_buffer, key_states), (value_buffer, value_states)):
+                buffer[start:end, :, :length] = states
+                buffer[start:end, :, length:seq_len] = 0
+            start = end
+
+        self._key_buffer, self._value_buffer = key_buffer, value_buffer
+        self.key_states = self._key_view = key_buffer[:, :, :seq_len]
+        self.value_states = value_buffer[:, :, :seq_len]
+
 
 class SuryaADETRDecoderMlp(nn.Module):
     def __init__(self, config):
@@ -479,6 +575,47 @@ class SuryaADETRDecoderPreTrainedModel(PreTrainedModel):
     def reset_cache(self, batch, device, dtype):
         pass
 
+    def _cache_blocks(self):
+        for layer in getattr(self, "model", self).layers:
+            if layer.temporal_block:
+                yield layer.temporal_block
+            if layer.cross_attn_block:
+                yield layer.cross_attn_block
+
+    def _get_cache(self):
+        return [(block.key_states, block.value_states) for block in self._cache_blocks()]
+
+    def _set_cache(self, cache):
+        for block, (key_states, value_states) in zip(self._cache_blocks(), cache):
+            block.key_states, block.value_states = key_states, value_states
+
+    def _save_cache(self):
+        # The whole cache state, with the buffers backing a dynamic cache, to restore after a separate prefill
+        return [
+            {name: getattr(block, name) for name in _CACHE_STATE if hasattr(block, name)}
+            for block in self._cache_blocks()
+        ]
+
+    def _restore_cache(self, state):
+        for block, block_state in zip(self._cache_blocks(), state):
+            for name, value in block_state.items():
+                setattr(block, name, value)
+
+    def _select_cache_rows(self, rows: torch.Tensor, columns: torch.Tensor | None = None):
+        # Keep only the given batch rows (and optionally self-attention cache columns), used to evict finished sequences
+        for block in self._cache_blocks():
+            block._select_cache_rows(rows, columns)
+
+    def _insert_cache_rows(self, cache, slots: torch.Tensor, batch_size: int):
+        # Copy rows of a separately prefilled cache into free slots of the current static cache
+        for block, (key_states, value_states) in zip(self._cache_blocks(), cache):
+            block._insert_cache_rows(key_states, value_states, slots, batch_size)
+
+    def _append_cache_rows(self, cache):
+        # Append rows of a separately prefilled cache to the current dynamic cache
+        for block, (key_states, value_states) in zip(self._cache_blocks(), cache):
+            block._append_cache_rows(key_states, value_states)
+
     def _tie_weights(self):
         pass
 
@@ -560,7 +697,7 @@ class SuryaADETRDecoderModel(SuryaADETRDecoderPreTrainedModel):
         if cache_position is None:
             cache_position = torch.arange(hidden_states.shape[1], device=hidden_states.device)
         if position_ids is None:
-            position_ids = cache_position.unsqueeze(0)
+            position_ids = cache_position if cache_position.dim() == 2 else cache_position.unsqueeze(0)
 
         causal_mask = self._update_causal_mask(attention_mask, inputs_embeds, cache_position)
 
@@ -596,7 +733,12 @@ class SuryaADETRDecoderModel(SuryaADETRDecoderPreTrainedModel):
     # Ignore copy
     def _update_causal_mask(self, attention_mask, input_tensor, cache_position):
         if not self.causal:
-            return None
+            if attention_mask is None:
+                return None
+            # Only padded cache positions need to be masked out
+            min_dtype = torch.finfo(input_tensor.dtype).min
+            padding_mask = attention_mask[:, None, None, :].eq(0)
+            return torch.zeros(padding_mask.shape, dtype=input_tensor.dtype, device=input_tensor.device).masked_fill(padding_mask, min_dtype)
 
         dtype, device = input_tensor.dtype, input_tensor.device
         min_dtype = torch.finfo(dtype).min
@@ -0,0 +1,157 @@
+from typing import Dict, List, Tuple
+
+import torch
+
+from surya.settings import settings
+
+
+def batch_buckets(max_batch_size: int, min_bucket: int = 1) -> List[int]:
+    # Powers of two from min_bucket, capped by the max batch size, which is always a bucket
+    buckets = []
+    bucket = max(1, min_bucket)
+    while bucket < max_batch_size:
+        buckets.append(bucket)
+        bucket *= 2
+    buckets.append(max_batch_size)
+    return buckets
+
+
+class DecodeStepEngine:
+    """
+    Runs single token decode steps of a decoder wrapping a SuryaADETRDecoderModel, against a static KV cache that is
+    allocated once, for the largest batch size.  Each row of the cache is a batch slot.
+
+    Steps are run for a fixed set of batch size buckets, on the first rows of the cache, so every bucket sees the same
+    shapes and the same tensors on every step.  Each bucket gets its own captured step: compiled with torch.compile,
+    and on CUDA optionally recorded as a CUDA graph and replayed, so a step costs a single launch.
+    """
+    def __init__(
+            self,
+            decoder: torch.nn.Module,
+            max_batch_size: int,
+            encoder_length: int,
+            encoder_hidden_size: int,
+            device: torch.device,
+            dtype: torch.dtype,
+            min_bucket: int = settings.DECODE_MIN_BATCH_BUCKET,
+            compile: bool = True,
+            cuda_graphs: bool = settings.DECODE_CUDA_GRAPHS
+    ):
+        assert decoder.model.static_cache, "The decode engine needs a decoder built with a static cache"
+        self.decoder = decoder
+        self.max_batch_size = max_batch_size
+        self.buckets = batch_buckets(max_batch_size, min_bucket)
+        self.device = torch.device(device)
+        self.cuda_graphs = cuda_graphs and self.device.type == "cuda"
+
+        # Self attention caches are allocated by the model, cross attention caches hold the encoder keys and values
+        decoder.model._setup_cache(decoder.config, max_batch_size, self.device, dtype)
+        self.cache = []
+        self.prefill_buffers: List[Tuple[torch.Tensor, torch.Tensor] | None] = []
+        for block in decoder.model._cache_blocks():
+            # Prefills of admitted rows write their self attention keys and values to separate buffers, and insert_rows
+            # copies them into the free slots, so admitting rows doesn't set up a new cache
+            self.prefill_buffers.append(
+                None if block.key_states is None else (torch.zeros_like(block.key_states), torch.zeros_like(block.value_states))
+            )
+            if block.key_states is None:
+                shape = (max_batch_size, block.num_key_value_heads, encoder_length, block.head_dim)
+                block.key_states = torch.zeros(shape, dtype=dtype, device=self.device)
+                block.value_states = torch.zeros(shape, dtype=dtype, device=self.device)
+            self.cache.append((block.key_states, block.value_states))
+
+        # The encoder hidden states only give the cross attention its shape, the keys and values come from the cache
+        self.encoder_hidden_states = torch.zeros((max_batch_size, encoder_length, encoder_hidden_size), dtype=dtype, device=self.device)
+        self.input_ids = torch.zeros((max_batch_size, 1), dtype=torch.long, device=self.device)
+        self.cache_position = torch.zeros((max_batch_size, 1), dtype=torch.long, device=self.device)
+        self.prefill_length = 0  # Positions of the prefill buffers the last prefill wrote to
+
+        # Views for each bucket are made once, so every step of a bucket passes the same tensors
+        self.bucket_inputs: Dict[int, Tuple] = {
+            bucket: (
+                self.input_ids[:bucket],
+                self.cache_position[:bucket],
+                self.encoder_hidden_states[:bucket],
+                [(key_states[:bucket], value_states[:bucket]) for key_states, value_states in self.cache]
+            )
+            for bucket in self.buckets
+        }
+
+        self.step_fn = self._step
+        if compile:
+            self.step_fn = torch.compile(self._step, dynamic=False)
+        self.graphs: Dict[int, torch.cuda.CUDAGraph] = {}
+        self.graph_outputs: Dict[int, torch.Tensor] = {}
+
+    def _step(self, input_ids, cache_position, encoder_hidden_states, cache):
+        self.decoder.model._set_cache(cache)
+        return_dict = self.decoder(
+            input_ids=input_ids,
+            encoder_hidden_states=encoder_hidden_states,
+            cache_position=cache_position,
+            use_cache=True,
+            prefill=False
+        )
+        return return_dict["logits"][:, -1]
+
+    def bucket(self, batch_size: int) -> int:
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        raise ValueError(f"Batch size {batch_size} is larger than the engine max batch size {self.max_batch_size}")
+
+    def prefill_cache(self, batch_size: int, prefix_length: int) -> List[Tuple[torch.Tensor | None, torch.Tensor | None]]:
+        # The cache for a prefill of batch_size rows, as views into the prefill buffers.  The static cache attends over
+        # all of its positions, so the ones a longer earlier prefix was written to are cleared.  Cross attention caches
+        # start empty, so the prefill computes the encoder keys and values.
+        cache = []
+        for buffers in self.prefill_buffers:
+            if buffers is None:
+                cache.append((None, None))
+                continue
+            for buffer in buffers:
+                buffer[:, :, prefix_length:self.prefill_length].zero_()
+            cache.append((buffers[0][:batch_size], buffers[1][:batch_size]))
+        self.prefill_length = prefix_length
+        return cache
+
+    def insert_rows(self, cache, slots: torch.Tensor):
+        # Copy the rows of a separately prefilled cache into the given slots, overwriting every position
+        for (key_states, value_states), (new_key_states, new_value_states) in zip(self.cache, cache):
+            key_states[slots] = new_key_states[:len(slots)].to(key_states.dtype)
+            value_states[slots] = new_value_states[:len(slots)].to(value_states.dtype)
+
+    @torch.inference_mode()
+    def warmup(self):
+        # Compiles every bucket, and records the CUDA graphs.  The cache is overwritten when rows are inserted.
+        for bucket in self.buckets:
+            inputs = self.bucket_inputs[bucket]
+            if not self.cuda_graphs:
+                self.step_fn(*inputs)
+                continue
+
+            # Graphs are recorded after a few runs on a side stream, as recommended for CUDA graph capture
+            stream = torch.cuda.Stream(device=self.device)
+            stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self.step_fn(*inputs)
+            torch.cuda.current_stream(self.device).wait_stream(stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                self.graph_outputs[bucket] = self.step_fn(*inputs)
+            self.graphs[bucket] = graph
+
+    @torch.inference_mode()
+    def step(self, input_ids: torch.Tensor, cache_position: torch.Tensor, bucket: int) -> torch.Tensor:
+        """
+        Decodes one token for the first `bucket` slots, given their last tokens and cache positions, shape (bucket,).
+        Returns the last position logits, which are overwritten by the next step of the same bucket.
+        """
+        self.input_ids[:bucket, 0].copy_(input_ids[:bucket])
+        self.cache_position[:bucket, 0].copy_(cache_position[:bucket])
+        if bucket in self.graphs:
+            self.graphs[bucket].replay()
+            return self.graph_outputs[bucket]
+        return self.step_fn(*self.bucket_inputs[bucket])
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from surya.settings import settings
+
+
+class ResultCache:
+    """
+    A persistent cache of model results, in an SQLite database shared by every predictor and process.
+
+    Keys are content hashes of the exact input pixels and arguments, prefixed by a namespace that holds the predictor,
+    model checkpoint and revision, and the settings its results depend on.  The settings are read on every key, so
+    changing one on a live predictor doesn't return results computed with its old value.  Entries are evicted least
+    recently used first once the database grows past max_bytes.
+    """
+    def __init__(self, cache_dir: str, namespace: List[Any], setting_names: List[str] | None = None, max_bytes: int = settings.RESULT_CACHE_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite")
+        self.max_bytes = max_bytes
+        self.base_namespace = namespace
+        self.setting_names = setting_names or []
+        self.hits = 0
+        self.misses = 0
+
+        # Predictors are called from worker threads too, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        # The total size is kept up to date on every write, so eviction doesn't have to sum the whole table
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.execute("INSERT OR IGNORE INTO meta SELECT 'total_size', COALESCE(SUM(size), 0) FROM results")
+
+    @property
+    def namespace(self) -> bytes:
+        namespace = [*self.base_namespace, *[(name, getattr(settings, name)) for name in self.setting_names]]
+        return hashlib.blake2b(repr(namespace).encode(), digest_size=16).digest()
+
+    def key(self, *parts) -> bytes:
+        digest = hashlib.blake2b(self.namespace, digest_size=16)
+        for part in parts:
+            if isinstance(part, Image.Image):
+                part = np.asarray(part)
+            if isinstance(part, np.ndarray):
+                digest.update(repr((part.shape, part.dtype.str)).encode())
+                digest.update(np.ascontiguousarray(part).data)
+            else:
+                digest.update(repr(part).encode())
+        return digest.digest()
+
+    def get_many(self, keys: List[bytes]) -> List[Any | None]:
+        found = {}
+        with self.lock:
+            # SQLite limits the number of query parameters, so keys are looked up in chunks
+            for start in range(0, len(keys), 500):
+                chunk = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk).fetchall()
+                found.update(rows)
+                if rows:
+                    self.connection.execute(f"UPDATE results SET accessed = ? WHERE key IN ({placeholders})", [time.time(), *chunk])
+
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return [pickle.loads(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, items: Dict[bytes, Any]):
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, value, len(value), now))
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                total = self._total_size() - self._stored_size(list(items)) + sum(row[2] for row in rows)
+                self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+                total = self._evict(total)
+                self.connection.execute("UPDATE meta SET value = ? WHERE name = 'total_size'", (total,))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _total_size(self) -> int:
+        return self.connection.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _stored_size(self, keys: List[bytes]) -> int:
+        # The entries a put replaces no longer count towards the total
+        size = 0
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            size += self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN ({placeholders})", chunk).fetchone()[0]
+        return size
+
+    def _evict(self, total: int) -> int:
+        if total <= self.max_bytes:
+            return total
+
+        evicted = []
+        cursor = self.connection.execute("SELECT key, size FROM results ORDER BY accessed")
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        cursor.close()
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        return total
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("DELETE FROM results")
+            self.connection.execute("UPDATE meta SET value = 0 WHERE name = 'total_size'")
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
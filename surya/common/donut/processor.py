@@ -1,6 +1,7 @@
-from typing import Dict, Union, Optional, List, Iterable
+from typing import Dict, Union, Optional, List, Iterable, Tuple
 
 import cv2
+import torch
 from torch import TensorType
 from transformers import DonutImageProcessor
 from transformers.image_processing_utils import BatchFeature
@@ -30,46 +31,44 @@ class SuryaEncoderImageProcessor(DonutImageProcessor):
         return resized_image
 
     def process_inner(self, images: List[np.ndarray]):
-        assert images[0].shape[2] == 3 # RGB input images, channel dim last
-
-        if self.do_align_long_axis:
-            # Rotate if the bbox is wider than it is tall
-            images = [SuryaEncoderImageProcessor.align_long_axis(image, size=self.max_size, input_data_format=ChannelDimension.LAST) for image in images]
-
-            # Verify that the image is wider than it is tall
-            for img in images:
-                assert img.shape[1] >= img.shape[0]
-
-        # This also applies the right channel dim format, to channel x height x width
-        images = [SuryaEncoderImageProcessor.numpy_resize(img, self.max_size, self.resample) for img in images]
-        assert images[0].shape[0] == 3 # RGB input images, channel dim first
-
-        # Convert to float32 for rescale/normalize
-        images = [img.astype(np.float32) for img in images]
-
-        # Pads with 255 (whitespace)
-        # Pad to max size to improve performance
-        max_size = self.max_size
-        images = [
-            SuryaEncoderImageProcessor.pad_image(
-                image=image,
-                size=max_size,
-                input_data_format=ChannelDimension.FIRST,
-                pad_value=settings.RECOGNITION_PAD_VALUE
-            )
-            for image in images
-        ]
-
-        # Rescale and normalize
-        for idx in range(len(images)):
-            images[idx] = (images[idx].astype(np.float64) * self.rescale_factor).astype(np.float32)
-
-        images = [
-            SuryaEncoderImageProcessor.normalize(img, mean=self.image_mean, std=self.image_std, input_data_format=ChannelDimension.FIRST)
-            for img in images
-        ]
-
-        return images
+        # One float32 array per image, as views into the batch
+        return list(self.process_batch(images).numpy())
+
+    def normalize_params(self, device=None) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Rescale and normalize folded into one multiply-add per channel, shaped to broadcast over (B, 3, H, W)
+        mean = np.broadcast_to(np.array(self.image_mean, dtype=np.float64), (3,))
+        std = np.broadcast_to(np.array(self.image_std, dtype=np.float64), (3,))
+        scale = torch.tensor(self.rescale_factor / std, dtype=torch.float32, device=device).view(1, 3, 1, 1)
+        offset = torch.tensor(-mean / std, dtype=torch.float32, device=device).view(1, 3, 1, 1)
+        return scale, offset
+
+    def process_batch(self, images: List[np.ndarray], device=None) -> torch.Tensor:
+        """
+        Resizes every image straight into one uint8 (B, H, W, 3) buffer, then rescales, normalizes and moves channels
+        first with a single fused op, writing into a preallocated float32 (B, 3, H, W) tensor.
+        With a device, only the uint8 buffer is copied over, and the float math runs on the device.
+        """
+        assert all(image.shape[2] == 3 for image in images) # RGB input images, channel dim last
+        height, width = self.max_size["height"], self.max_size["width"]
+
+        pixels = np.empty((len(images), height, width, 3), dtype=np.uint8)
+        for idx, image in enumerate(images):
+            if self.do_align_long_axis:
+                # Rotate if the bbox is wider than it is tall
+                image = SuryaEncoderImageProcessor.align_long_axis(image, size=self.max_size, input_data_format=ChannelDimension.LAST)
+                assert image.shape[1] >= image.shape[0]
+
+            # Images are resized to the full size, so they never need padding
+            cv2.resize(image, (width, height), dst=pixels[idx], interpolation=self.resample)
+
+        pixels = torch.from_numpy(pixels)
+        if device is not None:
+            pixels = pixels.to(device, non_blocking=True)
+
+        scale, offset = self.normalize_params(pixels.device)
+        pixel_values = torch.empty((len(images), 3, height, width), dtype=torch.float32, device=pixels.device)
+        torch.addcmul(offset, pixels.permute(0, 3, 1, 2), scale, out=pixel_values)
+        return pixel_values
 
     def preprocess(
         self,
@@ -1,4 +1,7 @@
-from typing import Optional, Any
+import json
+import os
+import shutil
+from typing import Optional, Any, Callable, Dict
 
 import torch
 
@@ -25,4 +28,155 @@ class ModelLoader:
         parts = checkpoint.rsplit("@", 1)
         if len(parts) == 1:
             return parts[0], "main" # Default revision is main
-        return parts[0], parts[1]
\ No newline at end of file
+        return parts[0], parts[1]
+
+    def cache_path(self) -> str | None:
+        if not settings.MODEL_CACHE_DIR:
+            return None
+        revision = getattr(self, "revision", None) or "main"
+        return os.path.join(settings.MODEL_CACHE_DIR, self.checkpoint.replace("/", "--"), revision)
+
+    def load_pretrained(self, model_cls, config: Callable[[Optional[str]], Any], dtype: torch.dtype | str) -> Any:
+        """
+        Loads the pretrained model_cls, given a function that loads its config from the checkpoint, or from a local
+        directory when it is given one.
+
+        With MODEL_CACHE_DIR set, the config and weights are kept in a local cache after the first load, the weights as
+        safetensors.  Later loads build the model on the meta device, and memory map the weights into it, which skips
+        the hub lookups, weight initialization and copies of from_pretrained.
+        """
+        if isinstance(dtype, str):
+            dtype = getattr(torch, dtype)
+
+        path = self.cache_path()
+        if path is not None:
+            model = load_cached_model(model_cls, path, dtype, config)
+            if model is not None:
+                return model
+
+        model = model_cls.from_pretrained(self.checkpoint, config=config(), torch_dtype=dtype, revision=self.revision)
+        if path is not None:
+            save_cached_model(model, path, dtype)
+        return model
+
+    def load_cached_processor(self, processor: Callable[[str], Any]) -> Any:
+        # Processors are cached with save_pretrained too, since loading them also goes through the hub.  processor loads
+        # the processor from the checkpoint, or from the local cache directory.
+        path = self.cache_path()
+        if path is None:
+            return processor(self.checkpoint)
+
+        processor_path = os.path.join(path, "processor")
+        if os.path.isdir(processor_path):
+            try:
+                return processor(processor_path)
+            except Exception as e:
+                print(f"Could not load the processor from the cache at {processor_path}, loading it from the checkpoint: {e}")
+
+        loaded = processor(self.checkpoint)
+        save_atomic(processor_path, loaded.save_pretrained)
+        return loaded
+
+
+def write_atomic(path: str, data: bytes):
+    # Processes loading the same model at once don't see partially written files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def save_atomic(path: str, save: Callable[[str], Any]):
+    # Like write_atomic, for directories written by save_pretrained
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    save(temp_path)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        # Another process saved it first
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def weights_name(dtype: torch.dtype) -> str:
+    return f"model-{str(dtype).removeprefix('torch.')}"
+
+
+def save_cached_model(model: torch.nn.Module, path: str, dtype: torch.dtype):
+    from safetensors.torch import save
+
+    # Every parameter and buffer, including non persistent buffers.  Tied weights are saved once, and tied again on load.
+    tensors: Dict[str, torch.Tensor] = {}
+    aliases: Dict[str, str] = {}
+    saved = {}
+    named_tensors = list(model.named_parameters(remove_duplicate=False)) + list(model.named_buffers(remove_duplicate=False))
+    for name, tensor in named_tensors:
+        if tensor is None:
+            continue
+        tensor_key = (tensor.data_ptr(), tensor.shape, tensor.stride(), tensor.dtype)
+        if tensor_key in saved:
+            aliases[name] = saved[tensor_key]
+            continue
+        saved[tensor_key] = name
+        tensors[name] = tensor.detach().cpu().contiguous()
+
+    name = weights_name(dtype)
+    write_atomic(os.path.join(path, f"{name}.safetensors"), save(tensors, metadata={"aliases": json.dumps(aliases)}))
+    save_atomic(os.path.join(path, f"{name}-config"), model.config.save_pretrained)
+
+
+def load_cached_model(
+        model_cls,
+        path: str,
+        dtype: torch.dtype,
+        config: Optional[Callable[[str], Any]] = None
+) -> torch.nn.Module | None:
+    from safetensors import safe_open
+    from safetensors.torch import load_file
+
+    name = weights_name(dtype)
+    weights_path = os.path.join(path, f"{name}.safetensors")
+    config_path = os.path.join(path, f"{name}-config")
+    if not (os.path.exists(weights_path) and os.path.isdir(config_path)):
+        return None
+
+    if config is None:
+        config = model_cls.config_class.from_pretrained
+
+    try:
+        model_config = config(config_path)
+        with safe_open(weights_path, framework="pt") as f:
+            aliases = json.loads(f.metadata()["aliases"])
+        tensors = load_file(weights_path, device="cpu")
+
+        # Every tensor the model registers is made on the meta device, so nothing is allocated or initialized
+        with torch.device("meta"):
+            model = model_cls(model_config)
+
+        assigned = {tensor_name: assign_tensor(model, tensor_name, tensor) for tensor_name, tensor in tensors.items()}
+        for alias, tensor_name in aliases.items():
+            assign_tensor(model, alias, assigned[tensor_name])
+
+        if any(tensor.is_meta for tensor in list(model.parameters()) + list(model.buffers())):
+            # The model has tensors the cache doesn't, so it was saved from a different version of the model
+            return None
+    except Exception as e:
+        print(f"Could not load {model_cls.__name__} from the weight cache at {path}, loading it from the checkpoint: {e}")
+        return None
+    return model
+
+
+def assign_tensor(model: torch.nn.Module, name: str, tensor: torch.Tensor) -> torch.Tensor:
+    # Replaces a meta tensor of the model, keeping whether it is a parameter or a buffer
+    module_name, _, attr = name.rpartition(".")
+    module = model.get_submodule(module_name)
+    if attr in module._parameters:
+        if not isinstance(tensor, torch.nn.Parameter):
+            tensor = torch.nn.Parameter(tensor, requires_grad=False)
+        module._parameters[attr] = tensor
+    elif attr in module._buffers:
+        module._buffers[attr] = tensor
+    else:
+        raise KeyError(f"The model has no tensor {name}")
+    return tensor
@@ -1,8 +1,8 @@
 import copy
-from typing import List, Optional
+from typing import Any, ClassVar, Dict, List, Optional, Type
 
 import numpy as np
-from pydantic import BaseModel, field_validator, computed_field
+from pydantic import BaseModel, PrivateAttr, field_validator, computed_field
 import numbers
 
 
@@ -131,4 +131,176 @@ class PolygonBox(BaseModel):
                 corner[0] += x_shift
         if y_shift is not None:
             for corner in self.polygon:
-                corner[1] += y_shift
\ No newline at end of file
+                corner[1] += y_shift
+
+def object_column(values) -> np.ndarray:
+    # Fill element by element, so nested values like lists or dicts aren't turned into extra dimensions
+    column = np.empty(len(values), dtype=object)
+    for idx, value in enumerate(values):
+        column[idx] = value
+    return column
+
+
+class PolygonBatch:
+    """
+    Columnar storage for many polygons, as an (N, 4, 2) array plus per-item confidence, label and text columns.
+    Geometry operations are vectorized over the whole batch, and indexing builds PolygonBox views on demand.
+    """
+    def __init__(
+            self,
+            polygons,
+            confidences=None,
+            labels: List[str] | None = None,
+            texts: List[str] | None = None,
+            item_cls: Type[PolygonBox] = PolygonBox,
+            item_fields: Dict[str, List[Any]] | None = None
+    ):
+        polygons = np.asarray(polygons)
+        if not np.issubdtype(polygons.dtype, np.integer):
+            polygons = polygons.astype(np.float64)
+        # Integer coordinates stay integers, so they convert back to int lists like PolygonBox does
+        self.polygons = polygons.reshape(-1, 4, 2)
+        self.confidences = None if confidences is None else np.asarray(confidences, dtype=np.float64)
+        self.labels = None if labels is None else np.asarray(labels, dtype=object)
+        self.texts = None if texts is None else np.asarray(texts, dtype=object)
+        self.item_cls = item_cls
+        self.item_fields = {} if item_fields is None else {k: object_column(v) for k, v in item_fields.items()}
+
+    @classmethod
+    def from_boxes(cls, boxes: List[PolygonBox], item_fields: List[str] | None = None) -> "PolygonBatch":
+        item_cls = type(boxes[0]) if len(boxes) > 0 else PolygonBox
+        confidences = None
+        if any(box.confidence is not None for box in boxes):
+            confidences = [np.nan if box.confidence is None else box.confidence for box in boxes]
+        labels = [box.label for box in boxes] if "label" in item_cls.model_fields else None
+        texts = [box.text for box in boxes] if "text" in item_cls.model_fields else None
+        fields = {name: [getattr(box, name) for box in boxes] for name in (item_fields or [])}
+        return cls(
+            [box.polygon for box in boxes],
+            confidences=confidences,
+            labels=labels,
+            texts=texts,
+            item_cls=item_cls,
+            item_fields=fields
+        )
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return self.item(int(idx))
+
+        # Slices, masks and index arrays select a sub-batch
+        return PolygonBatch(
+            self.polygons[idx],
+            confidences=None if self.confidences is None else self.confidences[idx],
+            labels=None if self.labels is None else self.labels[idx],
+            texts=None if self.texts is None else self.texts[idx],
+            item_cls=self.item_cls,
+            item_fields={k: v[idx] for k, v in self.item_fields.items()}
+        )
+
+    def item(self, idx: int) -> PolygonBox:
+        values = {"polygon": self.polygons[idx].tolist()}
+        if self.confidences is not None and not np.isnan(self.confidences[idx]):
+            values["confidence"] = float(self.confidences[idx])
+        if self.labels is not None:
+            values["label"] = self.labels[idx]
+        if self.texts is not None:
+            values["text"] = self.texts[idx]
+        values.update({k: v[idx] for k, v in self.item_fields.items()})
+        # The columns are already validated, so skip pydantic validation
+        return self.item_cls.model_construct(**values)
+
+    def to_boxes(self) -> List[PolygonBox]:
+        return [self.item(idx) for idx in range(len(self))]
+
+    def copy(self) -> "PolygonBatch":
+        # The geometry operations replace the polygon array, so the columns can be shared
+        return PolygonBatch(
+            self.polygons.copy(),
+            confidences=self.confidences,
+            labels=self.labels,
+            texts=self.texts,
+            item_cls=self.item_cls,
+            item_fields=self.item_fields
+        )
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        return np.concatenate([self.polygons.min(axis=1), self.polygons.max(axis=1)], axis=1)
+
+    @property
+    def widths(self) -> np.ndarray:
+        bboxes = self.bboxes
+        return bboxes[:, 2] - bboxes[:, 0]
+
+    @property
+    def heights(self) -> np.ndarray:
+        bboxes = self.bboxes
+        return bboxes[:, 3] - bboxes[:, 1]
+
+    @property
+    def areas(self) -> np.ndarray:
+        return self.widths * self.heights
+
+    def rescale(self, processor_size, image_size) -> "PolygonBatch":
+        page_width, page_height = processor_size
+        img_width, img_height = image_size
+        scaler = np.array([img_width / page_width, img_height / page_height])
+        # Truncate like int(), to match PolygonBox.rescale
+        self.polygons = np.trunc(self.polygons * scaler).astype(np.int64)
+        return self
+
+    def fit_to_bounds(self, bounds) -> "PolygonBatch":
+        self.polygons = np.clip(self.polygons, [bounds[0], bounds[1]], [bounds[2], bounds[3]])
+        return self
+
+    def shift(self, x_shift: float | None = None, y_shift: float | None = None) -> "PolygonBatch":
+        self.polygons = self.polygons + [x_shift or 0, y_shift or 0]
+        return self
+
+    def intersection_area(self, other: "PolygonBatch", x_margin=0, y_margin=0) -> np.ndarray:
+        # Pairwise bbox intersection areas, with shape (len(self), len(other))
+        boxes, other_boxes = self.bboxes[:, None], other.bboxes[None]
+        x_overlap = np.minimum(boxes[..., 2], other_boxes[..., 2]) - np.maximum(boxes[..., 0], other_boxes[..., 0]) + 2 * x_margin
+        y_overlap = np.minimum(boxes[..., 3], other_boxes[..., 3]) - np.maximum(boxes[..., 1], other_boxes[..., 1]) + 2 * y_margin
+        return np.maximum(x_overlap, 0) * np.maximum(y_overlap, 0)
+
+    def intersection_pct(self, other: "PolygonBatch") -> np.ndarray:
+        # Pairwise fraction of each box in self covered by each box in other, 0 for empty boxes
+        areas = self.areas[:, None]
+        intersection = self.intersection_area(other)
+        return np.divide(intersection, areas, out=np.zeros_like(intersection), where=areas > 0)
+
+
+class PolygonBatchResult(BaseModel):
+    """
+    A result that holds a list of boxes, with a polygon_batch built from them once and reused.  The batch is rebuilt
+    when the list is reassigned or boxes are added, removed or replaced in it.  Boxes edited in place, like with
+    PolygonBox.shift, need reset_polygon_batch.
+    """
+    batch_field: ClassVar[str] = "bboxes"
+    batch_item_fields: ClassVar[List[str] | None] = None
+    _polygon_batch: tuple | None = PrivateAttr(default=None)
+
+    @property
+    def polygon_batch(self) -> PolygonBatch:
+        boxes = getattr(self, self.batch_field)
+        if self._polygon_batch is not None:
+            cached_boxes, batch = self._polygon_batch
+            if len(cached_boxes) == len(boxes) and all(cached is box for cached, box in zip(cached_boxes, boxes)):
+                # Callers can rescale or shift the batch they get without changing the cached one
+                return batch.copy()
+
+        batch = PolygonBatch.from_boxes(boxes, item_fields=self.batch_item_fields)
+        self._polygon_batch = (list(boxes), batch)
+        return batch.copy()
+
+    def reset_polygon_batch(self):
+        self._polygon_batch = None
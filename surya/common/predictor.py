@@ -1,6 +1,7 @@
-from typing import Optional
+from typing import Any, Callable, List, Optional
 import torch
 
+from surya.common.cache import ResultCache
 from surya.common.load import ModelLoader
 from surya.settings import settings
 
@@ -13,6 +14,8 @@ class BasePredictor:
         "mps": 1,
         "cuda": 1
     }
+    cache_settings: List[str] = []  # Settings the results depend on, part of the result cache keys
+    result_cache: ResultCache | None = None
 
     def __init__(self, checkpoint: Optional[str] = None, device: torch.device | str | None = settings.TORCH_DEVICE_MODEL, dtype: Optional[torch.dtype | str] = settings.MODEL_DTYPE):
         self.model = None
@@ -22,6 +25,15 @@ class BasePredictor:
         self.model = loader.model(device, dtype)
         self.processor = loader.processor()
 
+        if settings.RESULT_CACHE_DIR:
+            namespace = [
+                type(self).__name__,
+                loader.checkpoint,
+                getattr(loader, "revision", None),
+                str(self.model.dtype),
+            ]
+            self.result_cache = ResultCache(settings.RESULT_CACHE_DIR, namespace, self.cache_settings)
+
     def to(self, device_dtype: torch.device | str | None = None):
         if self.model:
             self.model.to(device_dtype)
@@ -36,5 +48,19 @@ class BasePredictor:
                 batch_size = self.default_batch_sizes[settings.TORCH_DEVICE_MODEL]
         return batch_size
 
+    def cached_call(self, images: List[Any], key_args: List[Any], compute: Callable[[List[Any]], List[Any]]) -> List[Any]:
+        # Page results already in the result cache are read from it, and only the other pages are computed
+        if self.result_cache is None:
+            return compute(images)
+
+        keys = [self.result_cache.key(image, *key_args) for image in images]
+        results = self.result_cache.get_many(keys)
+        pending = [idx for idx, result in enumerate(results) if result is None]
+        if pending:
+            for idx, result in zip(pending, compute([images[idx] for idx in pending])):
+                results[idx] = result
+            self.result_cache.put_many({keys[idx]: results[idx] for idx in pending})
+        return results
+
     def __call__(self, *args, **kwargs):
         raise NotImplementedError()
\ No newline at end of file
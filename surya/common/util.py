@@ -1,25 +1,80 @@
 import copy
-from typing import List
+import math
+from collections import defaultdict
+from typing import List, Sequence
+
+import numpy as np
 
 from surya.common.polygon import PolygonBox
 
 
+class GridIndex:
+    """
+    Uniform grid over bboxes, to find the boxes that may overlap a query without comparing every pair.
+    Boxes that would cover too many cells are kept aside, and returned as candidates for every query.
+    """
+    max_cells_per_box = 64
+
+    def __init__(self, bboxes: Sequence[Sequence[float]], cell_size: float | None = None):
+        if cell_size is None:
+            # Typical box size, so most boxes fall into a handful of cells
+            sizes = [max(b[2] - b[0], b[3] - b[1]) for b in bboxes]
+            cell_size = float(np.median(sizes)) if len(sizes) > 0 else 1
+        self.cell_size = max(cell_size, 1)
+        self.cells = defaultdict(list)
+        self.large = []
+        for idx, bbox in enumerate(bboxes):
+            self.insert(idx, bbox)
+
+    def _cell_range(self, bbox, margin=0):
+        x_start, y_start = math.floor((bbox[0] - margin) / self.cell_size), math.floor((bbox[1] - margin) / self.cell_size)
+        x_end, y_end = math.floor((bbox[2] + margin) / self.cell_size), math.floor((bbox[3] + margin) / self.cell_size)
+        return x_start, y_start, x_end, y_end
+
+    def insert(self, idx: int, bbox: Sequence[float]):
+        # Boxes can be inserted again after growing, stale cells only add candidates
+        x_start, y_start, x_end, y_end = self._cell_range(bbox)
+        if (x_end - x_start + 1) * (y_end - y_start + 1) > self.max_cells_per_box:
+            self.large.append(idx)
+            return
+
+        for cell_x in range(x_start, x_end + 1):
+            for cell_y in range(y_start, y_end + 1):
+                self.cells[(cell_x, cell_y)].append(idx)
+
+    def query(self, bbox: Sequence[float], margin: float = 0) -> List[int]:
+        # Indices of boxes whose cells touch the bbox expanded by margin, in ascending order
+        x_start, y_start, x_end, y_end = self._cell_range(bbox, margin)
+        candidates = set(self.large)
+        if (x_end - x_start + 1) * (y_end - y_start + 1) > len(self.cells):
+            for (cell_x, cell_y), idxs in self.cells.items():
+                if x_start <= cell_x <= x_end and y_start <= cell_y <= y_end:
+                    candidates.update(idxs)
+        else:
+            for cell_x in range(x_start, x_end + 1):
+                for cell_y in range(y_start, y_end + 1):
+                    candidates.update(self.cells.get((cell_x, cell_y), []))
+        return sorted(candidates)
+
+
 def clean_boxes(boxes: List[PolygonBox]) -> List[PolygonBox]:
+    if len(boxes) == 0:
+        return []
+
+    polygons = np.array([box_obj.polygon for box_obj in boxes], dtype=np.float64)
+    bboxes = np.concatenate([polygons.min(axis=1), polygons.max(axis=1)], axis=1).tolist()
+    index = GridIndex(bboxes)
+
     new_boxes = []
-    for box_obj in boxes:
-        xs = [point[0] for point in box_obj.polygon]
-        ys = [point[1] for point in box_obj.polygon]
-        if max(xs) == min(xs) or max(ys) == min(ys):
+    for box_obj, box in zip(boxes, bboxes):
+        if box[2] == box[0] or box[3] == box[1]:
             continue
 
-        box = box_obj.bbox
+        # Any box containing this one also contains its top left corner
         contained = False
-        for other_box_obj in boxes:
-            if other_box_obj.polygon == box_obj.polygon:
-                continue
-
-            other_box = other_box_obj.bbox
-            if box == other_box:
+        for other_idx in index.query([box[0], box[1], box[0], box[1]]):
+            other_box = bboxes[other_idx]
+            if box == other_box or boxes[other_idx].polygon == box_obj.polygon:
                 continue
             if box[0] >= other_box[0] and box[1] >= other_box[1] and box[2] <= other_box[2] and box[3] <= other_box[3]:
                 contained = True
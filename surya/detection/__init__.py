@@ -1,4 +1,6 @@
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Generator, Tuple
 
 import numpy as np
@@ -11,12 +13,12 @@ from tqdm import tqdm
 from surya.common.predictor import BasePredictor
 
 from surya.detection.loader import DetectionModelLoader
-from surya.detection.parallel import FakeExecutor
+from surya.detection.parallel import FakeExecutor, SharedArrays
 from surya.detection.processor import SegformerImageProcessor
 from surya.detection.util import get_total_splits, split_image
 from surya.detection.schema import TextDetectionResult
 from surya.settings import settings
-from surya.detection.heatmap import parallel_get_lines
+from surya.detection.heatmap import build_detection_result, get_map_images, parallel_get_lines, shared_get_lines
 
 
 class DetectionPredictor(BasePredictor):
@@ -27,14 +29,20 @@ class DetectionPredictor(BasePredictor):
         "mps": 8,
         "cuda": 36
     }
+    process_pool = None
+    process_pool_finalizer = None
 
     def __call__(self, images: List[Image.Image], batch_size=None, include_maps=False) -> List[TextDetectionResult]:
         detection_generator = self.batch_detection(images, batch_size=batch_size, static_cache=settings.DETECTOR_STATIC_CACHE)
 
-        postprocessing_futures = []
         max_workers = min(settings.DETECTOR_POSTPROCESSING_CPU_WORKERS, len(images))
         parallelize = not settings.IN_STREAMLIT and len(images) >= settings.DETECTOR_MIN_PARALLEL_THRESH
-        executor = ThreadPoolExecutor if parallelize else FakeExecutor
+        backend = settings.DETECTOR_POSTPROCESSING_BACKEND if parallelize else "fake"
+        if backend == "process":
+            return self.process_postprocessing(detection_generator, include_maps)
+
+        postprocessing_futures = []
+        executor = ThreadPoolExecutor if backend == "thread" else FakeExecutor
         with executor(max_workers=max_workers) as e:
             for preds, orig_sizes in detection_generator:
                 for pred, orig_size in zip(preds, orig_sizes):
@@ -42,6 +50,42 @@ class DetectionPredictor(BasePredictor):
 
         return [future.result() for future in postprocessing_futures]
 
+    def get_process_pool(self) -> ProcessPoolExecutor:
+        # Kept alive across calls, since spawning workers is slow
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=settings.DETECTOR_POSTPROCESSING_CPU_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            # Workers are shut down along with the predictor, or at exit, if close isn't called
+            self.process_pool_finalizer = weakref.finalize(self, self.process_pool.shutdown, wait=False, cancel_futures=True)
+        return self.process_pool
+
+    def close(self):
+        # Shuts down the postprocessing worker processes.  They are started again if the predictor is used afterwards.
+        if self.process_pool is not None:
+            self.process_pool_finalizer.detach()
+            self.process_pool.shutdown(cancel_futures=True)
+            self.process_pool = None
+            self.process_pool_finalizer = None
+
+    def process_postprocessing(self, detection_generator, include_maps=False) -> List[TextDetectionResult]:
+        # Heatmaps go to the worker processes through shared memory, and the lines come back as compact arrays
+        pool = self.get_process_pool()
+        pending = []
+        try:
+            for preds, orig_sizes in detection_generator:
+                for pred, orig_size in zip(preds, orig_sizes):
+                    maps = get_map_images(pred) if include_maps else (None, None)
+                    shared = SharedArrays(pred)
+                    pending.append((pool.submit(shared_get_lines, shared.spec, orig_size), shared, orig_size, maps))
+
+            return [build_detection_result(future.result(), orig_size, *maps) for future, _, orig_size, maps in pending]
+        finally:
+            for future, shared, _, _ in pending:
+                future.cancel()
+                shared.release()
+
     def pad_to_batch_size(self, tensor, batch_size):
         current_batch_size = tensor.shape[0]
         if current_batch_size >= batch_size:
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Tuple
 
 import cv2
 import numpy as np
@@ -6,8 +6,9 @@ from PIL import Image
 
 from surya.common.util import clean_boxes
 from surya.detection.affinity import get_vertical_lines
-from surya.detection import TextDetectionResult
-from surya.common.polygon import PolygonBox
+from surya.detection.parallel import attach_shared_arrays
+from surya.detection.schema import ColumnLine, TextDetectionResult
+from surya.common.polygon import PolygonBatch, PolygonBox
 from surya.settings import settings
 
 
@@ -24,6 +25,63 @@ def get_dynamic_thresholds(linemap, text_threshold, low_text, typical_top10_avg=
     return text_threshold, low_text
 
 
+def get_component_box(labels, stats, k, img_w, img_h):
+    # Dilates a single component and fits a min area rect to its pixels
+    x, y, w, h = stats[k, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]]
+
+    try:
+        niter = int(np.sqrt(min(w, h)))
+    except ValueError:
+        niter = 0
+
+    buffer = 1
+    sx, sy = max(0, x - niter - buffer), max(0, y - niter - buffer)
+    ex, ey = min(img_w, x + w + niter + buffer), min(img_h, y + h + niter + buffer)
+
+    mask = (labels[sy:ey, sx:ex] == k)
+    segmap = mask.astype(np.uint8)
+
+    ksize = buffer + niter
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize, ksize))
+    selected_segmap = cv2.dilate(segmap, kernel)
+
+    # make box
+    y_inds, x_inds = np.nonzero(selected_segmap)
+    x_inds += sx
+    y_inds += sy
+    np_contours = np.column_stack((x_inds, y_inds))
+    rectangle = cv2.minAreaRect(np_contours)
+    box = cv2.boxPoints(rectangle)
+    bounds = (np_contours[:, 0].min(), np_contours[:, 1].min(), np_contours[:, 0].max(), np_contours[:, 1].max())
+    return box, bounds
+
+
+def get_component_rows(labels, label_count):
+    # For every row of every component, the leftmost and rightmost pixel, grouped by component
+    img_h, img_w = labels.shape
+    foreground = labels != 0
+    run_starts = np.ones(labels.shape, dtype=bool)
+    run_starts[:, 1:] = labels[:, 1:] != labels[:, :-1]
+    run_ends = np.ones(labels.shape, dtype=bool)
+    run_ends[:, :-1] = labels[:, :-1] != labels[:, 1:]
+    run_starts = np.flatnonzero(run_starts & foreground)
+    run_ends = np.flatnonzero(run_ends & foreground)
+
+    # Runs are in raster order, so a stable sort keeps them left to right within a component row
+    run_labels = labels.ravel()[run_starts]
+    row_keys = run_labels.astype(np.int64) * img_h + run_starts // img_w
+    order = np.argsort(row_keys, kind="stable")
+    row_keys, run_starts, run_ends = row_keys[order], run_starts[order], run_ends[order]
+
+    first = np.flatnonzero(np.r_[True, row_keys[1:] != row_keys[:-1]])
+    last = np.r_[first[1:], len(row_keys)] - 1
+    row_y = row_keys[first] % img_h
+    row_left = run_starts[first] % img_w
+    row_right = run_ends[last] % img_w
+    component_row_starts = np.searchsorted(row_keys[first] // img_h, np.arange(label_count + 1))
+    return row_y, row_left, row_right, component_row_starts
+
+
 def detect_boxes(linemap, text_threshold, low_text):
     # From CRAFT - https://github.com/clovaai/CRAFT-pytorch
     # Modified to return boxes and for speed, accuracy
@@ -34,69 +92,65 @@ def detect_boxes(linemap, text_threshold, low_text):
     text_score_comb = (linemap > low_text).astype(np.uint8)
     label_count, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb, connectivity=4)
 
-    det = []
-    confidences = []
-    max_confidence = 0
-
-    for k in range(1, label_count):
-        # size filtering
-        size = stats[k, cv2.CC_STAT_AREA]
-        if size < 10:
-            continue
-
-        # make segmentation map
-        x, y, w, h = stats[k, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]]
-
-        try:
-            niter = int(np.sqrt(min(w, h)))
-        except ValueError:
-            niter = 0
-
-        buffer = 1
-        sx, sy = max(0, x - niter - buffer), max(0, y - niter - buffer)
-        ex, ey = min(img_w, x + w + niter + buffer), min(img_h, y + h + niter + buffer)
-
-        mask = (labels[sy:ey, sx:ex] == k)
-        line_max = np.max(linemap[sy:ey, sx:ex][mask])
-
-        # thresholding
-        if line_max < text_threshold:
-            continue
-
-        segmap = mask.astype(np.uint8)
-
-        ksize = buffer + niter
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize, ksize))
-        selected_segmap = cv2.dilate(segmap, kernel)
-
-        # make box
-        y_inds, x_inds = np.nonzero(selected_segmap)
-        x_inds += sx
-        y_inds += sy
-        np_contours = np.column_stack((x_inds, y_inds))
-        rectangle = cv2.minAreaRect(np_contours)
-        box = cv2.boxPoints(rectangle)
-
-        # align diamond-shape
-        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
-        box_ratio = max(w, h) / (min(w, h) + 1e-5)
-        if abs(1 - box_ratio) <= 0.1:
-            l, r = np_contours[:, 0].min(), np_contours[:, 0].max()
-            t, b = np_contours[:, 1].min(), np_contours[:, 1].max()
-            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
-
-        # make clock-wise order
-        startidx = box.sum(axis=1).argmin()
-        box = np.roll(box, 4 - startidx, 0)
-
-        max_confidence = max(max_confidence, line_max)
-
-        confidences.append(line_max)
-        det.append(box)
-
-    if max_confidence > 0:
-        confidences = [c / max_confidence for c in confidences]
-    return det, confidences
+    foreground = labels != 0
+    component_max = np.zeros(label_count, dtype=linemap.dtype)
+    np.maximum.at(component_max, labels[foreground], linemap[foreground])
+
+    # size and confidence filtering
+    selected = (stats[:, cv2.CC_STAT_AREA] >= 10) & (component_max >= text_threshold)
+    selected[0] = False
+    selected = np.flatnonzero(selected)
+    if len(selected) == 0:
+        return [], []
+
+    x, y = stats[selected, cv2.CC_STAT_LEFT], stats[selected, cv2.CC_STAT_TOP]
+    w, h = stats[selected, cv2.CC_STAT_WIDTH], stats[selected, cv2.CC_STAT_HEIGHT]
+
+    # The rect dilation kernel grows a component by lo pixels up/left, and hi pixels down/right
+    ksize = np.sqrt(np.minimum(w, h)).astype(np.int64) + 1
+    hi = ksize // 2
+    lo = ksize - 1 - hi
+    bounds = np.stack([x - lo, y - lo, x + w - 1 + hi, y + h - 1 + hi], axis=1)
+
+    # The dilated pixels have the same convex hull as the dilated row extremes, so those are enough for minAreaRect
+    # Dilations clipped by the image edge don't, and use the full pixel contour instead
+    clipped = (bounds[:, 0] < 0) | (bounds[:, 1] < 0) | (bounds[:, 2] >= img_w) | (bounds[:, 3] >= img_h)
+
+    row_y, row_left, row_right, component_row_starts = get_component_rows(labels, label_count)
+    row_component = np.repeat(np.arange(label_count), np.diff(component_row_starts))
+    selected_idx = np.full(label_count, -1, dtype=np.int64)
+    selected_idx[selected] = np.arange(len(selected))
+    row_lo, row_hi = lo[selected_idx[row_component]], hi[selected_idx[row_component]]
+    row_points = np.stack([
+        np.stack([row_left - row_lo, row_y - row_lo], axis=-1),
+        np.stack([row_left - row_lo, row_y + row_hi], axis=-1),
+        np.stack([row_right + row_hi, row_y - row_lo], axis=-1),
+        np.stack([row_right + row_hi, row_y + row_hi], axis=-1),
+    ], axis=1)
+
+    boxes = np.empty((len(selected), 4, 2), dtype=np.float32)
+    for idx, k in enumerate(selected):
+        if clipped[idx]:
+            boxes[idx], bounds[idx] = get_component_box(labels, stats, k, img_w, img_h)
+        else:
+            points = row_points[component_row_starts[k]:component_row_starts[k + 1]].reshape(-1, 2)
+            boxes[idx] = cv2.boxPoints(cv2.minAreaRect(points))
+
+    # align diamond-shape
+    box_w = np.linalg.norm(boxes[:, 0] - boxes[:, 1], axis=-1)
+    box_h = np.linalg.norm(boxes[:, 1] - boxes[:, 2], axis=-1)
+    box_ratio = np.maximum(box_w, box_h) / (np.minimum(box_w, box_h) + 1e-5)
+    diamond = np.abs(1 - box_ratio) <= 0.1
+    l, t, r, b = bounds[diamond].T
+    boxes[diamond] = np.stack([np.stack([l, t], -1), np.stack([r, t], -1), np.stack([r, b], -1), np.stack([l, b], -1)], axis=1)
+
+    # make clock-wise order
+    startidx = boxes.sum(axis=2).argmin(axis=1)
+    boxes = boxes[np.arange(len(boxes))[:, None], (np.arange(4)[None, :] + startidx[:, None]) % 4]
+
+    confidences = component_max[selected]
+    confidences = list(confidences / confidences.max())
+    return list(boxes), confidences
 
 
 def get_detected_boxes(textmap, text_threshold=None, low_text=None) -> List[PolygonBox]:
@@ -114,24 +168,42 @@ def get_detected_boxes(textmap, text_threshold=None, low_text=None) -> List[Poly
 
 
 def get_and_clean_boxes(textmap, processor_size, image_size, text_threshold=None, low_text=None) -> List[PolygonBox]:
-    bboxes = get_detected_boxes(textmap, text_threshold, low_text)
-    for bbox in bboxes:
-        bbox.rescale(processor_size, image_size)
-        bbox.fit_to_bounds([0, 0, image_size[0], image_size[1]])
+    if text_threshold is None:
+        text_threshold = settings.DETECTOR_TEXT_THRESHOLD
+    if low_text is None:
+        low_text = settings.DETECTOR_BLANK_THRESHOLD
+
+    if textmap.dtype != np.float32:
+        textmap = textmap.astype(np.float32)
+
+    boxes, confidences = detect_boxes(textmap, text_threshold, low_text)
+    batch = PolygonBatch(boxes, confidences=confidences)
+    batch.rescale(processor_size, image_size).fit_to_bounds([0, 0, image_size[0], image_size[1]])
 
-    bboxes = clean_boxes(bboxes)
+    bboxes = clean_boxes(batch.to_boxes())
     return bboxes
 
-def parallel_get_lines(preds, orig_sizes, include_maps=False):
+def get_map_images(preds):
+    heatmap, affinity_map = preds
+    heat_img = Image.fromarray((heatmap * 255).astype(np.uint8))
+    aff_img = Image.fromarray((affinity_map * 255).astype(np.uint8))
+    return heat_img, aff_img
+
+
+def get_lines(preds, orig_sizes) -> Tuple[List[PolygonBox], List[ColumnLine]]:
     heatmap, affinity_map = preds
-    heat_img, aff_img = None, None
-    if include_maps:
-        heat_img = Image.fromarray((heatmap * 255).astype(np.uint8))
-        aff_img = Image.fromarray((affinity_map * 255).astype(np.uint8))
     affinity_size = list(reversed(affinity_map.shape))
     heatmap_size = list(reversed(heatmap.shape))
     bboxes = get_and_clean_boxes(heatmap, heatmap_size, orig_sizes)
     vertical_lines = get_vertical_lines(affinity_map, affinity_size, orig_sizes)
+    return bboxes, vertical_lines
+
+
+def parallel_get_lines(preds, orig_sizes, include_maps=False):
+    heat_img, aff_img = None, None
+    if include_maps:
+        heat_img, aff_img = get_map_images(preds)
+    bboxes, vertical_lines = get_lines(preds, orig_sizes)
 
     result = TextDetectionResult(
         bboxes=bboxes,
@@ -140,4 +212,35 @@ def parallel_get_lines(preds, orig_sizes, include_maps=False):
         affinity_map=aff_img,
         image_bbox=[0, 0, orig_sizes[0], orig_sizes[1]]
     )
-    return result
\ No newline at end of file
+    return result
+
+
+def shared_get_lines(shared_spec, orig_sizes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Runs in a worker process, reading the heatmaps from shared memory, and returns compact arrays instead of objects
+    shm, preds = attach_shared_arrays(shared_spec)
+    try:
+        bboxes, vertical_lines = get_lines(preds, orig_sizes)
+    finally:
+        del preds
+        shm.close()
+
+    batch = PolygonBatch.from_boxes(bboxes)
+    line_polygons = np.array([line.polygon for line in vertical_lines], dtype=np.float64).reshape(-1, 4, 2)
+    line_flags = np.array([[line.vertical, line.horizontal] for line in vertical_lines], dtype=bool).reshape(-1, 2)
+    return batch.polygons, batch.confidences, line_polygons, line_flags
+
+
+def build_detection_result(compact_lines, orig_sizes, heat_img=None, aff_img=None) -> TextDetectionResult:
+    polygons, confidences, line_polygons, line_flags = compact_lines
+    bboxes = PolygonBatch(polygons, confidences=confidences).to_boxes()
+    vertical_lines = [
+        ColumnLine(polygon=polygon, vertical=vertical, horizontal=horizontal)
+        for polygon, (vertical, horizontal) in zip(line_polygons.tolist(), line_flags.tolist())
+    ]
+    return TextDetectionResult(
+        bboxes=bboxes,
+        vertical_lines=vertical_lines,
+        heatmap=heat_img,
+        affinity_map=aff_img,
+        image_bbox=[0, 0, orig_sizes[0], orig_sizes[1]]
+    )
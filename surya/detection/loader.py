@@ -29,13 +29,7 @@ class DetectionModelLoader(ModelLoader):
         if dtype is None:
             dtype = settings.MODEL_DTYPE
 
-        config = EfficientViTConfig.from_pretrained(self.checkpoint, revision=self.revision)
-        model = EfficientViTForSemanticSegmentation.from_pretrained(
-            self.checkpoint,
-            torch_dtype=dtype,
-            config=config,
-            revision=self.revision
-        )
+        model = self.load_pretrained(EfficientViTForSemanticSegmentation, self.config, dtype)
         model = model.to(device)
         model = model.eval()
 
@@ -50,5 +44,8 @@ class DetectionModelLoader(ModelLoader):
         print(f"Loaded detection model {self.checkpoint} on device {device} with dtype {dtype}")
         return model
 
+    def config(self, path: Optional[str] = None) -> EfficientViTConfig:
+        return EfficientViTConfig.from_pretrained(path or self.checkpoint, revision=self.revision)
+
     def processor(self) -> SegformerImageProcessor:
-        return SegformerImageProcessor.from_pretrained(self.checkpoint, revision=self.revision)
\ No newline at end of file
+        return self.load_cached_processor(lambda path: SegformerImageProcessor.from_pretrained(path, revision=self.revision))
\ No newline at end of file
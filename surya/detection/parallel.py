@@ -1,3 +1,9 @@
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+
 class FakeFuture:
     def __init__(self, func, *args, **kwargs):
         self._result = func(*args, **kwargs)
@@ -17,3 +23,39 @@ class FakeExecutor:
 
     def submit(self, fn, *args, **kwargs):
         return FakeFuture(fn, *args, **kwargs)
+
+
+class SharedArrays:
+    """
+    Float32 arrays packed into one shared memory block, so worker processes can read them without a pickled copy.
+    The block is owned by the creating process, and must be released once the workers are done with it.
+    """
+    def __init__(self, arrays: List[np.ndarray]):
+        shapes = [tuple(array.shape) for array in arrays]
+        size = sum(int(np.prod(shape)) for shape in shapes) * np.dtype(np.float32).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.spec = (self.shm.name, shapes)
+
+        for view, array in zip(shared_array_views(self.shm, shapes), arrays):
+            view[:] = array
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def shared_array_views(shm: shared_memory.SharedMemory, shapes: List[Tuple[int, ...]]) -> List[np.ndarray]:
+    views = []
+    offset = 0
+    for shape in shapes:
+        view = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=offset)
+        offset += view.nbytes
+        views.append(view)
+    return views
+
+
+def attach_shared_arrays(spec) -> Tuple[shared_memory.SharedMemory, List[np.ndarray]]:
+    # The arrays are views into the block, so they must be deleted before the block is closed
+    name, shapes = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, shared_array_views(shm, shapes)
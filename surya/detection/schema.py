@@ -1,8 +1,6 @@
 from typing import List, Optional, Any
 
-from pydantic import BaseModel
-
-from surya.common.polygon import PolygonBox
+from surya.common.polygon import PolygonBatchResult, PolygonBox
 
 
 class ColumnLine(PolygonBox):
@@ -10,7 +8,7 @@ class ColumnLine(PolygonBox):
     horizontal: bool
 
 
-class TextDetectionResult(BaseModel):
+class TextDetectionResult(PolygonBatchResult):
     bboxes: List[PolygonBox]
     vertical_lines: List[ColumnLine]
     heatmap: Optional[Any]
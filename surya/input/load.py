@@ -1,7 +1,11 @@
-from typing import List
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
 import PIL
 
 from surya.input.processing import open_pdf, get_page_images
+from surya.input.text_layer import PageTextLayer, get_page_text_layers
 from surya.settings import settings
 import os
 import filetype
@@ -28,6 +32,16 @@ def load_pdf(pdf_path, page_range: List[int] | None = None, dpi=settings.IMAGE_D
     return images, names
 
 
+def load_pdf_text_layers(pdf_path, page_range: List[int] | None = None) -> List[PageTextLayer | None]:
+    # The embedded text of each page, for hybrid OCR that only recognizes lines without reliable text
+    doc = open_pdf(pdf_path)
+    if not page_range:
+        page_range = list(range(len(doc)))
+    text_layers = get_page_text_layers(doc, page_range)
+    doc.close()
+    return text_layers
+
+
 def load_image(image_path):
     image = Image.open(image_path).convert("RGB")
     name = get_name_from_path(image_path)
@@ -65,6 +79,86 @@ def load_from_folder(folder_path, page_range: List[int] | None = None, dpi=setti
     return images, names
 
 
+def rasterize_page(page, dpis: List[int]) -> List[Image.Image]:
+    # Runs in a loader worker process, with its own copy of the page
+    try:
+        return page.images(dpis)
+    finally:
+        page.close()
+
+
+def iter_pages(
+        pages: Iterable,
+        dpis: List[int],
+        prefetch: int | None = None,
+        workers: int | None = None
+) -> Iterator[Tuple[object, List[Image.Image]]]:
+    """
+    Lazily yields (page, images) for PageSources, with one image per dpi, in input order.
+    Up to prefetch pages are rasterized ahead of the consumer by worker processes, and each page releases its
+    images once the consumer moves past it, so only a bounded number of pages are held in memory.
+    """
+    if prefetch is None:
+        prefetch = settings.LOADER_PREFETCH_PAGES
+    if workers is None:
+        workers = settings.LOADER_WORKERS
+
+    # Spawning workers costs more than rasterizing a handful of pages
+    few_pages = hasattr(pages, "__len__") and len(pages) < settings.LOADER_MIN_PARALLEL_PAGES
+    if workers <= 0 or prefetch <= 0 or few_pages:
+        for page in pages:
+            yield page, page.images(dpis)
+            page.release()
+        return
+
+    pages = iter(pages)
+    window = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        try:
+            for page in pages:
+                window.append((page, executor.submit(rasterize_page, page, dpis)))
+                if len(window) >= prefetch:
+                    break
+
+            while window:
+                page, future = window.popleft()
+                page.set_images(dpis, future.result())
+                next_page = next(pages, None)
+                if next_page is not None:
+                    window.append((next_page, executor.submit(rasterize_page, next_page, dpis)))
+
+                yield page, page.images(dpis)
+                page.release()
+        finally:
+            for _, future in window:
+                future.cancel()
+
+
+def iter_page_chunks(
+        pages: Iterable,
+        dpis: List[int],
+        chunk_size: int | None = None,
+        prefetch: int | None = None,
+        workers: int | None = None
+) -> Iterator[Tuple[List[object], List[List[Image.Image]]]]:
+    # Groups pages so the models still see full batches, while the next chunk is rasterized in the background
+    if chunk_size is None:
+        chunk_size = settings.LOADER_CHUNK_SIZE
+    if prefetch is None:
+        prefetch = max(settings.LOADER_PREFETCH_PAGES, chunk_size)
+
+    chunk_pages, chunk_images = [], []
+    for page, images in iter_pages(pages, dpis, prefetch, workers):
+        chunk_pages.append(page)
+        chunk_images.append(images)
+        if len(chunk_pages) == chunk_size:
+            yield chunk_pages, [list(dpi_images) for dpi_images in zip(*chunk_images)]
+            chunk_pages, chunk_images = [], []
+
+    if chunk_pages:
+        yield chunk_pages, [list(dpi_images) for dpi_images in zip(*chunk_images)]
+
+
 def load_lang_file(lang_path, names):
     with open(lang_path, "r") as f:
         lang_dict = json.load(f)
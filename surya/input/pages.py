@@ -0,0 +1,209 @@
+import math
+import os
+from typing import Dict, List
+
+import filetype
+import PIL
+from PIL import Image
+
+from surya.input.load import get_name_from_path
+from surya.input.processing import open_pdf
+from surya.input.text_layer import PageTextLayer, get_text_layer
+from surya.settings import settings
+
+
+class PageSource:
+    """
+    A handle to a single page, which is only rasterized when one of its images is requested.
+    Images are cached, so every pipeline stage asking for the same resolution gets the same image.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._images: Dict[int, Image.Image] = {}
+
+    def image(self, dpi: int = settings.IMAGE_DPI) -> Image.Image:
+        if dpi not in self._images:
+            self._images[dpi] = self._load(dpi)
+        return self._images[dpi]
+
+    def _load(self, dpi: int) -> Image.Image:
+        raise NotImplementedError()
+
+    def images(self, dpis: List[int]) -> List[Image.Image]:
+        return [self.image(dpi) for dpi in dpis]
+
+    def set_images(self, dpis: List[int], images: List[Image.Image]):
+        # Images rasterized elsewhere, like a loader worker process
+        for dpi, image in zip(dpis, images):
+            self._images[dpi] = image
+
+    def release(self):
+        # Drops the cached images, they are loaded again if requested
+        self._images = {}
+
+    def text_layer(self) -> PageTextLayer | None:
+        # Only PDF pages have a text layer
+        return None
+
+    def close(self):
+        pass
+
+
+class ImagePageSource(PageSource):
+    def __init__(self, path: str):
+        super().__init__(get_name_from_path(path))
+        self.path = path
+
+    def image(self, dpi: int = settings.IMAGE_DPI) -> Image.Image:
+        # Images have a single resolution, so every dpi maps to the same image
+        return super().image(0)
+
+    def set_images(self, dpis: List[int], images: List[Image.Image]):
+        super().set_images([0], images[:1])
+
+    def _load(self, dpi: int) -> Image.Image:
+        return Image.open(self.path).convert("RGB")
+
+
+class PdfDocumentHandle:
+    """Opens a PDF on first use, and closes it once every page that uses it has been rendered."""
+    def __init__(self, path: str):
+        self.path = path
+        self.doc = None
+        self.pending_pages = 0
+
+    def get(self):
+        if self.doc is None:
+            self.doc = open_pdf(self.path)
+        return self.doc
+
+    def page_done(self):
+        self.pending_pages -= 1
+        if self.pending_pages <= 0:
+            self.close()
+
+    def close(self):
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+
+    def __getstate__(self):
+        # Pages sent to a worker process reopen the document there
+        state = self.__dict__.copy()
+        state["doc"] = None
+        return state
+
+
+class PdfPageSource(PageSource):
+    """
+    A PDF page that is rendered once at render_dpi. Lower resolutions are downsampled from that render,
+    to the size pdfium would have rendered them at, instead of rasterizing the page again.
+    """
+    def __init__(self, handle: PdfDocumentHandle, page_idx: int, name: str, render_dpi: int = settings.IMAGE_DPI):
+        super().__init__(name)
+        self.handle = handle
+        self.page_idx = page_idx
+        self.render_dpi = render_dpi
+        self.page_size = None  # In points
+        self.done = False
+        handle.pending_pages += 1
+
+    def set_images(self, dpis: List[int], images: List[Image.Image]):
+        # Rendered in a loader worker, so this process doesn't need the document for the page any more
+        super().set_images(dpis, images)
+        self._page_done()
+
+    def _page_done(self):
+        # Every page counts once towards closing the document, whether it was rendered here or elsewhere
+        if not self.done:
+            self.done = True
+            self.handle.page_done()
+        elif self.handle.pending_pages <= 0:
+            self.handle.close()
+
+    def _read_page(self, read):
+        # Reads from the page, closing the document again if it was only opened for this, and every page is done
+        opened = self.handle.doc is None
+        try:
+            return read(self.handle.get()[self.page_idx])
+        finally:
+            if opened and self.handle.pending_pages <= 0:
+                self.handle.close()
+
+    def _load(self, dpi: int) -> Image.Image:
+        if dpi >= self.render_dpi:
+            # Higher resolutions aren't upsampled, the page is rendered again
+            image = self._render(dpi)
+            if dpi == self.render_dpi:
+                self._page_done()
+            return image
+
+        rendered = self.image(self.render_dpi)
+        if self.page_size is None:
+            # The render came from a loader worker
+            self.page_size = self._read_page(lambda page: (page.get_width(), page.get_height()))
+        width, height = self.page_size
+        size = (math.ceil(width * dpi / 72), math.ceil(height * dpi / 72))
+        factor = self.render_dpi // dpi
+        if factor * dpi == self.render_dpi and (math.ceil(rendered.width / factor), math.ceil(rendered.height / factor)) == size:
+            # Integer factors, like the default 192 -> 96 dpi, can use a much faster box filter
+            return rendered.reduce(factor)
+        return rendered.resize(size, Image.Resampling.LANCZOS)
+
+    def _render(self, dpi: int) -> Image.Image:
+        page = self.handle.get()[self.page_idx]
+        self.page_size = (page.get_width(), page.get_height())
+        image = page.render(scale=dpi / 72, draw_annots=False).to_pil()
+        return image.convert("RGB")
+
+    def text_layer(self) -> PageTextLayer | None:
+        return self._read_page(get_text_layer)
+
+    def close(self):
+        self.handle.close()
+
+
+def load_pdf_pages(pdf_path: str, page_range: List[int] | None = None, render_dpi: int = settings.IMAGE_DPI) -> List[PageSource]:
+    handle = PdfDocumentHandle(pdf_path)
+    last_page = len(handle.get())
+    handle.close()
+
+    if page_range:
+        assert all([0 <= page < last_page for page in page_range]), f"Invalid page range: {page_range}"
+    else:
+        page_range = list(range(last_page))
+
+    name = get_name_from_path(pdf_path)
+    return [PdfPageSource(handle, page_idx, name, render_dpi) for page_idx in page_range]
+
+
+def load_image_page(image_path: str) -> List[PageSource]:
+    # Only reads the header, so unreadable images fail here rather than when the pixels are needed
+    Image.open(image_path).close()
+    return [ImagePageSource(image_path)]
+
+
+def load_pages_from_file(input_path: str, page_range: List[int] | None = None, render_dpi: int = settings.IMAGE_DPI) -> List[PageSource]:
+    input_type = filetype.guess(input_path)
+    if input_type and input_type.extension == "pdf":
+        return load_pdf_pages(input_path, page_range, render_dpi)
+    else:
+        return load_image_page(input_path)
+
+
+def load_pages_from_folder(folder_path: str, page_range: List[int] | None = None, render_dpi: int = settings.IMAGE_DPI) -> List[PageSource]:
+    paths = [os.path.join(folder_path, name) for name in os.listdir(folder_path) if not name.startswith(".")]
+    paths = [path for path in paths if not os.path.isdir(path)]
+
+    pages = []
+    for path in paths:
+        extension = filetype.guess(path)
+        if extension and extension.extension == "pdf":
+            pages.extend(load_pdf_pages(path, page_range, render_dpi))
+        else:
+            try:
+                pages.extend(load_image_page(path))
+            except PIL.UnidentifiedImageError:
+                print(f"Could not load image {path}")
+                continue
+    return pages
@@ -36,29 +36,47 @@ def slice_bboxes_from_image(image: Image.Image, bboxes):
     return lines
 
 
-def slice_polys_from_image(image: Image.Image, polys):
-    image_array = np.array(image, dtype=np.uint8)
+def slice_bbox_arrays(image: Image.Image, bboxes) -> List[np.ndarray]:
+    # Like slice_bboxes_from_image, but crops are views into the page array, and only out of bounds crops are copied
+    image_array = np.asarray(image, dtype=np.uint8)
+    img_h, img_w = image_array.shape[:2]
     lines = []
-    for idx, poly in enumerate(polys):
-        lines.append(slice_and_pad_poly(image_array, poly))
+    for bbox in bboxes:
+        x0, y0, x1, y1 = [int(round(coord)) for coord in bbox[:4]]
+        if x1 - x0 <= 0:
+            print(f"Warning: found an empty line with bbox {bbox}")
+        if 0 <= x0 and 0 <= y0 and x1 <= img_w and y1 <= img_h:
+            lines.append(image_array[y0:y1, x0:x1])
+            continue
+
+        # Pixels outside the page are black, like PIL crops
+        line = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0), 3), dtype=np.uint8)
+        src_x0, src_y0, src_x1, src_y1 = max(x0, 0), max(y0, 0), min(x1, img_w), min(y1, img_h)
+        if src_x1 > src_x0 and src_y1 > src_y0:
+            line[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = image_array[src_y0:src_y1, src_x0:src_x1]
+        lines.append(line)
     return lines
 
 
-def slice_and_pad_poly(image_array: np.array, coordinates):
-    # Draw polygon onto mask
-    coordinates = [(corner[0], corner[1]) for corner in coordinates]
-    bbox = [min([x[0] for x in coordinates]), min([x[1] for x in coordinates]), max([x[0] for x in coordinates]), max([x[1] for x in coordinates])]
+def slice_polys_from_image(image: Image.Image, polys) -> List[np.ndarray]:
+    image_array = np.asarray(image, dtype=np.uint8)
+    return [slice_and_pad_poly(image_array, poly) for poly in polys]
+
 
-    # We mask out anything not in the polygon
-    cropped_polygon = image_array[bbox[1]:bbox[3], bbox[0]:bbox[2]].copy()
-    coordinates = [(x - bbox[0], y - bbox[1]) for x, y in coordinates]
+def slice_and_pad_poly(image_array: np.ndarray, coordinates) -> np.ndarray:
+    coordinates = np.asarray(coordinates).astype(np.int32).reshape(-1, 2)
+    x0, y0 = coordinates.min(axis=0)
+    x1, y1 = coordinates.max(axis=0)
+    cropped_polygon = image_array[y0:y1, x0:x1]
+
+    # Axis aligned rectangles cover the whole crop, so they don't need a mask, or a copy
+    corners = {(x0, y0), (x1, y0), (x1, y1), (x0, y1)}
+    if len(coordinates) == 4 and set(map(tuple, coordinates.tolist())) == corners:
+        return cropped_polygon
 
     # Pad the area outside the polygon with the pad value
     mask = np.zeros(cropped_polygon.shape[:2], dtype=np.uint8)
-    cv2.fillPoly(mask, [np.int32(coordinates)], 1)
-    mask = np.stack([mask] * 3, axis=-1)
-
+    cv2.fillPoly(mask, [coordinates - [x0, y0]], 1)
+    cropped_polygon = cropped_polygon.copy()
     cropped_polygon[mask == 0] = settings.RECOGNITION_PAD_VALUE
-    rectangle_image = Image.fromarray(cropped_polygon)
-
-    return rectangle_image
+    return cropped_polygon
@@ -0,0 +1,93 @@
+import re
+from typing import List, Tuple
+
+import numpy as np
+import pypdfium2
+import pypdfium2.raw as pdfium_c
+
+from surya.settings import settings
+
+
+class PageTextLayer:
+    """
+    The characters of a PDF page's embedded text layer, in content order, with their boxes in points from the top left
+    of the rendered page area.
+    """
+    def __init__(self, chars: List[str], boxes: np.ndarray, page_size: Tuple[float, float]):
+        self.chars = chars
+        self.boxes = boxes.reshape(-1, 4)
+        self.page_size = page_size
+
+    def match_lines(self, polygons: List[List[List[float]]], image_size: Tuple[int, int]) -> List[str | None]:
+        """
+        The text layer text of each line polygon, given in the coordinates of a page image of image_size.
+        Lines are None where the text layer isn't reliable enough to replace recognition: no text, unmapped or
+        private use characters, vertical lines, or text that only covers part of the line.
+        """
+        x_scale = self.page_size[0] / image_size[0]
+        y_scale = self.page_size[1] / image_size[1]
+        centers_x = (self.boxes[:, 0] + self.boxes[:, 2]) / 2
+        centers_y = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+        visible = np.array([not char.isspace() for char in self.chars], dtype=bool)
+
+        texts = []
+        for polygon in polygons:
+            polygon = np.asarray(polygon, dtype=np.float64)
+            x0, y0 = polygon.min(axis=0) * (x_scale, y_scale)
+            x1, y1 = polygon.max(axis=0) * (x_scale, y_scale)
+            inside = (centers_x >= x0) & (centers_x <= x1) & (centers_y >= y0) & (centers_y <= y1)
+            idxs = np.flatnonzero(inside)
+            idxs_visible = idxs[visible[idxs]]
+            if len(idxs_visible) == 0 or y1 - y0 > x1 - x0:
+                texts.append(None)
+                continue
+
+            chars = [self.chars[idx] for idx in idxs]
+            if any(not is_reliable_char(char) for char in chars):
+                texts.append(None)
+                continue
+
+            # The characters should span most of the line, otherwise part of it is likely an image
+            covered = self.boxes[idxs_visible, 2].max() - self.boxes[idxs_visible, 0].min()
+            if covered < (x1 - x0) * settings.TEXT_LAYER_MIN_COVERAGE:
+                texts.append(None)
+                continue
+
+            texts.append(re.sub(r"\s+", " ", "".join(chars)).strip())
+        return texts
+
+
+def is_reliable_char(char: str) -> bool:
+    # Fonts without a unicode mapping give replacement, control or private use characters.  Characters outside the
+    # basic plane come as surrogate halves, and are left to recognition too.
+    if char.isspace():
+        return True
+    code = ord(char)
+    return code >= 32 and char not in ("\ufffd", "\ufffe") and not 0xD800 <= code <= 0xF8FF
+
+
+def get_text_layer(page: pypdfium2.PdfPage) -> PageTextLayer | None:
+    # Rotated pages would need their boxes rotated too, so they are recognized instead
+    if page.get_rotation() != 0:
+        return None
+
+    crop_left, _, _, crop_top = page.get_cropbox()
+    textpage = page.get_textpage()
+    try:
+        char_count = textpage.count_chars()
+        chars = []
+        boxes = np.zeros((char_count, 4), dtype=np.float64)
+        for idx in range(char_count):
+            chars.append(chr(pdfium_c.FPDFText_GetUnicode(textpage.raw, idx)))
+            left, bottom, right, top = textpage.get_charbox(idx, loose=True)
+            boxes[idx] = (left - crop_left, crop_top - top, right - crop_left, crop_top - bottom)
+    finally:
+        textpage.close()
+
+    if char_count == 0:
+        return None
+    return PageTextLayer(chars, boxes, page.get_size())
+
+
+def get_page_text_layers(doc: pypdfium2.PdfDocument, indices: List[int]) -> List[PageTextLayer | None]:
+    return [get_text_layer(doc[idx]) for idx in indices]
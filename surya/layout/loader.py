@@ -28,16 +28,7 @@ class LayoutModelLoader(ModelLoader):
         if dtype is None:
             dtype = settings.MODEL_DTYPE
 
-        config = SuryaLayoutConfig.from_pretrained(self.checkpoint, revision=self.revision)
-        decoder_config = config.decoder
-        decoder = SuryaLayoutDecoderConfig(**decoder_config)
-        config.decoder = decoder
-
-        encoder_config = config.encoder
-        encoder = DonutSwinLayoutConfig(**encoder_config)
-        config.encoder = encoder
-
-        model = SuryaLayoutModel.from_pretrained(self.checkpoint, config=config, torch_dtype=dtype, revision=self.revision)
+        model = self.load_pretrained(SuryaLayoutModel, self.config, dtype)
         model = model.to(device)
         model = model.eval()
 
@@ -53,6 +44,17 @@ class LayoutModelLoader(ModelLoader):
         print(f"Loaded layout model {self.checkpoint} on device {device} with dtype {dtype}")
         return model
 
+    def config(self, path: Optional[str] = None) -> SuryaLayoutConfig:
+        config = SuryaLayoutConfig.from_pretrained(path or self.checkpoint, revision=self.revision)
+        decoder_config = config.decoder
+        decoder = SuryaLayoutDecoderConfig(**decoder_config)
+        config.decoder = decoder
+
+        encoder_config = config.encoder
+        encoder = DonutSwinLayoutConfig(**encoder_config)
+        config.encoder = encoder
+        return config
+
     def processor(
             self
     ) -> SuryaEncoderImageProcessor:
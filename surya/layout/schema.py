@@ -1,8 +1,6 @@
 from typing import Optional, Dict, List
 
-from pydantic import BaseModel
-
-from surya.common.polygon import PolygonBox
+from surya.common.polygon import PolygonBatchResult, PolygonBox
 
 
 class LayoutBox(PolygonBox):
@@ -11,7 +9,9 @@ class LayoutBox(PolygonBox):
     top_k: Optional[Dict[str, float]] = None
 
 
-class LayoutResult(BaseModel):
+class LayoutResult(PolygonBatchResult):
+    batch_item_fields = ["position", "top_k"]
+
     bboxes: List[LayoutBox]
     image_bbox: List[float]
     sliced: bool = False  # Whether the image was sliced and reconstructed
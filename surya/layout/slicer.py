@@ -1,7 +1,8 @@
 import math
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 from PIL import Image
 
+from surya.common.util import GridIndex
 from surya.layout.schema import LayoutResult
 
 SLICES_TYPE = Tuple[List[Image.Image], List[Tuple[int, int, int]]]
@@ -21,18 +22,25 @@ class ImageSlicer:
         all_positions = []
 
         for idx, image in enumerate(images):
-            if (image.size[0] > self.slice_min_dims["width"] or
-                    image.size[1] > self.slice_min_dims["height"]):
-                img_slices, positions = self._slice_image(image, idx)
-                all_slices.extend(img_slices)
-                all_positions.extend(positions)
-            else:
-                all_slices.append(image)
-                all_positions.append((idx, 0, 0))
+            img_slices, positions = self.slice_image(image, idx)
+            all_slices.extend(img_slices)
+            all_positions.extend(positions)
 
         return all_slices, all_positions
 
+    def slice_image(self, image: Image.Image, idx: int) -> SLICES_TYPE:
+        if self.needs_slicing(image):
+            return self._slice_image(image, idx)
+        return [image], [(idx, 0, 0)]
+
+    def needs_slicing(self, image: Image.Image) -> bool:
+        return image.size[0] > self.slice_min_dims["width"] or image.size[1] > self.slice_min_dims["height"]
+
     def slice_count(self, image: Image.Image) -> int:
+        # The number of slices slice_image makes, without slicing
+        if not self.needs_slicing(image):
+            return 1
+
         width, height = image.size
         if width > height:
             slice_size = self._calculate_slice_size(width, "width")
@@ -41,6 +49,24 @@ class ImageSlicer:
             slice_size = self._calculate_slice_size(height, "height")
             return math.ceil(height / slice_size)
 
+    def batches(self, images: Iterable[Image.Image], batch_size: int) -> Iterator[SLICES_TYPE]:
+        """
+        Yields the slices of every image, in order, in batches of exactly batch_size slices, except for the last batch.
+        The slices of an image can be split over two batches, join puts them back together from their positions.
+        Images are only sliced once the batch before them is done.
+        """
+        batch_slices, batch_positions = [], []
+        for idx, image in enumerate(images):
+            img_slices, positions = self.slice_image(image, idx)
+            batch_slices.extend(img_slices)
+            batch_positions.extend(positions)
+            while len(batch_slices) >= batch_size:
+                yield batch_slices[:batch_size], batch_positions[:batch_size]
+                batch_slices, batch_positions = batch_slices[batch_size:], batch_positions[batch_size:]
+
+        if batch_slices:
+            yield batch_slices, batch_positions
+
     def _calculate_slice_size(self, dimension: int, dim_type: str) -> int:
         min_size = self.slice_sizes[dim_type]
         return max(min_size, (dimension // self.max_slices + 1))
@@ -87,10 +113,12 @@ class ImageSlicer:
         if merge_dir == "width":
             new_image_bbox[2] += res2.image_bbox[2]
             max_position = max([box.position for box in res1.bboxes]) + 1
+            index = GridIndex([box.bbox for box in res1.bboxes])
             for i, box2 in enumerate(res2.bboxes):
                 box2.shift(x_shift=res1.image_bbox[2])
                 box2.position += max_position
-                for j, box1 in enumerate(res1.bboxes):
+                for j in index.query(box2.bbox, margin=box2.width * self.merge_margin):
+                    box1 = res1.bboxes[j]
                     if all([
                         any([
                             box1.intersection_pct(box2, x_margin=self.merge_margin) > self.merge_tolerance,
@@ -106,15 +134,18 @@ class ImageSlicer:
                         ])
                     ]):
                         box1.merge(box2)
+                        index.insert(j, box1.bbox)
                         to_remove_idxs.add(i)
 
         elif merge_dir == "height":
             new_image_bbox[3] += res2.image_bbox[3]
             max_position = max([box.position for box in res1.bboxes]) + 1
+            index = GridIndex([box.bbox for box in res1.bboxes])
             for i, box2 in enumerate(res2.bboxes):
                 box2.shift(y_shift=res1.image_bbox[3])
                 box2.position += max_position
-                for j, box1 in enumerate(res1.bboxes):
+                for j in index.query(box2.bbox, margin=box2.height * self.merge_margin):
+                    box1 = res1.bboxes[j]
                     if all([
                         any([
                             box1.intersection_pct(box2, y_margin=self.merge_margin) > self.merge_tolerance,
@@ -130,6 +161,7 @@ class ImageSlicer:
                         ])
                     ]):
                         box1.merge(box2)
+                        index.insert(j, box1.bbox)
                         to_remove_idxs.add(i)
 
         new_result = LayoutResult(
@@ -31,3 +31,26 @@ def prediction_to_polygon(pred, img_size, bbox_scaler, skew_scaler, skew_min=.00
         ])
     return poly
 
+
+def prediction_to_polygons(preds, img_sizes, bbox_scaler, skew_scaler, skew_min=.001):
+    # Batched prediction_to_polygon, for (B, 6+) box predictions and (B, 2) image sizes, returning (B, 4, 2) polygons
+    cx, cy, width, height = preds[:, 0], preds[:, 1], preds[:, 2], preds[:, 3]
+    x1 = cx - width / 2
+    y1 = cy - height / 2
+    x2 = cx + width / 2
+    y2 = cy + height / 2
+    skew_x = torch.floor((preds[:, 4] - skew_scaler) / 2)
+    skew_y = torch.floor((preds[:, 5] - skew_scaler) / 2)
+    skew_x = torch.where(torch.abs(skew_x) < skew_min, 0, skew_x)
+    skew_y = torch.where(torch.abs(skew_y) < skew_min, 0, skew_y)
+
+    xs = torch.stack([x1 - skew_x, x2 - skew_x, x2 + skew_x, x1 + skew_x], dim=1)
+    ys = torch.stack([y1 - skew_y, y1 + skew_y, y2 + skew_y, y2 - skew_y], dim=1)
+    polygons = torch.stack([xs, ys], dim=-1).to(img_sizes.dtype)
+    return polygons * (img_sizes / bbox_scaler).unsqueeze(1)
+
+
+def in_page_center(polygons, img_sizes):
+    # Whether (B, 4, 2) polygons reach into the middle of their pages, where page headers and footers don't belong
+    return (polygons[:, 0, 1] < img_sizes[:, 1] * .8) & (polygons[:, 2, 1] > img_sizes[:, 1] * .2) & \
+        (polygons[:, 0, 0] < img_sizes[:, 0] * .8) & (polygons[:, 2, 0] > img_sizes[:, 0] * .2)
@@ -1,23 +1,55 @@
-from typing import Dict
+import importlib
+from typing import Callable, Dict, Iterator, Mapping
 
 import torch
 
 from surya.common.predictor import BasePredictor
-from surya.detection import DetectionPredictor
-from surya.layout import LayoutPredictor
-from surya.ocr_error import OCRErrorPredictor
-from surya.recognition import RecognitionPredictor
-from surya.table_rec import TableRecPredictor
+
+# Predictor classes by name, imported when first used, since each model package pulls in its model code
+PREDICTORS = {
+    "layout": ("surya.layout", "LayoutPredictor"),
+    "ocr_error": ("surya.ocr_error", "OCRErrorPredictor"),
+    "recognition": ("surya.recognition", "RecognitionPredictor"),
+    "detection": ("surya.detection", "DetectionPredictor"),
+    "table_rec": ("surya.table_rec", "TableRecPredictor"),
+}
+
+
+class LazyPredictors(Mapping):
+    """
+    Predictors by name, each constructed on first access, so a run only imports and loads the models it uses.
+    """
+    def __init__(self, factories: Dict[str, Callable[[], BasePredictor]]):
+        self.factories = factories
+        self.loaded: Dict[str, BasePredictor] = {}
+
+    def __getitem__(self, name: str) -> BasePredictor:
+        if name not in self.loaded:
+            self.loaded[name] = self.factories[name]()
+        return self.loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.factories)
+
+    def __len__(self) -> int:
+        return len(self.factories)
+
+
+def predictor_factory(
+        name: str,
+        device: str | torch.device | None = None,
+        dtype: torch.dtype | str | None = None
+) -> Callable[[], BasePredictor]:
+    module, cls_name = PREDICTORS[name]
+
+    def load() -> BasePredictor:
+        predictor_cls = getattr(importlib.import_module(module), cls_name)
+        return predictor_cls(device=device, dtype=dtype)
+    return load
 
 
 def load_predictors(
         device: str | torch.device | None = None,
         dtype: torch.dtype | str | None = None
-) -> Dict[str, BasePredictor]:
-    return {
-        "layout": LayoutPredictor(device=device, dtype=dtype),
-        "ocr_error": OCRErrorPredictor(device=device, dtype=dtype),
-        "recognition": RecognitionPredictor(device=device, dtype=dtype),
-        "detection": DetectionPredictor(device=device, dtype=dtype),
-        "table_rec": TableRecPredictor(device=device, dtype=dtype)
-    }
\ No newline at end of file
+) -> Mapping[str, BasePredictor]:
+    return LazyPredictors({name: predictor_factory(name, device, dtype) for name in PREDICTORS})
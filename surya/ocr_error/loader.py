@@ -28,13 +28,7 @@ class OCRErrorModelLoader(ModelLoader):
         if dtype is None:
             dtype = settings.MODEL_DTYPE
 
-        config = DistilBertConfig.from_pretrained(self.checkpoint, revision=self.revision)
-        model = DistilBertForSequenceClassification.from_pretrained(
-            self.checkpoint,
-            torch_dtype=dtype,
-            config=config,
-            revision=self.revision
-        ).to(device).eval()
+        model = self.load_pretrained(DistilBertForSequenceClassification, self.config, dtype).to(device).eval()
 
         if settings.OCR_ERROR_STATIC_CACHE:
             torch.set_float32_matmul_precision('high')
@@ -46,7 +40,10 @@ class OCRErrorModelLoader(ModelLoader):
 
         return model
 
+    def config(self, path: Optional[str] = None) -> DistilBertConfig:
+        return DistilBertConfig.from_pretrained(path or self.checkpoint, revision=self.revision)
+
     def processor(
             self
     ) -> DistilBertTokenizer:
-        return DistilBertTokenizer.from_pretrained(self.checkpoint, revision=self.revision)
\ No newline at end of file
+        return self.load_cached_processor(lambda path: DistilBertTokenizer.from_pretrained(path, revision=self.revision))
\ No newline at end of file
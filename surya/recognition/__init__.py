@@ -1,5 +1,9 @@
+import hashlib
+import queue
+import threading
 from copy import deepcopy
-from typing import List
+from itertools import repeat
+from typing import List, Iterable, Generator, Iterator, Optional, Tuple
 
 import numpy as np
 import torch
@@ -7,9 +11,12 @@ from PIL import Image
 from tqdm import tqdm
 import torch.nn.functional as F
 
+from surya.common.adetr.engine import DecodeStepEngine
 from surya.common.predictor import BasePredictor
-from surya.detection import DetectionPredictor
-from surya.input.processing import convert_if_not_rgb, slice_polys_from_image, slice_bboxes_from_image
+from surya.detection import DetectionPredictor, TextDetectionResult
+from surya.input.processing import convert_if_not_rgb, slice_polys_from_image, slice_bbox_arrays
+from surya.input.text_layer import PageTextLayer
+from surya.ocr_error import OCRErrorPredictor
 from surya.recognition.loader import RecognitionModelLoader
 from surya.recognition.postprocessing import truncate_repetitions
 from surya.recognition.processor import SuryaProcessor
@@ -26,6 +33,28 @@ class RecognitionPredictor(BasePredictor):
         "mps": 64,
         "cuda": 256
     }
+    # Recognized tokens and line aspect ratios seen so far, used to predict output lengths
+    length_stats = (0, 0.)
+    # Lines passed to batch_recognition, and how many of them were unique
+    dedup_stats = (0, 0)
+    cache_settings = ["RECOGNITION_MAX_TOKENS", "RECOGNITION_IMAGE_SIZE", "RECOGNITION_PAD_VALUE"]
+    decode_engine: DecodeStepEngine | None = None
+
+    def __init__(self, checkpoint: Optional[str] = None, device: torch.device | str | None = settings.TORCH_DEVICE_MODEL, dtype: Optional[torch.dtype | str] = settings.MODEL_DTYPE):
+        super().__init__(checkpoint, device, dtype)
+
+        # With a static cache, decode steps run through a captured engine, which is compiled up front
+        if settings.RECOGNITION_STATIC_CACHE:
+            text_encoder_config = self.model.text_encoder.config
+            self.decode_engine = DecodeStepEngine(
+                self.model.decoder,
+                self.get_batch_size(),
+                text_encoder_config.query_token_count,
+                text_encoder_config.hidden_size,
+                self.model.device,
+                self.model.dtype
+            )
+            self.decode_engine.warmup()
 
     def __call__(
             self,
@@ -36,9 +65,13 @@ class RecognitionPredictor(BasePredictor):
             recognition_batch_size: int | None = None,
             highres_images: List[Image.Image] | None = None,
             bboxes: List[List[List[int]]] | None = None,
-            polygons: List[List[List[List[int]]]] | None = None
+            polygons: List[List[List[List[int]]]] | None = None,
+            text_layers: List[PageTextLayer | None] | None = None,
+            ocr_error_predictor: OCRErrorPredictor | None = None
     ) -> List[OCRResult]:
             assert len(images) == len(langs), "You need to pass in one list of languages for each image"
+            if text_layers is not None:
+                assert len(images) == len(text_layers), "You need to pass in one text layer (or None) for each image"
             images = convert_if_not_rgb(images)
             if highres_images is not None:
                 assert len(images) == len(highres_images), "You need to pass in one highres image for each image"
@@ -69,37 +102,211 @@ class RecognitionPredictor(BasePredictor):
                     polygons=polygons
                 )
 
-            rec_predictions, confidence_scores = self.batch_recognition(
-                flat["slices"],
-                flat["langs"],
+            rec_predictions, confidence_scores = self.recognize_slices(
+                images,
+                flat,
+                text_layers,
+                ocr_error_predictor,
                 batch_size=recognition_batch_size
             )
 
-            predictions_by_image = []
+            return self.assemble_results(images, langs, flat, rec_predictions, confidence_scores)
+
+    def stream(
+            self,
+            images: Iterable[Image.Image],
+            langs: Iterable[List[str] | None],
+            det_predictor: DetectionPredictor,
+            detection_batch_size: int | None = None,
+            recognition_batch_size: int | None = None,
+            highres_images: Iterable[Image.Image] | None = None,
+            max_inflight_pages: int | None = None,
+            text_layers: Iterable[PageTextLayer | None] | None = None,
+            ocr_error_predictor: OCRErrorPredictor | None = None
+    ) -> Generator[OCRResult, None, None]:
+        """
+        Runs detection and recognition as a pipeline, yielding one OCRResult per page, in input order.
+        Detection (including heatmap postprocessing) for the next chunk of pages runs in a background thread while
+        the current chunk is recognized.  At most max_inflight_pages pages are held by the pipeline at once.
+        Text layers are read in the detection thread, along with the images, so lazily loaded PDF pages are only
+        touched by one thread.
+        """
+        if detection_batch_size is None:
+            detection_batch_size = det_predictor.get_batch_size()
+        if max_inflight_pages is None:
+            max_inflight_pages = settings.RECOGNITION_STREAM_MAX_INFLIGHT_PAGES
+        chunk_size = max(1, min(detection_batch_size, max_inflight_pages))
+
+        if highres_images is None:
+            highres_images = repeat(None)
+        if text_layers is None:
+            text_layers = repeat(None)
+        pages = zip(images, highres_images, langs, text_layers)
+
+        inflight = threading.Semaphore(max(max_inflight_pages, chunk_size))
+        detected_chunks = queue.Queue()
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=self._stream_detection_worker,
+            args=(pages, det_predictor, detection_batch_size, chunk_size, inflight, detected_chunks, stop),
+            daemon=True
+        )
+        worker.start()
+
+        try:
+            finished = False
+            while not finished:
+                chunks = [detected_chunks.get()]
+                # Recognize everything that has been detected so far together, to keep recognition batches full
+                while True:
+                    try:
+                        chunks.append(detected_chunks.get_nowait())
+                    except queue.Empty:
+                        break
+
+                chunk_images, chunk_highres, chunk_langs, chunk_text_layers, chunk_detections = [], [], [], [], []
+                for chunk in chunks:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    if chunk is None:
+                        finished = True
+                        continue
+                    for (image, highres_image, lang, text_layer), det_pred in chunk:
+                        chunk_images.append(image)
+                        chunk_highres.append(highres_image)
+                        chunk_langs.append(lang)
+                        chunk_text_layers.append(text_layer)
+                        chunk_detections.append(det_pred)
+
+                if len(chunk_images) == 0:
+                    continue
+
+                flat = self.slice_detections(chunk_detections, chunk_images, chunk_langs, chunk_highres)
+                rec_predictions, confidence_scores = self.recognize_slices(
+                    chunk_images,
+                    flat,
+                    chunk_text_layers,
+                    ocr_error_predictor,
+                    batch_size=recognition_batch_size
+                )
+                del flat["slices"]
+                results = self.assemble_results(chunk_images, chunk_langs, flat, rec_predictions, confidence_scores)
+                del chunk_images, chunk_highres, chunk_text_layers, chunk_detections
+
+                for result in results:
+                    inflight.release()
+                    yield result
+        finally:
+            stop.set()
+            worker.join()
+
+    @staticmethod
+    def _stream_detection_worker(
+            pages: Iterator[Tuple[Image.Image, Image.Image | None, List[str] | None, PageTextLayer | None]],
+            det_predictor: DetectionPredictor,
+            detection_batch_size: int,
+            chunk_size: int,
+            inflight: threading.Semaphore,
+            detected_chunks: queue.Queue,
+            stop: threading.Event
+    ):
+        def detect(chunk):
+            chunk_images = convert_if_not_rgb([image for image, _, _, _ in chunk])
+            chunk_highres = [convert_if_not_rgb([hr])[0] if hr is not None else None for _, hr, _, _ in chunk]
+            chunk = list(zip(chunk_images, chunk_highres, [lang for _, _, lang, _ in chunk], [text_layer for _, _, _, text_layer in chunk]))
+            det_predictions = det_predictor(chunk_images, batch_size=detection_batch_size)
+            detected_chunks.put(list(zip(chunk, det_predictions)))
+
+        try:
+            chunk = []
+            for page in pages:
+                while not inflight.acquire(timeout=.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                chunk.append(page)
+                if len(chunk) == chunk_size:
+                    detect(chunk)
+                    chunk = []
+
+            if len(chunk) > 0 and not stop.is_set():
+                detect(chunk)
+            detected_chunks.put(None)
+        except Exception as e:
+            detected_chunks.put(e)
+
+    def recognize_slices(
+            self,
+            images: List[Image.Image],
+            flat: dict,
+            text_layers: List[PageTextLayer | None] | None,
+            ocr_error_predictor: OCRErrorPredictor | None = None,
+            batch_size: int | None = None
+    ) -> Tuple[List[str], List[float]]:
+        # Lines with a reliable PDF text layer take their text from it, with a confidence of 1, only the rest are
+        # recognized.  Text layer lines the OCR error model flags as garbled, like broken font encodings, are too.
+        line_texts = [None] * len(flat["slices"])
+        if text_layers is not None:
             slice_start = 0
-            for idx, (image, lang) in enumerate(zip(images, langs)):
-                slice_end = slice_start + flat["slice_map"][idx]
-                image_lines = rec_predictions[slice_start:slice_end]
-                line_confidences = confidence_scores[slice_start:slice_end]
-                polygons = flat["polygons"][slice_start:slice_end]
+            for image, slice_count, text_layer in zip(images, flat["slice_map"], text_layers):
+                slice_end = slice_start + slice_count
+                if text_layer is not None and slice_count > 0:
+                    line_texts[slice_start:slice_end] = text_layer.match_lines(flat["polygons"][slice_start:slice_end], image.size)
                 slice_start = slice_end
 
-                lines = []
-                for text_line, confidence, polygon in zip(image_lines, line_confidences, polygons):
-                    lines.append(TextLine(
-                        text=text_line,
-                        polygon=polygon,
-                        confidence=confidence
-                    ))
-
-                lines = sort_text_lines(lines)
-                predictions_by_image.append(OCRResult(
-                    text_lines=lines,
-                    languages=lang,
-                    image_bbox=[0, 0, image.size[0], image.size[1]]
+        layer_rows = [row for row, text in enumerate(line_texts) if text is not None]
+        if ocr_error_predictor is not None and len(layer_rows) > 0:
+            labels = ocr_error_predictor([line_texts[row] for row in layer_rows]).labels
+            for row, label in zip(layer_rows, labels):
+                if label == "bad":
+                    line_texts[row] = None
+
+        confidences = [1.0] * len(line_texts)
+        ocr_rows = [row for row, text in enumerate(line_texts) if text is None]
+        rec_predictions, confidence_scores = self.batch_recognition(
+            [flat["slices"][row] for row in ocr_rows],
+            [flat["langs"][row] for row in ocr_rows],
+            batch_size=batch_size
+        )
+        for row, text, confidence in zip(ocr_rows, rec_predictions, confidence_scores):
+            line_texts[row] = text
+            confidences[row] = confidence
+        return line_texts, confidences
+
+    def assemble_results(
+            self,
+            images: List[Image.Image],
+            langs: List[List[str] | None],
+            flat: dict,
+            rec_predictions: List[str],
+            confidence_scores: List[float]
+    ) -> List[OCRResult]:
+        predictions_by_image = []
+        slice_start = 0
+        for idx, (image, lang) in enumerate(zip(images, langs)):
+            slice_end = slice_start + flat["slice_map"][idx]
+            image_lines = rec_predictions[slice_start:slice_end]
+            line_confidences = confidence_scores[slice_start:slice_end]
+            polygons = flat["polygons"][slice_start:slice_end]
+            slice_start = slice_end
+
+            lines = []
+            for text_line, confidence, polygon in zip(image_lines, line_confidences, polygons):
+                lines.append(TextLine(
+                    text=text_line,
+                    polygon=polygon,
+                    confidence=confidence
                 ))
 
-            return predictions_by_image
+            lines = sort_text_lines(lines)
+            predictions_by_image.append(OCRResult(
+                text_lines=lines,
+                languages=lang,
+                image_bbox=[0, 0, image.size[0], image.size[1]]
+            ))
+
+        return predictions_by_image
 
     def detect_and_slice_bboxes(
             self,
@@ -110,7 +317,15 @@ class RecognitionPredictor(BasePredictor):
             highres_images: List[Image.Image] | None = None,
     ):
         det_predictions = det_predictor(images, batch_size=detection_batch_size)
+        return self.slice_detections(det_predictions, images, langs, highres_images)
 
+    def slice_detections(
+            self,
+            det_predictions: List[TextDetectionResult],
+            images: List[Image.Image],
+            langs: List[List[str] | None],
+            highres_images: List[Image.Image | None]
+    ):
         all_slices = []
         slice_map = []
         all_langs = []
@@ -157,7 +372,7 @@ class RecognitionPredictor(BasePredictor):
                 polys = polygons[idx]
                 slices = slice_polys_from_image(image, polys)
             else:
-                slices = slice_bboxes_from_image(image, bboxes[idx])
+                slices = slice_bbox_arrays(image, bboxes[idx])
                 polys = [
                     [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]]
                     for bbox in bboxes[idx]
@@ -197,8 +412,7 @@ class RecognitionPredictor(BasePredictor):
                 batch_decoder_input[idx] = [self.processor.tokenizer.pad_id] * padding_length + tokens
         current_batch_size = len(batch_pixel_values)
 
-        batch_pixel_values = torch.tensor(np.stack(batch_pixel_values, axis=0), dtype=self.model.dtype,
-                                          device=self.model.device)
+        batch_pixel_values = batch_pixel_values.to(self.model.device, dtype=self.model.dtype)
         batch_decoder_input = torch.tensor(np.stack(batch_decoder_input, axis=0), dtype=torch.long,
                                            device=self.model.device)
         if settings.RECOGNITION_STATIC_CACHE:
@@ -207,13 +421,75 @@ class RecognitionPredictor(BasePredictor):
 
         return batch_pixel_values, batch_decoder_input, current_batch_size
 
+    def encode_images(self, batch_pixel_values: torch.Tensor, batch_size: int) -> torch.Tensor:
+        self.model.text_encoder.model._setup_cache(self.model.config, batch_size, self.model.device, self.model.dtype)
+
+        encoder_hidden_states = None
+        encoder_batch_size = batch_size // settings.RECOGNITION_ENCODER_BATCH_DIVISOR
+        for z in range(0, batch_pixel_values.shape[0], encoder_batch_size):
+            encoder_pixel_values = batch_pixel_values[z:min(z + encoder_batch_size, batch_pixel_values.shape[0])]
+            encoder_hidden_states_batch = self.model.encoder(pixel_values=encoder_pixel_values).last_hidden_state
+            if encoder_hidden_states is None:
+                encoder_hidden_states = encoder_hidden_states_batch
+            else:
+                encoder_hidden_states = torch.cat([encoder_hidden_states, encoder_hidden_states_batch], dim=0)
+
+        text_encoder_input_ids = torch.arange(
+            self.model.text_encoder.config.query_token_count,
+            device=encoder_hidden_states.device,
+            dtype=torch.long
+        ).unsqueeze(0).expand(encoder_hidden_states.size(0), -1)
+
+        encoder_text_hidden_states = self.model.text_encoder(
+            input_ids=text_encoder_input_ids,
+            cache_position=None,
+            attention_mask=None,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_attention_mask=None,
+            use_cache=False
+        ).hidden_states
+        del encoder_hidden_states
+
+        if settings.RECOGNITION_STATIC_CACHE:
+            # Pad inputs to max batch size for static cache
+            encoder_text_hidden_states = self.pad_to_batch_size(encoder_text_hidden_states, batch_size)
+        return encoder_text_hidden_states
+
+    def prefill(self, images: List[np.ndarray], languages: List[List[str] | None], batch_size: int, engine: DecodeStepEngine | None = None):
+        # Encodes the images and runs the decoder prefill on them.  This replaces the current decoder cache, with a new
+        # one, or with views into the engine's prefill buffers if an engine is passed.
+        device = self.model.device if settings.RECOGNITION_PREPROCESS_ON_DEVICE else None
+        batch_pixel_values = self.processor.image_processor.process_batch(images, device=device)
+        processed_batch = self.processor(text=[""] * len(images), langs=languages)
+        batch_pixel_values, batch_decoder_input, current_batch_size = self.prepare_input(
+            processed_batch["langs"],
+            batch_pixel_values,
+            batch_size
+        )
+
+        encoder_text_hidden_states = self.encode_images(batch_pixel_values, batch_size)
+        prefix_length = batch_decoder_input.shape[-1]
+        if engine is not None:
+            self.model.decoder.model._set_cache(engine.prefill_cache(batch_decoder_input.shape[0], prefix_length))
+        return_dict = self.model.decoder(
+            input_ids=batch_decoder_input,
+            encoder_hidden_states=encoder_text_hidden_states,
+            cache_position=torch.arange(prefix_length, device=self.model.device),
+            use_cache=True,
+            prefill=engine is None
+        )
+        logits = return_dict["logits"][:current_batch_size, -1]
+        return encoder_text_hidden_states, logits, prefix_length
+
     def batch_recognition(
             self,
-            images: List[Image.Image],
+            images: List[Image.Image | np.ndarray],
             languages: List[List[str] | None],
             batch_size=None
     ):
-        assert all(isinstance(image, Image.Image) for image in images)
+        # Line slices are RGB arrays, often views into their page, and are resized straight into the input batch
+        images = [np.asarray(image.convert("RGB")) if isinstance(image, Image.Image) else image for image in images]
+        assert all(isinstance(image, np.ndarray) and image.ndim == 3 for image in images)
         assert len(images) == len(languages)
 
         if len(images) == 0:
@@ -222,136 +498,311 @@ class RecognitionPredictor(BasePredictor):
         if batch_size is None:
             batch_size = self.get_batch_size()
 
-        # Sort images by width, so similar length ones go together
-        sorted_pairs = sorted(enumerate(images), key=lambda x: x[1].width, reverse=False)
-        indices, images = zip(*sorted_pairs)
-        indices = list(indices)
-        images = list(images)
-
-        output_text = []
-        confidences = []
-        for i in tqdm(range(0, len(images), batch_size), desc="Recognizing Text"):
-            batch_images = images[i:i + batch_size]
-            batch_images = [image.convert("RGB") for image in batch_images]  # also copies the images
-            real_batch_size = len(batch_images)
-            batch_langs = languages[i:i + real_batch_size]
-            processed_batch = self.processor(text=[""] * len(batch_images), images=batch_images, langs=batch_langs)
-
-            batch_pixel_values = processed_batch["pixel_values"]
-            batch_langs = processed_batch["langs"]
-            batch_pixel_values, batch_decoder_input, current_batch_size = self.prepare_input(
-                batch_langs,
-                batch_pixel_values,
-                batch_size
+        # Identical crops with the same languages, like repeated headers and labels, are only recognized once
+        line_hashes = [self.line_hash(image, language) for image, language in zip(images, languages)]
+        first_rows = {}
+        source_rows = [first_rows.setdefault(line_hash, row) for row, line_hash in enumerate(line_hashes)]
+        unique_rows = list(first_rows.values())
+        line_count, unique_count = self.dedup_stats
+        self.dedup_stats = (line_count + len(images), unique_count + len(unique_rows))
+
+        # Lines already in the result cache aren't decoded again
+        cached = [None] * len(images)
+        if self.result_cache is not None:
+            line_keys = [self.result_cache.key(line_hash) for line_hash in line_hashes]
+            for row, result in zip(unique_rows, self.result_cache.get_many([line_keys[row] for row in unique_rows])):
+                cached[row] = result
+        pending = [row for row in unique_rows if cached[row] is None]
+
+        # Group lines into buckets by predicted output length, so short lines like page numbers and labels are decoded
+        # with a small token budget (and a bigger batch), instead of alongside long lines
+        bucket_budgets = self.get_bucket_budgets()
+        aspects = [self.line_aspect(image) for image in images]
+        bucket_rows = [[] for _ in bucket_budgets]
+        for row in pending:
+            bucket_rows[self.get_bucket(aspects[row], languages[row], bucket_budgets)].append(row)
+
+        batch_predictions = [None] * len(images)
+        batch_scores = [None] * len(images)
+        for bucket, max_tokens in enumerate(bucket_budgets):
+            rows = bucket_rows[bucket]
+            if len(rows) == 0:
+                continue
+
+            # Sort images by width, so similar length ones go together
+            rows = sorted(rows, key=lambda row: images[row].shape[1])
+            bucket_batch_size = batch_size
+            if not settings.RECOGNITION_STATIC_CACHE:
+                # The dynamic cache only grows to the bucket's token budget, so more lines fit in the same memory
+                bucket_batch_size *= min(settings.RECOGNITION_BUCKET_MAX_BATCH_SCALE, max(1, settings.RECOGNITION_MAX_TOKENS // max_tokens))
+
+            predictions, scores, truncated = self.continuous_decode(
+                [images[row] for row in rows],
+                [languages[row] for row in rows],
+                bucket_batch_size,
+                max_tokens=max_tokens
             )
 
-            token_count = 0
-            inference_token_count = batch_decoder_input.shape[-1]
-            batch_predictions = [[] for _ in range(current_batch_size)]
-
-            decoder_position_ids = torch.ones_like(batch_decoder_input[0, :], dtype=torch.int64,
-                                                   device=self.model.device).cumsum(0) - 1
-            self.model.decoder.model._setup_cache(self.model.config, batch_size, self.model.device, self.model.dtype)
-            self.model.text_encoder.model._setup_cache(self.model.config, batch_size, self.model.device, self.model.dtype)
-
-            sequence_scores = None
-            all_done = torch.zeros(current_batch_size, dtype=torch.bool, device=self.model.device)
-            encoder_hidden_states = None
-
-            with torch.inference_mode():
-                encoder_batch_size = batch_size // settings.RECOGNITION_ENCODER_BATCH_DIVISOR
-                for z in range(0, batch_pixel_values.shape[0], encoder_batch_size):
-                    encoder_pixel_values = batch_pixel_values[
-                                           z:min(z + encoder_batch_size, batch_pixel_values.shape[0])]
-                    encoder_hidden_states_batch = self.model.encoder(pixel_values=encoder_pixel_values).last_hidden_state
-                    if encoder_hidden_states is None:
-                        encoder_hidden_states = encoder_hidden_states_batch
-                    else:
-                        encoder_hidden_states = torch.cat([encoder_hidden_states, encoder_hidden_states_batch], dim=0)
-
-                text_encoder_input_ids = torch.arange(
-                    self.model.text_encoder.config.query_token_count,
-                    device=encoder_hidden_states.device,
-                    dtype=torch.long
-                ).unsqueeze(0).expand(encoder_hidden_states.size(0), -1)
-
-                encoder_text_hidden_states = self.model.text_encoder(
-                    input_ids=text_encoder_input_ids,
-                    cache_position=None,
-                    attention_mask=None,
-                    encoder_hidden_states=encoder_hidden_states,
-                    encoder_attention_mask=None,
-                    use_cache=False
-                ).hidden_states
-                del encoder_hidden_states
-
-                if settings.RECOGNITION_STATIC_CACHE:
-                    # Pad inputs to max batch size for static cache
-                    encoder_text_hidden_states = self.pad_to_batch_size(encoder_text_hidden_states, batch_size)
-                    batch_decoder_input = self.pad_to_batch_size(batch_decoder_input, batch_size)
-
-                while token_count < settings.RECOGNITION_MAX_TOKENS - 1:
-                    is_prefill = token_count == 0
-                    # TODO: add attention mask
-                    return_dict = self.model.decoder(
-                        input_ids=batch_decoder_input,
-                        encoder_hidden_states=encoder_text_hidden_states,
-                        cache_position=decoder_position_ids,
-                        use_cache=True,
-                        prefill=is_prefill
-                    )
-
-                    decoder_position_ids = decoder_position_ids[-1:] + 1
-                    logits = return_dict["logits"][:current_batch_size]  # Ignore batch padding
-
-                    preds = torch.argmax(logits[:, -1], dim=-1)
-                    scores = torch.max(F.softmax(logits[:, -1], dim=-1), dim=-1).values.unsqueeze(1)
-                    done = (preds == self.processor.tokenizer.eos_id) | (preds == self.processor.tokenizer.pad_id)
-                    all_done = all_done | done
-
-                    if is_prefill:
-                        sequence_scores = scores
-                    else:
-                        scores = scores.masked_fill(all_done, 0)
-                        sequence_scores = torch.cat([sequence_scores, scores], dim=1)
-
-                    if all_done.all():
-                        break
-
-                    batch_decoder_input = preds.unsqueeze(1)
-
-                    for j, (pred, status) in enumerate(zip(preds, all_done)):
-                        if not status:
-                            batch_predictions[j].append(int(pred))
-
-                    token_count += inference_token_count
-                    inference_token_count = batch_decoder_input.shape[-1]
-                    max_position_id = torch.max(decoder_position_ids).item()
-                    decoder_position_ids = torch.ones_like(batch_decoder_input[0, :], dtype=torch.int64,
-                                                           device=self.model.device).cumsum(0) - 1 + max_position_id
-
-                    if settings.RECOGNITION_STATIC_CACHE:
-                        batch_decoder_input = self.pad_to_batch_size(batch_decoder_input, batch_size)
-
-            sequence_scores = torch.sum(sequence_scores, dim=-1) / torch.sum(sequence_scores != 0, dim=-1)
-            detected_text = self.processor.tokenizer.batch_decode(batch_predictions)
-            detected_text = [truncate_repetitions(dt) for dt in detected_text]
-
-            # Convert sequence_scores to list for the current batch
-            batch_confidences = sequence_scores.tolist()
-
-            # Exclude padded results if real batch size is less than batch size
-            if settings.RECOGNITION_STATIC_CACHE:
-                detected_text = detected_text[:real_batch_size]
-                batch_confidences = batch_confidences[:real_batch_size]
+            for row, prediction, score, is_truncated in zip(rows, predictions, scores, truncated):
+                if is_truncated and bucket < len(bucket_budgets) - 1:
+                    # The length was underestimated, so the line is decoded again with the next bucket's budget
+                    bucket_rows[bucket + 1].append(row)
+                    continue
+                batch_predictions[row] = prediction
+                batch_scores[row] = score
+            finished = [idx for idx, is_truncated in enumerate(truncated) if not is_truncated]
+            self.update_length_stats([len(predictions[idx]) for idx in finished], [aspects[rows[idx]] for idx in finished])
+
+        decoded_text = self.processor.tokenizer.batch_decode([batch_predictions[row] for row in pending])
+        for row, text in zip(pending, decoded_text):
+            scores = batch_scores[row]
+            cached[row] = (truncate_repetitions(text), sum(scores) / len(scores))
+        if self.result_cache is not None:
+            self.result_cache.put_many({line_keys[row]: cached[row] for row in pending})
+
+        output_text = [cached[row][0] for row in source_rows]
+        confidences = [cached[row][1] for row in source_rows]
+        return output_text, confidences
+
+    @staticmethod
+    def line_hash(image: np.ndarray, language: List[str] | None) -> bytes:
+        digest = hashlib.blake2b(repr((image.shape, image.dtype.str, language)).encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.digest()
+
+    @staticmethod
+    def get_bucket_budgets() -> List[int]:
+        budgets = sorted(set(budget for budget in settings.RECOGNITION_LENGTH_BUCKETS if budget < settings.RECOGNITION_MAX_TOKENS))
+        return budgets + [settings.RECOGNITION_MAX_TOKENS]
+
+    @staticmethod
+    def line_aspect(image: np.ndarray) -> float:
+        # Tall lines are rotated before recognition, so the long side is the text direction
+        height, width = image.shape[:2]
+        return max(height, width) / max(min(height, width), 1)
+
+    def get_bucket(self, aspect: float, language: List[str] | None, bucket_budgets: List[int]) -> int:
+        recognized_tokens, recognized_aspect = self.length_stats
+        tokens_per_aspect = settings.RECOGNITION_TOKENS_PER_ASPECT
+        if recognized_aspect > 0:
+            tokens_per_aspect = recognized_tokens / recognized_aspect
+
+        # The budget counts cache positions, so it also holds the prefix (the start token and one token per language)
+        # and the stop token
+        special_token_count = 2 + len(language or [])
+        predicted_length = aspect * tokens_per_aspect * settings.RECOGNITION_BUCKET_MARGIN + special_token_count
+        for bucket, budget in enumerate(bucket_budgets):
+            if predicted_length <= budget:
+                return bucket
+        return len(bucket_budgets) - 1
+
+    def update_length_stats(self, token_counts: List[int], aspects: List[float]):
+        recognized_tokens, recognized_aspect = self.length_stats
+        self.length_stats = (recognized_tokens + sum(token_counts), recognized_aspect + sum(aspects))
+
+    def continuous_decode(
+            self,
+            images: List[np.ndarray],
+            languages: List[List[str] | None],
+            batch_size: int,
+            max_tokens: int | None = None
+    ) -> Tuple[List[List[int]], List[List[float]], List[bool]]:
+        """
+        Decodes all lines with a continuous batching scheduler.  Finished lines are evicted from the decoder cache,
+        and pending lines are prefilled and admitted into the free batch slots while decoding continues.
+        With a static cache, slots are fixed and overwritten in place.  With a dynamic cache, the batch is compacted,
+        and a validity mask covers cache positions that don't belong to a row.
+        Lines stop at max_tokens cache positions, and are flagged as truncated if they hit it before a stop token.
+
+        Tokens, scores and finished flags are kept on the device.  The host only reads which slots finished every
+        DECODE_SYNC_STEPS steps, to schedule the batch, and copies the outputs once at the end.
+        """
+        static_cache = settings.RECOGNITION_STATIC_CACHE
+        if max_tokens is None:
+            max_tokens = settings.RECOGNITION_MAX_TOKENS
+        max_cache_length = min(max_tokens, settings.RECOGNITION_MAX_TOKENS) - 1
+        min_admit = max(1, int(batch_size * settings.RECOGNITION_MIN_ADMIT_FRACTION))
+        sync_steps = max(1, settings.DECODE_SYNC_STEPS)
+        eos_id, pad_id = self.processor.tokenizer.eos_id, self.processor.tokenizer.pad_id
+        device = self.model.device
+        decoder = self.model.decoder
+        engine = self.decode_engine if static_cache and self.decode_engine is not None else None
+        if engine is not None and batch_size > engine.max_batch_size:
+            engine = None
+        bucket = batch_size
+
+        # Outputs per line, with an extra row that free slots write to, so writes never need a mask on the host
+        line_count = len(images)
+        tokens = torch.full((line_count + 1, max_cache_length + 1), pad_id, dtype=torch.long, device=device)
+        scores = torch.zeros((line_count + 1, max_cache_length + 1), dtype=torch.float32, device=device)
+        token_counts = torch.zeros(line_count + 1, dtype=torch.long, device=device)
+        truncated = torch.zeros(line_count + 1, dtype=torch.bool, device=device)
+
+        # Line index held by each batch slot as the host last saw it (-1 if the slot is free).  On the device, the line
+        # of each slot, its number of cache positions, and whether it is still decoding.
+        slot_rows = [-1] * batch_size if static_cache else []
+        slot_lines = torch.full((len(slot_rows),), line_count, dtype=torch.long, device=device)
+        slot_lengths = torch.zeros(len(slot_rows), dtype=torch.long, device=device)
+        slot_live = torch.zeros(len(slot_rows), dtype=torch.bool, device=device)
+        last_tokens = torch.full((len(slot_rows),), pad_id, dtype=torch.long, device=device)
+        valid_positions = torch.zeros((0, 0), dtype=torch.bool, device=device)  # Only used with a dynamic cache
+        encoder_text_hidden_states = None
+        next_row = 0
+
+        progress = tqdm(total=line_count, desc="Recognizing Text")
+
+        def record_outputs(slots, logits, is_prefill):
+            logits = logits.float()
+            preds = torch.argmax(logits, dim=-1)
+            # The max softmax probability, without materializing the softmax
+            pred_scores = torch.exp(logits.max(dim=-1).values - torch.logsumexp(logits, dim=-1))
+
+            lines, live = slot_lines[slots], slot_live[slots]
+            done = (preds == eos_id) | (preds == pad_id)
+            positions = token_counts[lines]
+            write_token = live & ~done
+            write_score = live & (~done | is_prefill)
+            tokens[lines, positions] = torch.where(write_token, preds, tokens[lines, positions])
+            scores[lines, positions] = torch.where(write_score, pred_scores, scores[lines, positions])
+            token_counts[lines] = positions + write_token.long()
+
+            ended = live & (done | (slot_lengths[slots] >= max_cache_length))
+            truncated[lines] = truncated[lines] | (ended & ~done)
+            slot_live[slots] = live & ~ended
+            return preds
+
+        def sync():
+            live = slot_live.tolist()
+            for slot, row in enumerate(slot_rows):
+                if row >= 0 and not live[slot]:
+                    slot_rows[slot] = -1
+                    progress.update(1)
+
+        def evict():
+            nonlocal slot_rows, slot_lines, slot_lengths, slot_live, last_tokens, valid_positions, encoder_text_hidden_states
+            keep = [i for i, row in enumerate(slot_rows) if row >= 0]
+            keep_idxs = torch.tensor(keep, dtype=torch.long, device=device)
+            valid_positions = valid_positions[keep_idxs]
+            columns = valid_positions.any(dim=0).nonzero().squeeze(1)
+            valid_positions = valid_positions[:, columns]
+            decoder.model._select_cache_rows(keep_idxs, columns)
+            encoder_text_hidden_states = encoder_text_hidden_states[keep_idxs]
+            last_tokens = last_tokens[keep_idxs]
+            slot_lines, slot_lengths, slot_live = slot_lines[keep_idxs], slot_lengths[keep_idxs], slot_live[keep_idxs]
+            slot_rows = [slot_rows[i] for i in keep]
+
+        def admit(admit_count):
+            nonlocal next_row, slot_lines, slot_lengths, slot_live, last_tokens, valid_positions, encoder_text_hidden_states
+            rows = list(range(next_row, next_row + admit_count))
+            next_row += admit_count
+
+            # Prefill the new lines in their own cache, then merge it into the running one
+            current_cache = decoder.model._save_cache()
+            new_hidden_states, logits, prefix_length = self.prefill(
+                [images[r] for r in rows],
+                [languages[r] for r in rows],
+                batch_size,
+                engine=engine
+            )
+            new_cache = decoder.model._get_cache()
+            decoder.model._restore_cache(current_cache)
+            new_hidden_states = new_hidden_states[:admit_count]
+
+            if engine is not None:
+                # Free slots are filled lowest first, so the decode step can run at the smallest bucket holding them
+                slots = [i for i, row in enumerate(slot_rows) if row < 0][:admit_count]
+                slot_idxs = torch.tensor(slots, dtype=torch.long, device=device)
+                engine.insert_rows(new_cache, slot_idxs)
+            elif static_cache:
+                slots = [i for i, row in enumerate(slot_rows) if row < 0][:admit_count]
+                slot_idxs = torch.tensor(slots, dtype=torch.long, device=device)
+                decoder.model._insert_cache_rows(new_cache, slot_idxs, batch_size)
+                if encoder_text_hidden_states is None:
+                    encoder_text_hidden_states = new_hidden_states.new_zeros((batch_size, *new_hidden_states.shape[1:]))
+                encoder_text_hidden_states[slot_idxs] = new_hidden_states
+            else:
+                slots = list(range(len(slot_rows), len(slot_rows) + admit_count))
+                slot_idxs = torch.tensor(slots, dtype=torch.long, device=device)
+                slot_rows.extend([-1] * admit_count)
+                slot_lines = F.pad(slot_lines, (0, admit_count), value=line_count)
+                slot_lengths = F.pad(slot_lengths, (0, admit_count))
+                slot_live = F.pad(slot_live, (0, admit_count))
+                decoder.model._append_cache_rows(new_cache)
+                if encoder_text_hidden_states is None:
+                    encoder_text_hidden_states = new_hidden_states
+                else:
+                    encoder_text_hidden_states = torch.cat([encoder_text_hidden_states, new_hidden_states], dim=0)
+
+                seq_len = max(valid_positions.shape[1], prefix_length)
+                new_valid = (torch.arange(seq_len, device=device) < prefix_length).unsqueeze(0).expand(admit_count, -1)
+                valid_positions = F.pad(valid_positions, (0, seq_len - valid_positions.shape[1]))
+                valid_positions = torch.cat([valid_positions, new_valid], dim=0)
+                last_tokens = torch.cat([last_tokens, last_tokens.new_zeros(admit_count)])
+
+            for slot, row in zip(slots, rows):
+                slot_rows[slot] = row
+            slot_lines[slot_idxs] = torch.tensor(rows, dtype=torch.long, device=device)
+            slot_lengths[slot_idxs] = prefix_length
+            slot_live[slot_idxs] = True
+            last_tokens[slot_idxs] = record_outputs(slot_idxs, logits, is_prefill=True)
+
+        if engine is None:
+            decoder.model._setup_cache(self.model.config, batch_size, device, self.model.dtype)
+        with torch.inference_mode():
+            step = 0
+            while True:
+                if step % sync_steps == 0:
+                    sync()
+                    active_count = sum(row >= 0 for row in slot_rows)
+                    inactive_count = len(slot_rows) - active_count
+                    if next_row < line_count and (batch_size - active_count >= min_admit or active_count == 0):
+                        if not static_cache and inactive_count > 0:
+                            evict()
+                        admit(min(batch_size - active_count, line_count - next_row))
+                    elif not static_cache and inactive_count >= min_admit:
+                        evict()
+
+                    if all(row < 0 for row in slot_rows):
+                        if next_row >= line_count:
+                            break
+                        continue
+
+                    if engine is not None:
+                        bucket = engine.bucket(max(i for i, row in enumerate(slot_rows) if row >= 0) + 1)
+
+                if engine is not None:
+                    logits = engine.step(last_tokens, slot_lengths, bucket)
+                    slot_lengths = slot_lengths + slot_live.long()
+                    last_tokens[:bucket] = record_outputs(torch.arange(bucket, device=device), logits, is_prefill=False)
+                    step += 1
+                    continue
+
+                attention_mask = None
+                if not static_cache:
+                    # The static cache attends over all of its (zero-initialized) positions, like the prefill does
+                    valid_positions = F.pad(valid_positions, (0, 1), value=True)
+                    attention_mask = valid_positions.to(torch.long)
+
+                return_dict = decoder(
+                    input_ids=last_tokens.unsqueeze(1),
+                    encoder_hidden_states=encoder_text_hidden_states,
+                    cache_position=slot_lengths.unsqueeze(1),
+                    attention_mask=attention_mask,
+                    use_cache=True,
+                    prefill=False
+                )
 
-            output_text.extend(detected_text)
-            confidences.extend(batch_confidences)
+                slot_lengths = slot_lengths + slot_live.long()
+                all_slots = torch.arange(len(slot_rows), device=device)
+                last_tokens = record_outputs(all_slots, return_dict["logits"][:, -1], is_prefill=False)
+                step += 1
 
-            del encoder_text_hidden_states
+        progress.close()
+        del encoder_text_hidden_states
 
-        output_text = sorted(zip(indices, output_text), key=lambda x: x[0])
-        confidences = sorted(zip(indices, confidences), key=lambda x: x[0])
-        output_text = [text for _, text in output_text]
-        confidences = [conf for _, conf in confidences]
-        return output_text, confidences
\ No newline at end of file
+        # The only copy of the outputs to the host
+        token_counts, truncated = token_counts.tolist(), truncated.tolist()
+        tokens, scores = tokens.tolist(), scores.tolist()
+        batch_predictions = [tokens[row][:token_counts[row]] for row in range(line_count)]
+        batch_scores = [scores[row][:max(token_counts[row], 1)] for row in range(line_count)]
+        return batch_predictions, batch_scores, truncated[:line_count]
@@ -34,20 +34,7 @@ class RecognitionModelLoader(ModelLoader):
         if dtype is None:
             dtype = settings.MODEL_DTYPE
 
-        config = SuryaOCRConfig.from_pretrained(self.checkpoint, revision=self.revision)
-        decoder_config = config.decoder
-        decoder = SuryaOCRDecoderConfig(**decoder_config)
-        config.decoder = decoder
-
-        encoder_config = config.encoder
-        encoder = DonutSwinConfig(**encoder_config)
-        config.encoder = encoder
-
-        text_encoder_config = config.text_encoder
-        text_encoder = SuryaOCRTextEncoderConfig(**text_encoder_config)
-        config.text_encoder = text_encoder
-
-        model = OCREncoderDecoderModel.from_pretrained(self.checkpoint, config=config, torch_dtype=dtype, revision=self.revision)
+        model = self.load_pretrained(OCREncoderDecoderModel, self.config, dtype)
         model = model.to(device)
         model = model.eval()
 
@@ -57,13 +44,28 @@ class RecognitionModelLoader(ModelLoader):
             torch._dynamo.config.suppress_errors = False
 
             print(f"Compiling recognition model {self.checkpoint} on device {device} with dtype {dtype}")
+            # The decoder is compiled one decode step at a time, by the predictor's decode engine
             model.encoder = torch.compile(model.encoder)
-            model.decoder = torch.compile(model.decoder)
             model.text_encoder = torch.compile(model.text_encoder)
 
         print(f"Loaded recognition model {self.checkpoint} on device {device} with dtype {dtype}")
         return model
 
+    def config(self, path: Optional[str] = None) -> SuryaOCRConfig:
+        config = SuryaOCRConfig.from_pretrained(path or self.checkpoint, revision=self.revision)
+        decoder_config = config.decoder
+        decoder = SuryaOCRDecoderConfig(**decoder_config)
+        config.decoder = decoder
+
+        encoder_config = config.encoder
+        encoder = DonutSwinConfig(**encoder_config)
+        config.encoder = encoder
+
+        text_encoder_config = config.text_encoder
+        text_encoder = SuryaOCRTextEncoderConfig(**text_encoder_config)
+        config.text_encoder = text_encoder
+        return config
+
     def processor(self) -> SuryaProcessor:
-        return SuryaProcessor(self.checkpoint, self.revision)
+        return self.load_cached_processor(lambda path: SuryaProcessor(path, self.revision))
 
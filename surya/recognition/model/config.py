@@ -11,6 +11,9 @@ class SuryaOCRConfig(PretrainedConfig):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        if "encoder" not in kwargs or "decoder" not in kwargs:
+            # A ValueError, like VisionEncoderDecoderConfig, so save_pretrained knows there is no default config
+            raise ValueError("SuryaOCRConfig needs both encoder and decoder configs")
 
         encoder_config = kwargs.pop("encoder")
         decoder_config = kwargs.pop("decoder")
@@ -0,0 +1,108 @@
+from typing import List
+
+from PIL import Image
+
+from surya.common.polygon import PolygonBox
+from surya.detection import DetectionPredictor
+from surya.input.processing import convert_if_not_rgb
+from surya.input.text_layer import PageTextLayer
+from surya.layout import LayoutPredictor
+from surya.layout.schema import LayoutResult
+from surya.ocr_error import OCRErrorPredictor
+from surya.recognition import RecognitionPredictor
+from surya.recognition.schema import OCRResult
+from surya.settings import settings
+
+
+def region_bboxes(layout_result: LayoutResult, image_size, labels: List[str], margin: float = settings.OCR_REGION_MARGIN) -> List[List[int]]:
+    # The layout boxes with the selected labels, padded a little so text at their edges isn't cut off
+    width, height = image_size
+    x_margin, y_margin = width * margin, height * margin
+    regions = []
+    for box in layout_result.bboxes:
+        if box.label not in labels:
+            continue
+        x0, y0, x1, y1 = box.bbox
+        regions.append([
+            max(0, int(x0 - x_margin)),
+            max(0, int(y0 - y_margin)),
+            min(width, int(x1 + x_margin + 1)),
+            min(height, int(y1 + y_margin + 1))
+        ])
+    return regions
+
+
+def mask_regions(image: Image.Image, regions: List[List[int]]) -> Image.Image:
+    # Everything outside the regions is blanked out, so the detector finds no lines there
+    masked = Image.new("RGB", image.size, (255, 255, 255))
+    for region in regions:
+        masked.paste(image.crop(region), region[:2])
+    return masked
+
+
+def in_regions(box: PolygonBox, regions: List[List[int]]) -> bool:
+    # Lines that straddle a region edge belong to the region their center is in
+    x0, y0, x1, y1 = box.bbox
+    center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    return any(region[0] <= center_x <= region[2] and region[1] <= center_y <= region[3] for region in regions)
+
+
+def ocr_regions(
+        images: List[Image.Image],
+        langs: List[List[str] | None],
+        layout_predictor: LayoutPredictor,
+        det_predictor: DetectionPredictor,
+        rec_predictor: RecognitionPredictor,
+        highres_images: List[Image.Image] | None = None,
+        labels: List[str] | None = None,
+        layout_results: List[LayoutResult] | None = None,
+        detection_batch_size: int | None = None,
+        recognition_batch_size: int | None = None,
+        text_layers: List[PageTextLayer | None] | None = None,
+        ocr_error_predictor: OCRErrorPredictor | None = None
+) -> List[OCRResult]:
+    """
+    OCRs only the text inside layout regions with the given labels, such as text and tables but not pictures or
+    page headers.  Layout runs first, unless layout_results are passed in.  Detection only runs on pages that have a
+    selected region, with everything outside the regions masked out, and only the lines in the regions are
+    recognized, cropped from the highres images.  The results are in page coordinates, like RecognitionPredictor's.
+    """
+    assert len(images) == len(langs), "You need to pass in one list of languages for each image"
+    if labels is None:
+        labels = settings.OCR_REGION_LABELS
+    images = convert_if_not_rgb(images)
+    highres_images = convert_if_not_rgb(highres_images) if highres_images is not None else [None] * len(images)
+    if text_layers is None:
+        text_layers = [None] * len(images)
+
+    if layout_results is None:
+        layout_results = layout_predictor(images)
+    page_regions = [region_bboxes(layout_result, image.size, labels) for layout_result, image in zip(layout_results, images)]
+
+    # Pages without any selected region skip detection and recognition entirely
+    selected = [idx for idx, regions in enumerate(page_regions) if regions]
+    det_predictions = []
+    if selected:
+        det_predictions = det_predictor([mask_regions(images[idx], page_regions[idx]) for idx in selected], batch_size=detection_batch_size)
+    for idx, det_pred in zip(selected, det_predictions):
+        det_pred.bboxes = [box for box in det_pred.bboxes if in_regions(box, page_regions[idx])]
+
+    selected_images = [images[idx] for idx in selected]
+    selected_langs = [langs[idx] for idx in selected]
+    flat = rec_predictor.slice_detections(det_predictions, selected_images, selected_langs, [highres_images[idx] for idx in selected])
+    rec_predictions, confidence_scores = rec_predictor.recognize_slices(
+        selected_images,
+        flat,
+        [text_layers[idx] for idx in selected],
+        ocr_error_predictor,
+        batch_size=recognition_batch_size
+    )
+    selected_results = rec_predictor.assemble_results(selected_images, selected_langs, flat, rec_predictions, confidence_scores)
+
+    results = [
+        OCRResult(text_lines=[], languages=lang, image_bbox=[0, 0, image.size[0], image.size[1]])
+        for image, lang in zip(images, langs)
+    ]
+    for idx, result in zip(selected, selected_results):
+        results[idx] = result
+    return results
@@ -1,8 +1,6 @@
 from typing import Optional, List
 
-from pydantic import BaseModel
-
-from surya.common.polygon import PolygonBox
+from surya.common.polygon import PolygonBatchResult, PolygonBox
 
 
 class TextLine(PolygonBox):
@@ -10,7 +8,9 @@ class TextLine(PolygonBox):
     confidence: Optional[float] = None
 
 
-class OCRResult(BaseModel):
+class OCRResult(PolygonBatchResult):
+    batch_field = "text_lines"
+
     text_lines: List[TextLine]
     languages: List[str] | None = None
     image_bbox: List[float]
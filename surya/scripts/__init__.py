@@ -1,5 +1,16 @@
-from surya.scripts.detect_layout import detect_layout_cli
-from surya.scripts.detect_text import detect_text_cli
-from surya.scripts.run_streamlit_app import streamlit_app_cli
-from surya.scripts.ocr_text import ocr_text_cli
-from surya.scripts.table_recognition import table_recognition_cli
\ No newline at end of file
+import importlib
+
+# The CLI entry points import their script module only, instead of every script and the models they use
+CLI_MODULES = {
+    "detect_layout_cli": "surya.scripts.detect_layout",
+    "detect_text_cli": "surya.scripts.detect_text",
+    "streamlit_app_cli": "surya.scripts.run_streamlit_app",
+    "ocr_text_cli": "surya.scripts.ocr_text",
+    "table_recognition_cli": "surya.scripts.table_recognition",
+}
+
+
+def __getattr__(name: str):
+    if name in CLI_MODULES:
+        return getattr(importlib.import_module(CLI_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
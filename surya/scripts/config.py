@@ -1,8 +1,13 @@
-from typing import List
+from collections import defaultdict
+from typing import Iterator, List, Tuple
 
 import click
+import json
 import os
-from surya.input.load import load_from_folder, load_from_file
+from PIL import Image
+
+from surya.input.load import iter_page_chunks, iter_pages
+from surya.input.pages import PageSource, load_pages_from_file, load_pages_from_folder
 from surya.settings import settings
 
 
@@ -16,6 +21,7 @@ class CLILoader:
         self.save_images = cli_options.get("images", False)
         self.debug = cli_options.get("debug", False)
         self.output_dir = cli_options.get("output_dir")
+        self.workers = cli_options.get("workers", 1)
 
         self.load(highres)
 
@@ -26,29 +32,78 @@ class CLILoader:
         fn = click.option("--page_range", type=str, default=None, help="Page range to convert, specify comma separated page numbers or ranges.  Example: 0,5-10,20")(fn)
         fn = click.option("--images", is_flag=True, help="Save images of detected bboxes.", default=False)(fn)
         fn = click.option('--debug', '-d', is_flag=True, help='Enable debug mode.', default=False)(fn)
+        fn = click.option("--workers", type=int, default=1, help="Number of worker processes, each with its own models and share of the cores or GPUs.")(fn)
         return fn
 
     def load(self, highres: bool = False):
-        highres_images = None
+        # PDF pages are rendered once at the highest resolution needed, and only when an image is first requested
+        render_dpi = settings.IMAGE_DPI_HIGHRES if highres else settings.IMAGE_DPI
         if os.path.isdir(self.filepath):
-            images, names = load_from_folder(self.filepath, self.page_range)
+            pages = load_pages_from_folder(self.filepath, self.page_range, render_dpi)
             folder_name = os.path.basename(self.filepath)
-            if highres:
-                highres_images, _ = load_from_folder(self.filepath, self.page_range, settings.IMAGE_DPI_HIGHRES)
         else:
-            images, names = load_from_file(self.filepath, self.page_range)
+            pages = load_pages_from_file(self.filepath, self.page_range, render_dpi)
             folder_name = os.path.basename(self.filepath).split(".")[0]
-            if highres:
-                highres_images, _ = load_from_file(self.filepath, self.page_range, settings.IMAGE_DPI_HIGHRES)
 
+        # Files can share a name, like scan.pdf and scan.png, and their results go under the same key.  Their pages are
+        # grouped at the first one, keeping their order, so every name's pages are contiguous for ResultWriter.
+        name_order = {}
+        for page in pages:
+            name_order.setdefault(page.name, len(name_order))
+        pages = sorted(pages, key=lambda page: name_order[page.name])
+
+        self.pages = pages
+        self.highres = highres
+        self.names = [page.name for page in pages]
 
-        self.images = images
-        self.highres_images = highres_images
-        self.names = names
+        # 1-indexed page number of every page within its file
+        page_counts = defaultdict(int)
+        self.page_numbers = []
+        for name in self.names:
+            page_counts[name] += 1
+            self.page_numbers.append(page_counts[name])
 
         self.result_path = os.path.abspath(os.path.join(self.output_dir, folder_name))
         os.makedirs(self.result_path, exist_ok=True)
 
+    @property
+    def images(self) -> List[Image.Image]:
+        return [page.image(settings.IMAGE_DPI) for page in self.pages]
+
+    @property
+    def highres_images(self) -> List[Image.Image] | None:
+        if not self.highres:
+            return None
+        return [page.image(settings.IMAGE_DPI_HIGHRES) for page in self.pages]
+
+    @property
+    def dpis(self) -> List[int]:
+        return [settings.IMAGE_DPI, settings.IMAGE_DPI_HIGHRES] if self.highres else [settings.IMAGE_DPI]
+
+    def iter_images(self, page_idxs: List[int] | None = None) -> Iterator[Tuple[Image.Image, Image.Image | None]]:
+        # One (image, highres image) pair per page, for consumers that batch pages themselves
+        for page, images in iter_pages(self.select_pages(page_idxs), self.dpis):
+            yield images[0], images[1] if self.highres else None
+
+    def iter_chunks(self, chunk_size: int | None = None, page_idxs: List[int] | None = None) -> Iterator[Tuple[List[int], List[Image.Image], List[Image.Image] | None]]:
+        """
+        Yields (page indices, images, highres images) for chunks of pages, rasterizing the next pages in the background.
+        Only the chunk being processed and the prefetched pages are held in memory.
+        """
+        if page_idxs is None:
+            page_idxs = list(range(len(self.pages)))
+
+        start = 0
+        for pages, images in iter_page_chunks(self.select_pages(page_idxs), self.dpis, chunk_size):
+            highres_images = images[1] if self.highres else None
+            yield page_idxs[start:start + len(pages)], images[0], highres_images
+            start += len(pages)
+
+    def select_pages(self, page_idxs: List[int] | None = None) -> List[PageSource]:
+        if page_idxs is None:
+            return self.pages
+        return [self.pages[idx] for idx in page_idxs]
+
     @staticmethod
     def parse_range_str(range_str: str) -> List[int]:
         range_lst = range_str.split(",")
@@ -60,4 +115,37 @@ class CLILoader:
             else:
                 page_lst.append(int(i))
         page_lst = sorted(list(set(page_lst)))  # Deduplicate page numbers and sort in order
-        return page_lst
\ No newline at end of file
+        return page_lst
+
+
+class ResultWriter:
+    """
+    Writes results.json page by page as results come in, instead of holding every result until the end.
+    The output is the same JSON object of file name -> list of results.  CLILoader keeps the pages of each name
+    contiguous, even across files that share a name, so each name's list is closed before the next one starts.
+    """
+    def __init__(self, result_path: str):
+        self.path = os.path.join(result_path, "results.json")
+        self.file = None
+        self.current_name = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w+", encoding="utf-8")
+        self.file.write("{")
+        return self
+
+    def write(self, name: str, result: dict):
+        if name != self.current_name:
+            if self.current_name is not None:
+                self.file.write("], ")
+            self.file.write(json.dumps(name, ensure_ascii=False) + ": [")
+            self.current_name = name
+        else:
+            self.file.write(", ")
+        self.file.write(json.dumps(result, ensure_ascii=False))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.current_name is not None:
+            self.file.write("]")
+        self.file.write("}")
+        self.file.close()
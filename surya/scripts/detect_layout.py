@@ -1,41 +1,47 @@
 import time
 import click
 import copy
-import json
-from collections import defaultdict
 
 from surya.layout import LayoutPredictor
 from surya.debug.draw import draw_polys_on_image
-from surya.scripts.config import CLILoader
+from surya.scripts.config import CLILoader, ResultWriter
+from surya.scripts.parallel import PageTask, iter_results
 import os
 
+
+class DetectLayoutTask(PageTask):
+    def load(self):
+        self.layout_predictor = LayoutPredictor()
+
+    def run(self, page_idxs):
+        loader = self.loader
+        for page_idxs, images, _ in loader.iter_chunks(page_idxs=page_idxs):
+            layout_predictions = self.layout_predictor(images)
+
+            for idx, image, layout_pred in zip(page_idxs, images, layout_predictions):
+                name = loader.names[idx]
+                if loader.save_images:
+                    polygons = [p.polygon for p in layout_pred.bboxes]
+                    labels = [f"{p.label}-{p.position}" for p in layout_pred.bboxes]
+                    bbox_image = draw_polys_on_image(polygons, copy.deepcopy(image), labels=labels)
+                    bbox_image.save(os.path.join(loader.result_path, f"{name}_{idx}_layout.png"))
+
+                out_pred = layout_pred.model_dump()
+                out_pred["page"] = loader.page_numbers[idx]
+                yield idx, out_pred
+
+
 @click.command(help="Detect layout of an input file or folder (PDFs or image).")
 @CLILoader.common_options
 def detect_layout_cli(input_path: str, **kwargs):
     loader = CLILoader(input_path, kwargs)
 
-    layout_predictor = LayoutPredictor()
-
     start = time.time()
-    layout_predictions = layout_predictor(loader.images)
+    with ResultWriter(loader.result_path) as writer:
+        for idx, out_pred in iter_results(DetectLayoutTask(loader), loader.workers):
+            writer.write(loader.names[idx], out_pred)
 
     if loader.debug:
         print(f"Layout took {time.time() - start} seconds")
 
-    if loader.images:
-        for idx, (image, layout_pred, name) in enumerate(zip(loader.images, layout_predictions, loader.names)):
-            polygons = [p.polygon for p in layout_pred.bboxes]
-            labels = [f"{p.label}-{p.position}" for p in layout_pred.bboxes]
-            bbox_image = draw_polys_on_image(polygons, copy.deepcopy(image), labels=labels)
-            bbox_image.save(os.path.join(loader.result_path, f"{name}_{idx}_layout.png"))
-
-    predictions_by_page = defaultdict(list)
-    for idx, (pred, name, image) in enumerate(zip(layout_predictions, loader.names, loader.images)):
-        out_pred = pred.model_dump()
-        out_pred["page"] = len(predictions_by_page[name]) + 1
-        predictions_by_page[name].append(out_pred)
-
-    with open(os.path.join(loader.result_path, "results.json"), "w+", encoding="utf-8") as f:
-        json.dump(predictions_by_page, f, ensure_ascii=False)
-
-    print(f"Wrote results to {loader.result_path}")
\ No newline at end of file
+    print(f"Wrote results to {loader.result_path}")
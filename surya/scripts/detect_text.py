@@ -1,44 +1,53 @@
 import click
 import copy
-import json
 import time
-from collections import defaultdict
 
 from surya.detection import DetectionPredictor
 from surya.debug.draw import draw_polys_on_image
-from surya.scripts.config import CLILoader
+from surya.scripts.config import CLILoader, ResultWriter
+from surya.scripts.parallel import PageTask, iter_results
 import os
 
+
+class DetectTextTask(PageTask):
+    def load(self):
+        self.det_predictor = DetectionPredictor()
+
+    def close(self):
+        self.det_predictor.close()
+
+    def run(self, page_idxs):
+        loader = self.loader
+        for page_idxs, images, _ in loader.iter_chunks(page_idxs=page_idxs):
+            predictions = self.det_predictor(images, include_maps=loader.debug)
+
+            for idx, image, pred in zip(page_idxs, images, predictions):
+                name = loader.names[idx]
+                if loader.save_images:
+                    polygons = [p.polygon for p in pred.bboxes]
+                    bbox_image = draw_polys_on_image(polygons, copy.deepcopy(image))
+                    bbox_image.save(os.path.join(loader.result_path, f"{name}_{idx}_bbox.png"))
+
+                    if loader.debug:
+                        heatmap = pred.heatmap
+                        heatmap.save(os.path.join(loader.result_path, f"{name}_{idx}_heat.png"))
+
+                out_pred = pred.model_dump(exclude=["heatmap", "affinity_map"])
+                out_pred["page"] = loader.page_numbers[idx]
+                yield idx, out_pred
+
+
 @click.command(help="Detect bboxes in an input file or folder (PDFs or image).")
 @CLILoader.common_options
 def detect_text_cli(input_path: str, **kwargs):
     loader = CLILoader(input_path, kwargs)
 
-    det_predictor = DetectionPredictor()
-
     start = time.time()
-    predictions = det_predictor(loader.images, include_maps=loader.debug)
-    end = time.time()
-    if loader.debug:
-        print(f"Detection took {end - start} seconds")
-
-    if loader.images:
-        for idx, (image, pred, name) in enumerate(zip(loader.images, predictions, loader.names)):
-            polygons = [p.polygon for p in pred.bboxes]
-            bbox_image = draw_polys_on_image(polygons, copy.deepcopy(image))
-            bbox_image.save(os.path.join(loader.result_path, f"{name}_{idx}_bbox.png"))
+    with ResultWriter(loader.result_path) as writer:
+        for idx, out_pred in iter_results(DetectTextTask(loader), loader.workers):
+            writer.write(loader.names[idx], out_pred)
 
-            if loader.debug:
-                heatmap = pred.heatmap
-                heatmap.save(os.path.join(loader.result_path, f"{name}_{idx}_heat.png"))
-
-    predictions_by_page = defaultdict(list)
-    for idx, (pred, name, image) in enumerate(zip(predictions, loader.names, loader.images)):
-        out_pred = pred.model_dump(exclude=["heatmap", "affinity_map"])
-        out_pred["page"] = len(predictions_by_page[name]) + 1
-        predictions_by_page[name].append(out_pred)
-
-    with open(os.path.join(loader.result_path, "results.json"), "w+", encoding="utf-8") as f:
-        json.dump(predictions_by_page, f, ensure_ascii=False)
+    if loader.debug:
+        print(f"Detection took {time.time() - start} seconds")
 
-    print(f"Wrote results to {loader.result_path}")
\ No newline at end of file
+    print(f"Wrote results to {loader.result_path}")
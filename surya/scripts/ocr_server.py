@@ -0,0 +1,29 @@
+import click
+
+from surya.detection import DetectionPredictor
+from surya.recognition import RecognitionPredictor
+from surya.server.app import make_server, ocr_pages
+from surya.server.batcher import PageBatcher
+from surya.settings import settings
+
+
+@click.command(help="Run an OCR server that keeps the models loaded, and batches pages across concurrent requests.")
+@click.option("--host", type=str, default="127.0.0.1", help="Host to listen on.")
+@click.option("--port", type=int, default=8000, help="Port to listen on.")
+@click.option("--socket", "socket_path", type=click.Path(), default=None, help="Listen on this UNIX socket instead of a port.")
+@click.option("--batch_pages", type=int, default=settings.SERVER_BATCH_PAGES, help="Max pages run through the models together.")
+@click.option("--max_wait", type=float, default=settings.SERVER_MAX_WAIT, help="Seconds a page waits for other pages to batch with.")
+def ocr_server_cli(host: str, port: int, socket_path: str | None, batch_pages: int, max_wait: float):
+    det_predictor = DetectionPredictor()
+    rec_predictor = RecognitionPredictor()
+
+    batcher = PageBatcher(ocr_pages(det_predictor, rec_predictor), batch_pages, max_wait)
+    server = make_server(batcher, host, port, socket_path)
+    print(f"Serving OCR on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
@@ -1,22 +1,109 @@
 import os
 import click
-import json
 import time
-from collections import defaultdict
+from itertools import tee
+from typing import List
 
 from surya.detection import DetectionPredictor
+from surya.layout import LayoutPredictor
 from surya.recognition.languages import replace_lang_with_code
 from surya.input.load import load_lang_file
+from surya.ocr_error import OCRErrorPredictor
 from surya.debug.text import draw_text_on_image
 from surya.recognition import RecognitionPredictor
-from surya.scripts.config import CLILoader
+from surya.recognition.regions import ocr_regions
+from surya.scripts.config import CLILoader, ResultWriter
+from surya.scripts.parallel import PageTask, iter_results
+from surya.settings import settings
+
+
+class OCRTextTask(PageTask):
+    def __init__(self, loader: CLILoader, image_langs: List[List[str] | None], text_layer: bool, region_labels: List[str] | None = None):
+        super().__init__(loader)
+        self.image_langs = image_langs
+        self.text_layer = text_layer
+        self.region_labels = region_labels
+
+    def load(self):
+        self.det_predictor = DetectionPredictor()
+        self.rec_predictor = RecognitionPredictor()
+        self.layout_predictor = LayoutPredictor() if self.region_labels else None
+
+        # Text layer lines the OCR error model flags as garbled are recognized too
+        self.ocr_error_predictor = OCRErrorPredictor() if self.text_layer else None
+
+    def close(self):
+        self.det_predictor.close()
+
+    def predict(self, page_idxs):
+        loader = self.loader
+        text_layers = None
+        if self.text_layer:
+            text_layers = (loader.pages[idx].text_layer() for idx in page_idxs)
+
+        # Pages are rasterized lazily, and stream pipelines detection with recognition
+        lowres_pages, highres_pages = tee(loader.iter_images(page_idxs))
+        images = (image for image, _ in lowres_pages)
+        highres_images = (highres_image for _, highres_image in highres_pages)
+
+        yield from self.rec_predictor.stream(
+            images,
+            [self.image_langs[idx] for idx in page_idxs],
+            det_predictor=self.det_predictor,
+            highres_images=highres_images,
+            text_layers=text_layers,
+            ocr_error_predictor=self.ocr_error_predictor
+        )
+
+    def predict_regions(self, page_idxs):
+        # Layout needs whole chunks of pages, so region mode runs chunk by chunk instead of streaming
+        loader = self.loader
+        for chunk_idxs, images, highres_images in loader.iter_chunks(page_idxs=page_idxs):
+            text_layers = [loader.pages[idx].text_layer() for idx in chunk_idxs] if self.text_layer else None
+            yield from ocr_regions(
+                images,
+                [self.image_langs[idx] for idx in chunk_idxs],
+                self.layout_predictor,
+                self.det_predictor,
+                self.rec_predictor,
+                highres_images=highres_images,
+                labels=self.region_labels,
+                text_layers=text_layers,
+                ocr_error_predictor=self.ocr_error_predictor
+            )
+
+    def run(self, page_idxs):
+        loader = self.loader
+        predictions = self.predict_regions(page_idxs) if self.region_labels else self.predict(page_idxs)
+        for idx, pred in zip(page_idxs, predictions):
+            name = loader.names[idx]
+            if loader.save_images:
+                bboxes = [l.bbox for l in pred.text_lines]
+                pred_text = [l.text for l in pred.text_lines]
+                image_size = [int(pred.image_bbox[2]), int(pred.image_bbox[3])]
+                page_image = draw_text_on_image(bboxes, pred_text, image_size, self.image_langs[idx])
+                page_image.save(os.path.join(loader.result_path, f"{name}_{idx}_text.png"))
+
+            out_pred = pred.model_dump()
+            out_pred["page"] = loader.page_numbers[idx]
+            yield idx, out_pred
+
+    def report(self, prefix: str = ""):
+        line_count, unique_count = self.rec_predictor.dedup_stats
+        if line_count > 0:
+            print(f"{prefix}Recognized {unique_count} unique text lines out of {line_count} ({1 - unique_count / line_count:.1%} deduplicated)")
+        if self.rec_predictor.result_cache is not None:
+            print(f"{prefix}Result cache: {self.rec_predictor.result_cache.stats()}")
 
 
 @click.command(help="Detect bboxes in an input file or folder (PDFs or image).")
 @CLILoader.common_options
 @click.option("--langs", type=str, help="Optional language(s) to use for OCR. Comma separate for multiple. Can be a capitalized language name, or a 2-letter ISO 639 code.", default=None)
 @click.option("--lang_file", type=str, help="Optional path to file with languages to use for OCR. Should be a JSON dict with file names as keys, and the value being a list of language codes/names.", default=None)
-def ocr_text_cli(input_path: str, langs: str, lang_file: str, **kwargs):
+@click.option("--text_layer", is_flag=True, help="Take the text of lines from the PDF text layer where it is reliable, and only OCR the rest.", default=False)
+@click.option("--regions", is_flag=True, help="Run layout first, and only OCR the text inside layout regions with the region labels.", default=False)
+@click.option("--region_labels", type=str, help="Layout labels to OCR in region mode, comma separated.  Defaults to text, tables and other text regions, but not pictures or page headers and footers.", default=None)
+def ocr_text_cli(input_path: str, langs: str, lang_file: str, text_layer: bool, regions: bool, region_labels: str, **kwargs):
     loader = CLILoader(input_path, kwargs, highres=True)
 
     if lang_file:
@@ -29,40 +116,24 @@ def ocr_text_cli(input_path: str, langs: str, lang_file: str, **kwargs):
         # We got our language settings from the input
         langs = langs.split(",")
         replace_lang_with_code(langs)
-        image_langs = [langs] * len(loader.images)
+        image_langs = [langs] * len(loader.names)
     else:
-        image_langs = [None] * len(loader.images)
+        image_langs = [None] * len(loader.names)
 
-    det_predictor = DetectionPredictor()
-    rec_predictor = RecognitionPredictor()
+    if region_labels:
+        region_labels = region_labels.split(",")
+    elif regions:
+        region_labels = settings.OCR_REGION_LABELS
 
     start = time.time()
-    predictions_by_image = rec_predictor(
-        loader.images,
-        image_langs,
-        det_predictor=det_predictor,
-        highres_images=loader.highres_images
-    )
+    max_chars = 0
+    with ResultWriter(loader.result_path) as writer:
+        for idx, out_pred in iter_results(OCRTextTask(loader, image_langs, text_layer, region_labels), loader.workers):
+            max_chars = max([max_chars] + [len(l["text"]) for l in out_pred["text_lines"]])
+            writer.write(loader.names[idx], out_pred)
 
     if loader.debug:
         print(f"OCR took {time.time() - start:.2f} seconds")
-        max_chars = max([len(l.text) for p in predictions_by_image for l in p.text_lines])
         print(f"Max chars: {max_chars}")
 
-    if loader.images:
-        for idx, (name, image, pred, langs) in enumerate(zip(loader.names, loader.images, predictions_by_image, image_langs)):
-            bboxes = [l.bbox for l in pred.text_lines]
-            pred_text = [l.text for l in pred.text_lines]
-            page_image = draw_text_on_image(bboxes, pred_text, image.size, langs)
-            page_image.save(os.path.join(loader.result_path, f"{name}_{idx}_text.png"))
-
-    out_preds = defaultdict(list)
-    for name, pred, image in zip(loader.names, predictions_by_image, loader.images):
-        out_pred = pred.model_dump()
-        out_pred["page"] = len(out_preds[name]) + 1
-        out_preds[name].append(out_pred)
-
-    with open(os.path.join(loader.result_path, "results.json"), "w+", encoding="utf-8") as f:
-        json.dump(out_preds, f, ensure_ascii=False)
-
-    print(f"Wrote results to {loader.result_path}")
\ No newline at end of file
+    print(f"Wrote results to {loader.result_path}")
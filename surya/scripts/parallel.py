@@ -0,0 +1,172 @@
+import math
+import multiprocessing
+import os
+import queue
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+import torch
+
+from surya.scripts.config import CLILoader
+from surya.settings import settings
+
+
+class PageTask:
+    """
+    The per page work of a CLI script.  Tasks are pickled to data parallel worker processes before their predictors
+    are loaded, so each worker loads its own predictors, and runs its share of the pages.
+    """
+    def __init__(self, loader: CLILoader):
+        self.loader = loader
+
+    def load(self):
+        # Loads the predictors, in the process that runs the task
+        raise NotImplementedError()
+
+    def run(self, page_idxs: List[int]) -> Iterator[Tuple[int, dict]]:
+        # Yields (page index, result) for the given pages, in page order.  A page can have any number of results.
+        raise NotImplementedError()
+
+    def report(self, prefix: str = ""):
+        # Prints debug stats once every page is processed
+        pass
+
+    def close(self):
+        # Releases what load started, like process pools.  Worker processes don't run exit handlers, and wait for their
+        # child processes to exit first.
+        pass
+
+
+def worker_core_sets(workers: int, cores: List[int] | None = None) -> List[List[int]]:
+    # Contiguous core ranges, which keeps each worker on as few sockets as possible
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    if workers >= len(cores):
+        return [[cores[rank % len(cores)]] for rank in range(workers)]
+
+    bounds = [round(rank * len(cores) / workers) for rank in range(workers + 1)]
+    return [cores[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def worker_env(rank: int, cores: List[int]) -> Dict[str, str]:
+    env = {"OMP_NUM_THREADS": str(len(cores)), "MKL_NUM_THREADS": str(len(cores))}
+    if settings.TORCH_DEVICE_MODEL == "cuda" and torch.cuda.device_count() > 1:
+        # Each worker sees a single GPU, round robin over the visible ones
+        visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+        devices = visible.split(",") if visible else [str(device) for device in range(torch.cuda.device_count())]
+        env["CUDA_VISIBLE_DEVICES"] = devices[rank % len(devices)]
+    return env
+
+
+@contextmanager
+def patched_environ(env: Dict[str, str]):
+    # Spawned processes start from the parent environment, so it is set around starting each worker
+    previous = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def run_worker(rank: int, task: PageTask, cores: List[int], task_queue, result_queue):
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
+
+        # Pages are rasterized in the worker itself, on its own cores
+        settings.LOADER_WORKERS = 0
+        task.load()
+        try:
+            while True:
+                chunk = task_queue.get()
+                if chunk is None:
+                    break
+                chunk_idx, page_idxs = chunk
+                result_queue.put(("result", chunk_idx, list(task.run(page_idxs))))
+
+            if task.loader.debug:
+                task.report(prefix=f"Worker {rank}: ")
+        finally:
+            task.close()
+    except BaseException:
+        result_queue.put(("error", rank, traceback.format_exc()))
+
+
+def iter_results(task: PageTask, workers: int = 1, chunk_size: int | None = None) -> Iterator[Tuple[int, dict]]:
+    """
+    Yields (page index, result) for every page of the task's loader, in page order.
+
+    With more than one worker, each worker process loads its own predictors, pinned to its own set of cores with a
+    matching torch thread count, or to its own GPU.  Workers pull chunks of pages from a shared queue as they finish the
+    previous one, and results are put back in page order, so the output doesn't depend on which worker ran a page.
+    """
+    page_count = len(task.loader.pages)
+    if workers <= 1 or page_count <= 1:
+        task.load()
+        try:
+            yield from task.run(list(range(page_count)))
+            if task.loader.debug:
+                task.report()
+        finally:
+            task.close()
+        return
+
+    workers = min(workers, page_count)
+    if chunk_size is None:
+        chunk_size = settings.LOADER_CHUNK_SIZE
+    # Small enough chunks that every worker gets pages, and a slow chunk doesn't hold up the end of the run
+    chunk_size = max(1, min(chunk_size, math.ceil(page_count / (workers * 2))))
+    chunks = [list(range(start, min(start + chunk_size, page_count))) for start in range(0, page_count, chunk_size)]
+
+    context = multiprocessing.get_context("spawn")
+    task_queue = context.Queue()
+    result_queue = context.Queue()
+    for chunk_idx, page_idxs in enumerate(chunks):
+        task_queue.put((chunk_idx, page_idxs))
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = []
+    try:
+        for rank, cores in enumerate(worker_core_sets(workers)):
+            # Not daemonic, so workers can start their own process pools, like the detection postprocessing one.  They
+            # are terminated below if the run stops early.
+            process = context.Process(target=run_worker, args=(rank, task, cores, task_queue, result_queue), daemon=False)
+            with patched_environ(worker_env(rank, cores)):
+                process.start()
+            processes.append(process)
+
+        finished = {}
+        next_chunk = 0
+        while next_chunk < len(chunks):
+            if next_chunk in finished:
+                yield from finished.pop(next_chunk)
+                next_chunk += 1
+                continue
+
+            try:
+                kind, key, value = result_queue.get(timeout=1)
+            except queue.Empty:
+                for rank, process in enumerate(processes):
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError(f"Worker {rank} exited with code {process.exitcode}")
+                continue
+
+            if kind == "error":
+                raise RuntimeError(f"Worker {key} failed:\n{value}")
+            finished[key] = value
+
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -0,0 +1 @@
+from surya.server.client import OCRClient
\ No newline at end of file
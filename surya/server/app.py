@@ -0,0 +1,164 @@
+import json
+import os
+import socketserver
+import tempfile
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from surya.detection import DetectionPredictor
+from surya.input.pages import PageSource, load_pages_from_file
+from surya.recognition import RecognitionPredictor
+from surya.recognition.languages import replace_lang_with_code
+from surya.scripts.config import CLILoader
+from surya.server.batcher import PageBatcher
+from surya.settings import settings
+
+
+class OCRPage:
+    def __init__(self, image: Image.Image, highres_image: Image.Image, langs: List[str] | None):
+        self.image = image
+        self.highres_image = highres_image
+        self.langs = langs
+
+
+def ocr_pages(det_predictor: DetectionPredictor, rec_predictor: RecognitionPredictor) -> Callable[[List[OCRPage]], List[dict]]:
+    # Detection and recognition both run on the whole batch, whichever requests its pages came from
+    def process(pages: List[OCRPage]) -> List[dict]:
+        predictions = rec_predictor(
+            [page.image for page in pages],
+            [page.langs for page in pages],
+            det_predictor=det_predictor,
+            highres_images=[page.highres_image for page in pages]
+        )
+        return [pred.model_dump() for pred in predictions]
+    return process
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /ocr with a PDF or image as the body OCRs it.  The languages and page range are given like on the CLI, as the
+    langs and page_range query parameters.  The response streams one JSON line per page, in page order, as soon as the
+    page is done.  A line with an "error" key ends the stream early.
+    GET /health returns once the server is up.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, {"status": "ok", "batch_pages": self.server.batcher.batch_size})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/ocr":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        query = parse_qs(url.query)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "upload")
+            with open(path, "wb") as f:
+                f.write(body)
+
+            try:
+                langs = None
+                if "langs" in query:
+                    langs = query["langs"][0].split(",")
+                    replace_lang_with_code(langs)
+                page_range = None
+                if "page_range" in query:
+                    page_range = CLILoader.parse_range_str(query["page_range"][0])
+
+                with self.server.render_lock:
+                    pages = load_pages_from_file(path, page_range, settings.IMAGE_DPI_HIGHRES)
+            except Exception as e:
+                self.send_json(400, {"error": f"Invalid request: {e}"})
+                return
+
+            try:
+                self.stream_pages(pages, langs)
+            finally:
+                with self.server.render_lock:
+                    for page in pages:
+                        page.close()
+
+    def stream_pages(self, pages: List[PageSource], langs: List[str] | None):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # A request keeps a batch worth of pages in flight, so a long document doesn't hold all its images at once
+        pending = deque()
+        next_page = 0
+        try:
+            while next_page < len(pages) or pending:
+                while next_page < len(pages) and len(pending) < self.server.batcher.batch_size:
+                    # pdfium isn't thread safe, so requests take turns rasterizing
+                    page = pages[next_page]
+                    with self.server.render_lock:
+                        image, highres_image = page.images([settings.IMAGE_DPI, settings.IMAGE_DPI_HIGHRES])
+                        page.release()
+                    pending.append(self.server.batcher.submit(OCRPage(image, highres_image, langs)))
+                    next_page += 1
+
+                result = pending.popleft().result()
+                result["page"] = next_page - len(pending)
+                self.write_chunk(json.dumps(result, ensure_ascii=False) + "\n")
+        except Exception as e:
+            for future in pending:
+                future.cancel()
+            self.write_chunk(json.dumps({"error": str(e)}) + "\n")
+        self.write_chunk("")
+
+    def write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status: int, content: dict):
+        data = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # UNIX socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "unix"
+
+
+class OCRHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class OCRUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+        batcher: PageBatcher,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        socket_path: str | None = None
+) -> socketserver.BaseServer:
+    # Every request handler thread submits its pages to the same batcher
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = OCRUnixHTTPServer(socket_path, OCRRequestHandler)
+    else:
+        server = OCRHTTPServer((host, port), OCRRequestHandler)
+    server.batcher = batcher
+    server.render_lock = threading.Lock()
+    return server
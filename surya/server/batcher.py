@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from surya.settings import settings
+
+
+class PageBatcher:
+    """
+    Collects pages submitted from any number of threads into shared batches, and runs them in a single model thread.
+
+    A batch runs once it has batch_size pages, or max_wait seconds after its first page arrived, whichever comes first,
+    so pages from concurrent requests share a batch without a lone page waiting long for company.
+    """
+    def __init__(
+            self,
+            process: Callable[[List[Any]], List[Any]],
+            batch_size: int = settings.SERVER_BATCH_PAGES,
+            max_wait: float = settings.SERVER_MAX_WAIT
+    ):
+        self.process = process
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batch_sizes: List[int] = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, page: Any) -> Future:
+        future = Future()
+        self.queue.put((page, future))
+        return future
+
+    def _next_batch(self) -> List | None:
+        item = self.queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Run what was collected, then stop
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            batch = [(page, future) for page, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.batch_sizes.append(len(batch))
+            try:
+                results = self.process([page for page, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        # Pages already submitted still run
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,72 @@
+import http.client
+import json
+import socket
+from typing import Iterator, List
+from urllib.parse import urlencode, urlparse
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class OCRClient:
+    """
+    Client for the surya_server OCR server, over HTTP or a UNIX socket.  Only needs the standard library, so it can be
+    used from processes that don't load torch.
+    """
+    def __init__(self, url: str = "http://127.0.0.1:8000", socket_path: str | None = None, timeout: float | None = None):
+        self.url = urlparse(url)
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def health(self) -> dict:
+        connection = self._connection()
+        try:
+            connection.request("GET", "/health")
+            response = connection.getresponse()
+            return json.loads(response.read())
+        finally:
+            connection.close()
+
+    def ocr(self, document: str | bytes, langs: List[str] | None = None, page_range: str | None = None) -> Iterator[dict]:
+        """
+        OCRs a PDF or image, given as a path or its bytes.  Yields the result of each page as the server finishes it,
+        in page order, in the same format as a page of the surya_ocr results.json.
+        """
+        if isinstance(document, str):
+            with open(document, "rb") as f:
+                document = f.read()
+
+        query = {}
+        if langs:
+            query["langs"] = ",".join(langs)
+        if page_range:
+            query["page_range"] = page_range
+
+        connection = self._connection()
+        try:
+            connection.request("POST", f"/ocr?{urlencode(query)}", body=document, headers={"Content-Type": "application/octet-stream"})
+            response = connection.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"OCR request failed with status {response.status}: {response.read().decode('utf-8', 'replace')}")
+
+            for line in response:
+                page = json.loads(line)
+                if "error" in page:
+                    raise RuntimeError(f"OCR request failed: {page['error']}")
+                yield page
+        finally:
+            connection.close()
@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional
 
 from dotenv import find_dotenv
 from pydantic import computed_field
@@ -16,6 +16,16 @@ class Settings(BaseSettings):
     ENABLE_EFFICIENT_ATTENTION: bool = True # Usually keep True, but if you get CUDA errors, setting to False can help
     ENABLE_CUDNN_ATTENTION: bool = False # Causes issues on many systems when set to True, but can improve performance on certain GPUs
     FLATTEN_PDF: bool = True # Flatten PDFs by merging form fields before processing
+    DECODE_SYNC_STEPS: int = 8 # Decode loops check on the host whether sequences finished only once every this many steps
+    DECODE_MIN_BATCH_BUCKET: int = 8 # Smallest batch size the captured decode step is run at, larger buckets double up to the batch size
+    DECODE_CUDA_GRAPHS: bool = True # Replay captured decode steps as CUDA graphs when compiling on CUDA
+    LOADER_PREFETCH_PAGES: int = 16 # Pages rasterized ahead of the page being processed
+    LOADER_WORKERS: int = min(4, os.cpu_count()) # Processes rasterizing pages, 0 to rasterize in the main process
+    LOADER_MIN_PARALLEL_PAGES: int = 16 # Minimum number of pages before rasterizing in worker processes
+    LOADER_CHUNK_SIZE: int = 32 # Pages the CLI scripts run through the models at once
+    RESULT_CACHE_DIR: Optional[str] = None # Directory of the persistent result cache, which is only used when set
+    RESULT_CACHE_MAX_BYTES: int = 4 * 1024 ** 3 # Least recently used results are evicted past this cache size
+    MODEL_CACHE_DIR: Optional[str] = None # Directory of a local safetensors copy of the model weights, memory mapped on load, only used when set
 
     # Paths
     DATA_DIR: str = "data"
@@ -45,6 +55,7 @@ class Settings(BaseSettings):
     DETECTOR_BLANK_THRESHOLD: float = 0.35 # Threshold for blank space (below this is considered blank)
     DETECTOR_POSTPROCESSING_CPU_WORKERS: int = min(8, os.cpu_count()) # Number of workers for postprocessing
     DETECTOR_MIN_PARALLEL_THRESH: int = 3 # Minimum number of images before we parallelize
+    DETECTOR_POSTPROCESSING_BACKEND: Literal["thread", "process", "fake"] = "thread" # Threads, worker processes reading heatmaps from shared memory, or the main thread
     COMPILE_DETECTOR: bool = False
 
     # Text recognition
@@ -63,6 +74,14 @@ class Settings(BaseSettings):
     RECOGNITION_PAD_VALUE: int = 255 # Should be 0 or 255
     COMPILE_RECOGNITION: bool = False # Static cache for torch compile
     RECOGNITION_ENCODER_BATCH_DIVISOR: int = 1 # Divisor for batch size in decoder
+    RECOGNITION_MIN_ADMIT_FRACTION: float = .25 # Admit new lines into the decode batch once this fraction of slots is free
+    RECOGNITION_LENGTH_BUCKETS: List[int] = [32, 80] # Token budgets of the buckets lines are grouped into by predicted length, the last bucket gets RECOGNITION_MAX_TOKENS
+    RECOGNITION_TOKENS_PER_ASPECT: float = 2.5 # Initial estimate of output tokens per unit of line aspect ratio (width / height), refined from recognized lines
+    RECOGNITION_BUCKET_MARGIN: float = 1.5 # Lines go into the smallest bucket with room for this multiple of their predicted length
+    RECOGNITION_BUCKET_MAX_BATCH_SCALE: int = 2 # Max batch size multiplier for buckets with small token budgets, dynamic cache only
+    RECOGNITION_PREPROCESS_ON_DEVICE: bool = True # Rescale and normalize line images on the model device, instead of the CPU
+    RECOGNITION_STREAM_MAX_INFLIGHT_PAGES: int = 64 # Max pages held in memory at once by RecognitionPredictor.stream
+    TEXT_LAYER_MIN_COVERAGE: float = 0.6 # PDF text layer characters must span this fraction of a line's width to be used instead of recognizing the line
 
     # Layout
     LAYOUT_MODEL_CHECKPOINT: str = "datalab-to/surya_layout@7ac8e390226ee5fa2125dd303d827f79d31d1a1f"
@@ -80,6 +99,7 @@ class Settings(BaseSettings):
     TABLE_REC_IMAGE_SIZE: Dict = {"height": 768, "width": 768}
     TABLE_REC_MAX_BOXES: int = 150
     TABLE_REC_BATCH_SIZE: Optional[int] = None
+    TABLE_REC_CELL_PASS_THRESHOLD: Optional[float] = None # Skip the per-row cell pass for tables where no row or column merges with at least this probability, None always runs it
     TABLE_REC_BENCH_DATASET_NAME: str = "datalab-to/fintabnet_bench"
     COMPILE_TABLE_REC: bool = False
 
@@ -88,6 +108,14 @@ class Settings(BaseSettings):
     OCR_ERROR_BATCH_SIZE: Optional[int] = None
     COMPILE_OCR_ERROR: bool = False
 
+    # Region OCR
+    OCR_REGION_LABELS: List[str] = ["Text", "TextInlineMath", "Code", "SectionHeader", "Caption", "Footnote", "Equation", "ListItem", "Table", "Form", "TableOfContents", "Handwriting"] # Layout labels OCRed by default in region mode
+    OCR_REGION_MARGIN: float = 0.005 # Layout regions are padded by this fraction of the page size on each side
+
+    # OCR server
+    SERVER_BATCH_PAGES: int = 8 # Pages from concurrent requests that run through the models together
+    SERVER_MAX_WAIT: float = 0.05 # Seconds the first page of a batch waits for more pages before the batch runs
+
     # Tesseract (for benchmarks only)
     TESSDATA_PREFIX: Optional[str] = None
     
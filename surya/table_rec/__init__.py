@@ -1,5 +1,5 @@
 from copy import deepcopy
-from itertools import chain
+from itertools import chain, groupby
 from typing import List
 
 import numpy as np
@@ -25,9 +25,12 @@ class TableRecPredictor(BasePredictor):
         "mps": 8,
         "cuda": 64
     }
+    cache_settings = ["TABLE_REC_IMAGE_SIZE", "TABLE_REC_MAX_BOXES", "TABLE_REC_CELL_PASS_THRESHOLD"]
+    # Table rows seen so far, and how many of them went through the cell pass
+    cell_pass_stats = (0, 0)
 
     def __call__(self, images: List[Image.Image], batch_size: int | None = None) -> List[TableResult]:
-        return self.batch_table_recognition(images, batch_size)
+        return self.cached_call(images, [], lambda pending_images: self.batch_table_recognition(pending_images, batch_size))
 
     @staticmethod
     def pad_to_batch_size(tensor: torch.Tensor, batch_size: int) -> torch.Tensor:
@@ -49,8 +52,6 @@ class TableRecPredictor(BasePredictor):
             current_batch_size: int,
             batch_size: int
     ):
-        shaper = LabelShaper()
-        batch_predictions = [[] for _ in range(current_batch_size)]
         max_tokens = settings.TABLE_REC_MAX_BOXES
         decoder_position_ids = torch.ones_like(batch_input_ids[0, :, 0], dtype=torch.int64, device=self.model.device).cumsum(
             0) - 1
@@ -62,9 +63,17 @@ class TableRecPredictor(BasePredictor):
 
         self.model.decoder.model._setup_cache(self.model.config, batch_size, self.model.device, self.model.dtype)
 
+        decoder_config = self.model.decoder.config
+        # Each step's box is kept on the device as its input ids, with unscaled bboxes and raw classes, followed by the
+        # probability of not merging and whether the image was still decoding.  MPS has no float64, elsewhere values
+        # are kept in double precision, which holds the model outputs exactly.
+        value_dtype = torch.float32 if self.model.device.type == "mps" else torch.float64
+        label_count = batch_input_ids.shape[-1]
+        step_values = []
+
         with torch.inference_mode():
             token_count = 0
-            all_done = torch.zeros(current_batch_size, dtype=torch.bool)
+            all_done = torch.zeros(current_batch_size, dtype=torch.bool, device=self.model.device)
 
             while token_count < max_tokens:
                 is_prefill = token_count == 0
@@ -78,47 +87,60 @@ class TableRecPredictor(BasePredictor):
 
                 decoder_position_ids = decoder_position_ids[-1:] + 1
 
-                # Get predictions for each box element
-                box_properties = []
-                done = []
-                for j in range(current_batch_size):
-                    box_property = {}
-                    for (k, kcount, mode) in BOX_PROPERTIES:
-                        k_logits = return_dict["box_property_logits"][k][j, -1, :]
-                        if mode == "classification":
-                            item = int(torch.argmax(k_logits, dim=-1).item())
-                            if k == "category":
-                                done.append(
-                                    item == self.model.decoder.config.eos_token_id or item == self.model.decoder.config.pad_token_id)
-                            item -= SPECIAL_TOKENS
-                            box_property[k] = item
-                        elif mode == "regression":
-                            if k == "bbox":
-                                k_logits *= BOX_DIM
-                                k_logits = k_logits.tolist()
-                            elif k == "colspan":
-                                k_logits = k_logits.clamp(min=1)
-                                k_logits = int(k_logits.round().item())
-                            box_property[k] = k_logits
-                    box_properties.append(box_property)
-
-                all_done = all_done | torch.tensor(done, dtype=torch.bool)
-
+                # Decode every box property of the whole batch at once, in input id order
+                values = []
+                for (k, kcount, mode) in BOX_PROPERTIES:
+                    k_logits = return_dict["box_property_logits"][k][:current_batch_size, -1, :]
+                    if mode == "classification":
+                        item = torch.argmax(k_logits, dim=-1)
+                        if k == "category":
+                            done = (item == decoder_config.eos_token_id) | (item == decoder_config.pad_token_id)
+                        elif k == "merges":
+                            # Probability that the box doesn't merge with another, used to skip the cell pass
+                            no_merge_prob = torch.softmax(k_logits[:, SPECIAL_TOKENS:].float(), dim=-1)[:, MERGE_KEYS["none"]]
+                        values.append(item.unsqueeze(-1).to(value_dtype))
+                    elif k == "bbox":
+                        values.append((k_logits * BOX_DIM).clamp(0, BOX_DIM).to(value_dtype))
+                    elif k == "colspan":
+                        values.append(k_logits.clamp(min=1).round().to(value_dtype))
+
+                all_done = all_done | done
+                # One sync per step, since cell pass sequences are only a few boxes long
                 if all_done.all():
                     break
 
-                batch_input_ids = torch.tensor(shaper.dict_to_labels(box_properties), dtype=torch.long).to(self.model.device)
-                batch_input_ids = batch_input_ids.unsqueeze(1)  # Add sequence length dimension
+                values = torch.cat(values, dim=-1)
+                step_values.append(torch.cat([values, no_merge_prob.unsqueeze(-1).to(value_dtype), (~all_done).unsqueeze(-1).to(value_dtype)], dim=-1))
 
-                for j, (box_property, status) in enumerate(zip(box_properties, all_done)):
-                    if not status:
-                        batch_predictions[j].append(box_property)
+                batch_input_ids = values.to(torch.long).unsqueeze(1)  # Add sequence length dimension
 
                 token_count += inference_token_count
                 inference_token_count = batch_input_ids.shape[1]
 
                 if settings.TABLE_REC_STATIC_CACHE:
                     batch_input_ids = self.pad_to_batch_size(batch_input_ids, batch_size)
+
+        batch_predictions = [[] for _ in range(current_batch_size)]
+        if len(step_values) == 0:
+            return batch_predictions
+
+        component_idxs = LabelShaper().component_idx_dict()
+        # Copied to the host in one go, and only turned into dicts here
+        for j, image_steps in enumerate(torch.stack(step_values, dim=1).tolist()):
+            for step in image_steps:
+                if not step[label_count + 1]:
+                    continue
+                box_property = {}
+                for (k, kcount, mode) in BOX_PROPERTIES:
+                    start, end = component_idxs[k]
+                    if mode == "classification":
+                        box_property[k] = int(step[start]) - SPECIAL_TOKENS
+                    elif k == "bbox":
+                        box_property[k] = step[start:end]
+                    elif k == "colspan":
+                        box_property[k] = int(step[start])
+                box_property["merge_prob"] = 1 - step[label_count]
+                batch_predictions[j].append(box_property)
         return batch_predictions
 
     def batch_table_recognition(
@@ -142,7 +164,10 @@ class TableRecPredictor(BasePredictor):
                 "is_header": 0
             })
 
-        output_order = []
+        shaper = LabelShaper()
+        rowcol_predictions = []
+        table_hidden_states = []
+        orig_sizes = []
         for i in tqdm(range(0, len(images), batch_size), desc="Recognizing tables"):
             batch_query_items = query_items[i:i + batch_size]
 
@@ -151,77 +176,103 @@ class TableRecPredictor(BasePredictor):
 
             current_batch_size = len(batch_images)
 
-            orig_sizes = [image.size for image in batch_images]
-            model_inputs = self.processor(images=batch_images, query_items=batch_query_items)
-
-            batch_pixel_values = model_inputs["pixel_values"]
+            orig_sizes.extend([image.size for image in batch_images])
+            model_inputs = self.processor(images=batch_images, query_items=batch_query_items, device=self.model.device)
 
             batch_input_ids = model_inputs["input_ids"].to(self.model.device)
-            batch_pixel_values = torch.tensor(np.array(batch_pixel_values), dtype=self.model.dtype).to(self.model.device)
-
-            shaper = LabelShaper()
+            batch_pixel_values = model_inputs["pixel_values"].to(dtype=self.model.dtype)
 
             # We only need to process each image once
             with torch.inference_mode():
                 encoder_hidden_states = self.model.encoder(pixel_values=batch_pixel_values).last_hidden_state
 
             # Inference to get rows and columns
-            rowcol_predictions = self.inference_loop(
+            rowcol_predictions.extend(self.inference_loop(
                 encoder_hidden_states,
                 batch_input_ids,
                 current_batch_size,
                 batch_size
-            )
-
+            ))
+            table_hidden_states.extend(encoder_hidden_states)
+
+        # Re-inference to predict cells, for the rows of every table at once
+        cell_predictions = self.batch_cell_recognition(rowcol_predictions, table_hidden_states, batch_size, shaper)
+        return self.decode_batch_predictions(rowcol_predictions, cell_predictions, orig_sizes, shaper)
+
+    def needs_cell_pass(self, img_predictions: List[dict]) -> bool:
+        # Cells only change the result when they span columns or merge across rows.  When no row or column is
+        # predicted to, the cell pass can be skipped.
+        threshold = settings.TABLE_REC_CELL_PASS_THRESHOLD
+        if threshold is None:
+            return True
+        return any(
+            prediction["merge_prob"] >= threshold or prediction["colspan"] > 1
+            for prediction in img_predictions
+            if prediction["category"] in [CATEGORY_TO_ID["Table-row"], CATEGORY_TO_ID["Table-column"]]
+        )
+
+    def batch_cell_recognition(
+            self,
+            rowcol_predictions: List[List[dict]],
+            table_hidden_states: List[torch.Tensor],
+            batch_size: int,
+            shaper: LabelShaper
+    ) -> List[List[List[dict]]]:
+        """
+        Predicts the cells of every row, returning a list of cells per row, per table.  Each row is decoded with its
+        own table's columns, and rows of tables with the same number of columns have the same input length, so rows
+        from different tables share batches.
+        """
+        cell_predictions = []
+        row_inputs = []  # (table index, row index, input ids) for every row that needs a cell pass
+        for j, img_predictions in enumerate(rowcol_predictions):
             row_query_items = []
-            row_encoder_hidden_states = []
-            idx_map = []
             columns = []
-            for j, img_predictions in enumerate(rowcol_predictions):
-                for row_prediction in img_predictions:
-                    polygon = shaper.convert_bbox_to_polygon(row_prediction["bbox"])
-                    if row_prediction["category"] == CATEGORY_TO_ID["Table-row"]:
-                        row_query_items.append({
-                            "polygon": polygon,
-                            "category": row_prediction["category"],
-                            "colspan": 0,
-                            "merges": 0,
-                            "is_header": int(row_prediction["is_header"] == 1)
-                        })
-                        row_encoder_hidden_states.append(encoder_hidden_states[j])
-                        idx_map.append(j)
-                    elif row_prediction["category"] == CATEGORY_TO_ID["Table-column"]:
-                        columns.append({
-                            "polygon": polygon,
-                            "category": row_prediction["category"],
-                            "colspan": 0,
-                            "merges": 0,
-                            "is_header": int(row_prediction["is_header"] == 1)
-                        })
-
-            # Re-inference to predict cells
-            row_encoder_hidden_states = torch.stack(row_encoder_hidden_states)
-            row_inputs = self.processor(images=None, query_items=row_query_items, columns=columns, convert_images=False)
-            row_input_ids = row_inputs["input_ids"].to(self.model.device)
-            cell_predictions = []
-            for j in range(0, len(row_input_ids), batch_size):
-                cell_batch_hidden_states = row_encoder_hidden_states[j:j + batch_size]
-                cell_batch_input_ids = row_input_ids[j:j + batch_size]
-                cell_batch_size = len(cell_batch_input_ids)
-                cell_predictions.extend(
-                    self.inference_loop(cell_batch_hidden_states, cell_batch_input_ids, cell_batch_size, batch_size)
-                )
-
-            result = self.decode_batch_predictions(rowcol_predictions, cell_predictions, orig_sizes, idx_map, shaper)
-            output_order.extend(result)
-
-        return output_order
-
-
-    def decode_batch_predictions(self, rowcol_predictions, cell_predictions, orig_sizes, idx_map, shaper):
+            for row_prediction in img_predictions:
+                polygon = shaper.convert_bbox_to_polygon(row_prediction["bbox"])
+                if row_prediction["category"] == CATEGORY_TO_ID["Table-row"]:
+                    row_query_items.append({
+                        "polygon": polygon,
+                        "category": row_prediction["category"],
+                        "colspan": 0,
+                        "merges": 0,
+                        "is_header": int(row_prediction["is_header"] == 1)
+                    })
+                elif row_prediction["category"] == CATEGORY_TO_ID["Table-column"]:
+                    columns.append({
+                        "polygon": polygon,
+                        "category": row_prediction["category"],
+                        "colspan": 0,
+                        "merges": 0,
+                        "is_header": int(row_prediction["is_header"] == 1)
+                    })
+
+            cell_predictions.append([[] for _ in row_query_items])
+            if len(row_query_items) == 0 or not self.needs_cell_pass(img_predictions):
+                continue
+
+            row_input_ids = self.processor(images=None, query_items=row_query_items, columns=columns, convert_images=False)["input_ids"]
+            row_inputs.extend((j, z, input_ids) for z, input_ids in enumerate(row_input_ids))
+
+        row_count, cell_pass_count = self.cell_pass_stats
+        self.cell_pass_stats = (row_count + sum(len(rows) for rows in cell_predictions), cell_pass_count + len(row_inputs))
+
+        row_inputs.sort(key=lambda row_input: row_input[2].shape[0])
+        for _, length_inputs in groupby(row_inputs, key=lambda row_input: row_input[2].shape[0]):
+            length_inputs = list(length_inputs)
+            for i in range(0, len(length_inputs), batch_size):
+                cell_batch = length_inputs[i:i + batch_size]
+                cell_batch_hidden_states = torch.stack([table_hidden_states[j] for j, _, _ in cell_batch])
+                cell_batch_input_ids = torch.stack([input_ids for _, _, input_ids in cell_batch]).to(self.model.device)
+                batch_cells = self.inference_loop(cell_batch_hidden_states, cell_batch_input_ids, len(cell_batch), batch_size)
+                for (j, z, _), row_cells in zip(cell_batch, batch_cells):
+                    cell_predictions[j][z] = row_cells
+
+        return cell_predictions
+
+    def decode_batch_predictions(self, rowcol_predictions, cell_predictions, orig_sizes, shaper):
         results = []
-        for j, (img_predictions, orig_size) in enumerate(zip(rowcol_predictions, orig_sizes)):
-            row_cell_predictions = [c for i, c in enumerate(cell_predictions) if idx_map[i] == j]
+        for img_predictions, row_cell_predictions, orig_size in zip(rowcol_predictions, cell_predictions, orig_sizes):
             # Each row prediction matches a cell prediction
             rows = []
             cells = []
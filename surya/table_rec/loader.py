@@ -28,16 +28,7 @@ class TableRecModelLoader(ModelLoader):
         if dtype is None:
             dtype = settings.MODEL_DTYPE
 
-        config = SuryaTableRecConfig.from_pretrained(self.checkpoint, revision=self.revision)
-        decoder_config = config.decoder
-        decoder = SuryaTableRecDecoderConfig(**decoder_config)
-        config.decoder = decoder
-
-        encoder_config = config.encoder
-        encoder = DonutSwinTableRecConfig(**encoder_config)
-        config.encoder = encoder
-
-        model = TableRecEncoderDecoderModel.from_pretrained(self.checkpoint, config=config, torch_dtype=dtype, revision=self.revision)
+        model = self.load_pretrained(TableRecEncoderDecoderModel, self.config, dtype)
 
         model = model.to(device)
         model = model.eval()
@@ -54,8 +45,19 @@ class TableRecModelLoader(ModelLoader):
         print(f"Loaded table recognition model {self.checkpoint} on device {device} with dtype {dtype}")
         return model
 
+    def config(self, path: Optional[str] = None) -> SuryaTableRecConfig:
+        config = SuryaTableRecConfig.from_pretrained(path or self.checkpoint, revision=self.revision)
+        decoder_config = config.decoder
+        decoder = SuryaTableRecDecoderConfig(**decoder_config)
+        config.decoder = decoder
+
+        encoder_config = config.encoder
+        encoder = DonutSwinTableRecConfig(**encoder_config)
+        config.encoder = encoder
+        return config
+
     def processor(self) -> SuryaProcessor:
-        processor = SuryaProcessor(self.checkpoint, self.revision)
+        processor = self.load_cached_processor(lambda path: SuryaProcessor(path, self.revision))
 
         processor.token_pad_id = 0
         processor.token_eos_id = 1
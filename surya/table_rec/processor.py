@@ -1,5 +1,6 @@
 from typing import List
 
+import numpy as np
 import PIL
 import torch
 from transformers import ProcessorMixin
@@ -50,6 +51,7 @@ class SuryaProcessor(ProcessorMixin):
             query_items: List[dict],
             columns: List[dict] | None = None,
             convert_images: bool = True,
+            device=None,
             *args,
             **kwargs
     ):
@@ -88,5 +90,5 @@ class SuryaProcessor(ProcessorMixin):
             "attention_mask": input_boxes_mask
         }
         if convert_images:
-            inputs["pixel_values"] = self.image_processor(images, *args, **kwargs)["pixel_values"]
+            inputs["pixel_values"] = self.image_processor.process_batch([np.asarray(image) for image in images], device=device)
         return inputs
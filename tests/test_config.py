@@ -0,0 +1,29 @@
+import json
+import os
+
+from PIL import Image
+
+from surya.scripts.config import CLILoader, ResultWriter
+
+
+def test_shared_names_are_grouped(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    for name in ["scan.png", "other.png", "scan.jpg"]:
+        Image.new("RGB", (32, 32)).save(input_dir / name)
+
+    loader = CLILoader(str(input_dir), {"output_dir": str(tmp_path / "output")})
+    assert sorted(loader.names) == ["other", "scan", "scan"]
+    # Folder order is arbitrary, but the pages named scan always end up next to each other
+    scan_idx = loader.names.index("scan")
+    assert loader.names[scan_idx + 1] == "scan"
+    assert loader.page_numbers[scan_idx:scan_idx + 2] == [1, 2]
+
+    with ResultWriter(loader.result_path) as writer:
+        for name, page in zip(loader.names, loader.page_numbers):
+            writer.write(name, {"page": page})
+
+    with open(os.path.join(loader.result_path, "results.json")) as f:
+        results = json.load(f)
+    assert results["scan"] == [{"page": 1}, {"page": 2}]
+    assert results["other"] == [{"page": 1}]
@@ -1,3 +1,8 @@
+import gc
+
+from surya.detection import DetectionPredictor
+
+
 def test_detection(detection_predictor, test_image):
     detection_results = detection_predictor([test_image])
 
@@ -5,4 +10,18 @@ def test_detection(detection_predictor, test_image):
     assert detection_results[0].image_bbox == [0, 0, 1024, 1024]
 
     bboxes = detection_results[0].bboxes
-    assert len(bboxes) == 4
\ No newline at end of file
+    assert len(bboxes) == 4
+
+
+def test_process_pool_shutdown():
+    # No model is needed for the postprocessing pool
+    predictor = DetectionPredictor.__new__(DetectionPredictor)
+    pool = predictor.get_process_pool()
+    assert pool.submit(sum, [1, 2]).result() == 3
+    predictor.close()
+    assert predictor.process_pool is None and pool._shutdown_thread
+
+    pool = predictor.get_process_pool()
+    del predictor
+    gc.collect()
+    assert pool._shutdown_thread
@@ -1,3 +1,13 @@
+import pytest
+import torch
+from PIL import Image
+
+from surya.layout.model.config import BBOX_SIZE
+from surya.layout.slicer import ImageSlicer
+from surya.layout.util import in_page_center, prediction_to_polygon, prediction_to_polygons
+from surya.settings import settings
+
+
 def test_layout_topk(layout_predictor, test_image):
     layout_results = layout_predictor([test_image])
 
@@ -12,3 +22,42 @@ def test_layout_topk(layout_predictor, test_image):
 
     assert bboxes[1].label == "Text"
     assert len(bboxes[1].top_k) == 5
+
+
+def test_slice_batches():
+    slicer = ImageSlicer(settings.LAYOUT_SLICE_MIN, settings.LAYOUT_SLICE_SIZE)
+    images = [Image.new("RGB", size) for size in [(816, 1056), (1300, 1400), (900, 3300), (2550, 1100), (600, 400)]]
+    for image in images:
+        assert slicer.slice_count(image) == len(slicer.slice_image(image, 0)[0])
+
+    batches = list(slicer.batches(images, 3))
+    assert [len(batch_slices) for batch_slices, _ in batches[:-1]] == [3] * (len(batches) - 1)
+    positions = [position for _, batch_positions in batches for position in batch_positions]
+    assert positions == slicer.slice(images)[1]
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16])
+def test_prediction_to_polygons(dtype):
+    # Box predictions as the layout decoder makes them, in the model dtype, with skews on either side of the scaler
+    torch.manual_seed(0)
+    count = 256
+    preds = torch.cat([
+        torch.rand(count, 4) * BBOX_SIZE,
+        BBOX_SIZE // 2 + torch.randint(-8, 9, (count, 2)) + torch.rand(count, 2),
+        torch.randint(0, 20, (count, 1))
+    ], dim=1).to(dtype)
+    sizes = [(int(w), int(h)) for w, h in torch.randint(100, 3000, (count, 2))]
+    img_sizes = torch.tensor(sizes, dtype=torch.float64)
+
+    polygons = prediction_to_polygons(preds, img_sizes, BBOX_SIZE, BBOX_SIZE // 2)
+    center = in_page_center(polygons, img_sizes)
+
+    expected = [prediction_to_polygon(pred, size, BBOX_SIZE, BBOX_SIZE // 2) for pred, size in zip(preds, sizes)]
+    expected_center = [
+        polygon[0][1] < size[1] * .8 and polygon[2][1] > size[1] * .2 and
+        polygon[0][0] < size[0] * .8 and polygon[2][0] > size[0] * .2
+        for polygon, size in zip(expected, sizes)
+    ]
+    assert polygons.tolist() == expected
+    assert center.tolist() == expected_center
+    assert 0 < sum(expected_center) < count
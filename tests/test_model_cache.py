@@ -0,0 +1,43 @@
+import os
+
+import torch
+
+from surya.common.load import ModelLoader, load_cached_model, save_cached_model
+from surya.detection.processor import SegformerImageProcessor
+from surya.ocr_error.model.config import DistilBertConfig
+from surya.ocr_error.model.encoder import DistilBertForSequenceClassification
+from surya.settings import settings
+
+
+def test_model_cache(tmp_path):
+    config = DistilBertConfig(vocab_size=100, dim=32, n_layers=1, n_heads=2, hidden_dim=64)
+    model = DistilBertForSequenceClassification(config).eval()
+    save_cached_model(model, str(tmp_path), torch.float32)
+
+    cached = load_cached_model(DistilBertForSequenceClassification, str(tmp_path), torch.float32).eval()
+    assert not any(tensor.is_meta for tensor in cached.parameters())
+    assert cached.config.to_dict() == model.config.to_dict()
+
+    input_ids = torch.randint(0, 100, (2, 7))
+    with torch.inference_mode():
+        assert torch.equal(model(input_ids).logits, cached(input_ids).logits)
+
+    # Another dtype isn't in the cache
+    assert load_cached_model(DistilBertForSequenceClassification, str(tmp_path), torch.float16) is None
+
+
+def test_processor_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CACHE_DIR", str(tmp_path))
+    loader = ModelLoader("org/model")
+    loaded_from = []
+
+    def processor(path):
+        loaded_from.append(path)
+        if path == loader.checkpoint:
+            return SegformerImageProcessor(size={"height": 64, "width": 32})
+        return SegformerImageProcessor.from_pretrained(path)
+
+    first = loader.load_cached_processor(processor)
+    cached = loader.load_cached_processor(processor)
+    assert loaded_from == ["org/model", os.path.join(loader.cache_path(), "processor")]
+    assert cached.to_dict() == first.to_dict()
@@ -0,0 +1,27 @@
+import pickle
+
+import pypdfium2 as pdfium
+
+from surya.input.load import rasterize_page
+from surya.input.pages import load_pdf_pages
+
+
+def test_pdf_pages_from_worker(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    doc = pdfium.PdfDocument.new()
+    for _ in range(2):
+        doc.new_page(612, 792)
+    doc.save(path)
+    doc.close()
+
+    # Like a loader worker, which renders its own copy of the page
+    pages = load_pdf_pages(path, render_dpi=192)
+    for page in pages:
+        page.set_images([192], rasterize_page(pickle.loads(pickle.dumps(page)), [192]))
+
+    handle = pages[0].handle
+    assert handle.pending_pages == 0
+    assert pages[0].image(72).size == (612, 792)
+    for page in pages:
+        page.text_layer()
+    assert handle.doc is None
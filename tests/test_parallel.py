@@ -0,0 +1,32 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from types import SimpleNamespace
+
+from surya.scripts.parallel import PageTask, iter_results, worker_core_sets
+
+
+def test_worker_core_sets():
+    assert worker_core_sets(3, list(range(8))) == [[0, 1, 2], [3, 4], [5, 6, 7]]
+    assert worker_core_sets(1, [2, 3]) == [[2, 3]]
+
+    # More workers than cores share them
+    assert worker_core_sets(3, [0, 1]) == [[0], [1], [0]]
+
+
+class PoolTask(PageTask):
+    # Starts a process pool when it loads, like the detection predictor does for postprocessing
+    def load(self):
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+    def run(self, page_idxs):
+        for page_idx in page_idxs:
+            yield page_idx, {"square": self.pool.submit(pow, page_idx, 2).result()}
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def test_workers_start_process_pools():
+    task = PoolTask(SimpleNamespace(pages=list(range(4)), debug=False))
+    results = list(iter_results(task, workers=2, chunk_size=1))
+    assert results == [(page_idx, {"square": page_idx ** 2}) for page_idx in range(4)]
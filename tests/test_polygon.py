@@ -0,0 +1,16 @@
+from surya.recognition.schema import OCRResult, TextLine
+
+
+def test_polygon_batch_cache():
+    result = OCRResult(text_lines=[TextLine(polygon=[0, 0, 10, 10], text="a")], image_bbox=[0, 0, 100, 100])
+    batch = result.polygon_batch
+    batch.shift(x_shift=5)
+    # Changing a batch that was handed out doesn't change the cached one
+    assert result.polygon_batch.polygons[0, 0].tolist() == [0, 0]
+
+    result.text_lines.append(TextLine(polygon=[20, 20, 30, 30], text="b"))
+    assert result.polygon_batch.texts.tolist() == ["a", "b"]
+
+    result.text_lines[0].shift(x_shift=5)
+    result.reset_polygon_batch()
+    assert result.polygon_batch.polygons[0, 0].tolist() == [5, 0]
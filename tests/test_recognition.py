@@ -1,3 +1,62 @@
+import numpy as np
+import torch
+
+from surya.common.adetr.engine import DecodeStepEngine, batch_buckets
+from surya.common.donut.processor import SuryaEncoderImageProcessor
+from surya.recognition import RecognitionPredictor
+from surya.recognition.model.config import DonutSwinConfig, SuryaOCRConfig, SuryaOCRDecoderConfig, SuryaOCRTextEncoderConfig
+from surya.recognition.model.encoderdecoder import OCREncoderDecoderModel
+from surya.recognition.processor import SuryaProcessor
+from surya.settings import settings
+
+
+def tiny_recognition_predictor(monkeypatch, static_cache: bool) -> RecognitionPredictor:
+    # A small randomly initialized model, so decoding can be tested on CPU without downloading weights
+    monkeypatch.setattr(settings, "COMPILE_RECOGNITION", static_cache)
+    monkeypatch.setattr(settings, "RECOGNITION_MAX_TOKENS", 24)
+    monkeypatch.setattr(
+        SuryaEncoderImageProcessor,
+        "from_pretrained",
+        classmethod(lambda cls, *args, **kwargs: cls(do_normalize=True, image_mean=[0.5] * 3, image_std=[0.5] * 3))
+    )
+
+    torch.manual_seed(0)
+    layers = dict(
+        num_hidden_layers=2,
+        hidden_size=64,
+        intermediate_size=128,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        cross_attn_layers=(0, 1),
+        self_attn_layers=(0, 1),
+        global_attn_layers=(0, 1)
+    )
+    config = SuryaOCRConfig(
+        encoder=DonutSwinConfig(embed_dim=16, depths=[1, 1, 1, 1], num_heads=[1, 2, 2, 4], num_kv_heads=[1, 2, 2, 4]),
+        decoder=SuryaOCRDecoderConfig(**layers, encoder_hidden_size=64)
+    )
+    config.text_encoder = SuryaOCRTextEncoderConfig(**layers, encoder_hidden_size=128, query_token_count=16)
+    model = OCREncoderDecoderModel(config).eval()
+
+    # Only the first few tokens can be predicted, with the pad and eos tokens among them, so lines stop at varied
+    # lengths, and some run into the token limit
+    with torch.no_grad():
+        lm_head = model.decoder.lm_head.weight
+        lm_head[8:] = 0
+        lm_head[:8] *= 50
+        lm_head[:2] *= 1.3
+
+    predictor = RecognitionPredictor.__new__(RecognitionPredictor)
+    predictor.model = model
+    predictor.processor = SuryaProcessor(None, None)
+    return predictor
+
+
+def line_images(count: int):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (32, int(width), 3), dtype=np.uint8) for width in rng.integers(64, 400, count)]
+
+
 def test_recognition(recognition_predictor, detection_predictor, test_image):
     recognition_results = recognition_predictor([test_image], [None], detection_predictor)
 
@@ -6,4 +65,104 @@ def test_recognition(recognition_predictor, detection_predictor, test_image):
 
     text_lines = recognition_results[0].text_lines
     assert len(text_lines) == 4
-    assert text_lines[0].text == "Hello World"
\ No newline at end of file
+    assert text_lines[0].text == "Hello World"
+
+def test_recognition_stream(recognition_predictor, detection_predictor, test_image):
+    results = list(recognition_predictor.stream([test_image, test_image], [None, None], detection_predictor, max_inflight_pages=1))
+
+    assert len(results) == 2
+    for result in results:
+        assert result.image_bbox == [0, 0, 1024, 1024]
+        assert len(result.text_lines) == 4
+        assert result.text_lines[0].text == "Hello World"
+
+def test_decode_batch_buckets():
+    assert batch_buckets(256, 8) == [8, 16, 32, 64, 128, 256]
+    assert batch_buckets(48, 8) == [8, 16, 32, 48]
+    assert batch_buckets(4, 8) == [4]
+
+def greedy_decode(predictor: RecognitionPredictor, image, language, max_tokens: int):
+    # Decodes one line at a time, to check the batched decode loops against
+    eos_id, pad_id = predictor.processor.tokenizer.eos_id, predictor.processor.tokenizer.pad_id
+    with torch.inference_mode():
+        encoder_hidden_states, logits, length = predictor.prefill([image], [language], 1)
+        tokens = []
+        while True:
+            token = logits.argmax(dim=-1).item()
+            if token in (eos_id, pad_id):
+                return tokens, False
+            tokens.append(token)
+            if length >= max_tokens - 1:
+                return tokens, True
+
+            logits = predictor.model.decoder(
+                input_ids=torch.tensor([[token]]),
+                encoder_hidden_states=encoder_hidden_states,
+                cache_position=torch.tensor([length]),
+                use_cache=True
+            )["logits"][:, -1]
+            length += 1
+
+
+def test_continuous_decode(monkeypatch):
+    predictor = tiny_recognition_predictor(monkeypatch, static_cache=False)
+    monkeypatch.setattr(settings, "DECODE_SYNC_STEPS", 1)
+    images = line_images(12)
+    # Lines in a prefill batch are padded to the same prefix length, so they all get the same languages here
+    languages = [None] * 12
+    expected = [greedy_decode(predictor, image, language, 16) for image, language in zip(images, languages)]
+
+    # Finished lines are evicted and new ones admitted while longer ones keep decoding, and the cache buffers grow
+    predictions, _, truncated = predictor.continuous_decode(images, languages, 3, max_tokens=16)
+    assert predictions == [tokens for tokens, _ in expected]
+    assert truncated == [is_truncated for _, is_truncated in expected]
+    assert any(truncated) and not all(truncated)
+
+
+def test_dynamic_cache_keeps_capacity(monkeypatch):
+    predictor = tiny_recognition_predictor(monkeypatch, static_cache=False)
+    block = predictor.model.decoder.model.layers[0].temporal_block
+    block._setup_cache(2, predictor.model.device)
+    shape = (2, block.num_key_value_heads, 1, block.head_dim)
+    for position in range(3):
+        block._update_cache(torch.randn(shape), torch.randn(shape), cache_position=torch.tensor([position]))
+    capacity = block._key_buffer.shape[2]
+    assert capacity > 3
+
+    # Evicting rows and positions keeps the spare capacity, so the next step writes into the same buffer
+    kept = block.key_states[1:, :, [0, 2]]
+    block._select_cache_rows(torch.tensor([1]), torch.tensor([0, 2]))
+    assert torch.equal(block.key_states, kept)
+    key_buffer = block._key_buffer
+    assert key_buffer.shape[2] == capacity
+    block._update_cache(torch.randn(shape)[:1], torch.randn(shape)[:1], cache_position=torch.tensor([2]))
+    assert block._key_buffer is key_buffer
+    assert block.key_states.shape[2] == 3
+
+
+def test_decode_step_engine(monkeypatch):
+    predictor = tiny_recognition_predictor(monkeypatch, static_cache=True)
+    images = line_images(10)
+    # Longer prefixes come first, so later prefills must clear the positions they wrote to
+    languages = [["en", "fr"]] * 4 + [["en"]] * 3 + [None] * 3
+    expected = predictor.continuous_decode(images, languages, 4)
+
+    text_encoder_config = predictor.model.text_encoder.config
+    predictor.decode_engine = DecodeStepEngine(
+        predictor.model.decoder,
+        4,
+        text_encoder_config.query_token_count,
+        text_encoder_config.hidden_size,
+        predictor.model.device,
+        predictor.model.dtype,
+        min_bucket=2
+    )
+    predictor.decode_engine.warmup()
+
+    # Admitted lines are prefilled into the engine's buffers, without setting up a new cache
+    def setup_cache(*args):
+        raise AssertionError("The decoder cache was set up again")
+    monkeypatch.setattr(predictor.model.decoder.model, "_setup_cache", setup_cache)
+    predictions, _, truncated = predictor.continuous_decode(images, languages, 4)
+    assert predictions == expected[0]
+    assert truncated == expected[2]
@@ -0,0 +1,25 @@
+from PIL import Image
+
+from surya.common.polygon import PolygonBox
+from surya.layout.schema import LayoutBox, LayoutResult
+from surya.recognition.regions import in_regions, mask_regions, region_bboxes
+
+
+def test_region_bboxes():
+    layout_result = LayoutResult(
+        bboxes=[
+            LayoutBox(polygon=[10, 10, 90, 40], label="Text", position=0),
+            LayoutBox(polygon=[0, 50, 100, 100], label="Picture", position=1),
+        ],
+        image_bbox=[0, 0, 100, 100]
+    )
+    regions = region_bboxes(layout_result, (100, 100), ["Text"], margin=.05)
+    assert regions == [[5, 5, 96, 46]]
+
+    image = Image.new("RGB", (100, 100), (0, 0, 0))
+    masked = mask_regions(image, regions)
+    assert masked.getpixel((50, 20)) == (0, 0, 0)
+    assert masked.getpixel((50, 70)) == (255, 255, 255)
+
+    assert in_regions(PolygonBox(polygon=[0, 10, 60, 30]), regions)
+    assert not in_regions(PolygonBox(polygon=[0, 40, 60, 60]), regions)
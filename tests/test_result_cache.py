@@ -0,0 +1,45 @@
+from PIL import Image
+
+from surya.common.cache import ResultCache
+from surya.settings import settings
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(str(tmp_path), ["test"])
+    image = Image.new("RGB", (64, 32), "white")
+    keys = [cache.key(image, 5), cache.key(image, 3), cache.key(image.resize((32, 32)), 5)]
+    assert len(set(keys)) == 3
+
+    cache.put_many({keys[0]: ["result"]})
+    assert cache.get_many(keys) == [["result"], None, None]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+    # Other namespaces, like another checkpoint, don't share results
+    other = ResultCache(str(tmp_path), ["other"])
+    assert other.get_many([other.key(image, 5)]) == [None]
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), ["test"], max_bytes=3500)
+    cache.put_many({cache.key(idx): b"x" * 1000 for idx in range(2)})
+    cache.get_many([cache.key(0)])  # Key 1 becomes the least recently used
+    cache.put_many({cache.key(idx): b"x" * 1000 for idx in range(2, 4)})
+
+    found = cache.get_many([cache.key(idx) for idx in range(4)])
+    assert [value is not None for value in found] == [True, False, True, True]
+
+    # The running total matches the entries that are left, including replaced ones
+    cache.put_many({cache.key(2): b"x" * 500})
+    stored = cache.connection.execute("SELECT SUM(size) FROM results").fetchone()[0]
+    assert cache._total_size() == stored
+
+
+def test_result_cache_settings(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), ["test"], ["RECOGNITION_MAX_TOKENS"])
+    cache.put_many({cache.key(0): ["result"]})
+    assert cache.get_many([cache.key(0)]) == [["result"]]
+
+    # Settings changed after the cache is created are part of later keys
+    monkeypatch.setattr(settings, "RECOGNITION_MAX_TOKENS", settings.RECOGNITION_MAX_TOKENS + 1)
+    assert cache.get_many([cache.key(0)]) == [None]
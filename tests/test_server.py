@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+from surya.server.batcher import PageBatcher
+
+
+def test_page_batcher():
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(pages):
+        started.set()
+        release.wait()
+        if "bad" in pages:
+            raise ValueError("bad page")
+        return [page * 2 for page in pages]
+
+    batcher = PageBatcher(process, batch_size=3, max_wait=1)
+    # The first page runs alone, and the pages that queue up behind it run together
+    first = batcher.submit(0)
+    started.wait()
+    futures = [batcher.submit(page) for page in [1, 2, 3]]
+    release.set()
+    assert first.result() == 0
+    assert [future.result() for future in futures] == [2, 4, 6]
+
+    # A failed batch fails every page in it
+    bad = [batcher.submit("bad"), batcher.submit(4)]
+    for future in bad:
+        with pytest.raises(ValueError):
+            future.result()
+
+    batcher.close()
+    assert batcher.batch_sizes == [1, 3, 2]
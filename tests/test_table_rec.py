@@ -1,5 +1,16 @@
+import torch
 from PIL import Image, ImageDraw
 
+from surya.common.donut.processor import SuryaEncoderImageProcessor
+from surya.settings import settings
+from surya.table_rec import TableRecPredictor
+from surya.table_rec.model.config import CATEGORY_TO_ID, DonutSwinTableRecConfig, SuryaTableRecConfig, \
+    SuryaTableRecDecoderConfig
+from surya.table_rec.model.encoderdecoder import TableRecEncoderDecoderModel
+from surya.table_rec.processor import SuryaProcessor
+from surya.table_rec.shaper import LabelShaper
+
+
 def test_table_rec(table_rec_predictor):
     data = [
         ["Name", "Age", "City"],
@@ -49,4 +60,98 @@ def draw_table(data, cell_width=100, cell_height=40):
 
             draw.text((x, y), text, fill='black')
 
-    return image
\ No newline at end of file
+    return image
+
+
+def tiny_table_rec_predictor(monkeypatch) -> TableRecPredictor:
+    # A small randomly initialized model, so the cell pass can be tested on CPU without downloading weights
+    monkeypatch.setattr(settings, "TABLE_REC_MAX_BOXES", 8)
+    monkeypatch.setattr(
+        SuryaEncoderImageProcessor,
+        "from_pretrained",
+        classmethod(lambda cls, *args, **kwargs: cls(do_normalize=True, image_mean=[0.5] * 3, image_std=[0.5] * 3))
+    )
+
+    torch.manual_seed(0)
+    config = SuryaTableRecConfig(
+        encoder=DonutSwinTableRecConfig(embed_dim=16, depths=[1, 1, 1, 1], num_heads=[1, 2, 2, 4], num_kv_heads=[1, 2, 2, 4]),
+        decoder=SuryaTableRecDecoderConfig(
+            num_hidden_layers=2,
+            hidden_size=64,
+            intermediate_size=128,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            cross_attn_layers=(0, 1),
+            self_attn_layers=(0, 1),
+            global_attn_layers=(0, 1),
+            encoder_hidden_size=128,
+            box_embed_size=48,
+            property_embed_size=16
+        )
+    )
+
+    predictor = TableRecPredictor.__new__(TableRecPredictor)
+    predictor.model = TableRecEncoderDecoderModel(config).eval()
+    predictor.processor = SuryaProcessor(None, None)
+    predictor.processor.token_pad_id = 0
+    predictor.processor.token_eos_id = 1
+    predictor.processor.token_bos_id = 1
+    predictor.processor.token_query_end_id = 4
+    return predictor
+
+
+def table_box(category: str, bbox: list, merge_prob: float = 0., colspan: int = 1) -> dict:
+    # A row or column, as the row and column pass predicts it
+    return {
+        "bbox": bbox,
+        "category": CATEGORY_TO_ID[category],
+        "merges": 0,
+        "colspan": colspan,
+        "is_header": 0,
+        "merge_prob": merge_prob
+    }
+
+
+def test_cell_pass(monkeypatch):
+    predictor = tiny_table_rec_predictor(monkeypatch)
+    shaper = LabelShaper()
+    # Two rows and two columns, as center x, center y, width, height, and unskewed corners
+    rows = [table_box("Table-row", [512, 256 + 512 * i, 1024, 512, 512, 512]) for i in range(2)]
+    columns = [table_box("Table-column", [256 + 512 * i, 512, 512, 1024, 512, 512]) for i in range(2)]
+    tables = [rows + columns, columns, []]
+    table_hidden_states = [torch.randn(16, 128) for _ in tables]
+
+    cell_batches = []
+    inference_loop = predictor.inference_loop
+
+    def record_inference_loop(encoder_hidden_states, batch_input_ids, current_batch_size, batch_size):
+        cell_batches.append(current_batch_size)
+        return inference_loop(encoder_hidden_states, batch_input_ids, current_batch_size, batch_size)
+
+    monkeypatch.setattr(predictor, "inference_loop", record_inference_loop)
+
+    # Without a threshold, every row goes through the cell pass, and tables without rows are skipped
+    monkeypatch.setattr(settings, "TABLE_REC_CELL_PASS_THRESHOLD", None)
+    assert predictor.needs_cell_pass(rows + columns)
+    cell_predictions = predictor.batch_cell_recognition(tables, table_hidden_states, 4, shaper)
+    assert [len(row_cells) for row_cells in cell_predictions] == [2, 0, 0]
+    assert cell_batches == [2]
+    assert predictor.cell_pass_stats == (2, 2)
+
+    # Without merges or colspans, the pass is skipped, and rows have no cells
+    cell_batches.clear()
+    monkeypatch.setattr(settings, "TABLE_REC_CELL_PASS_THRESHOLD", 0.5)
+    assert not predictor.needs_cell_pass(rows + columns)
+    cell_predictions = predictor.batch_cell_recognition(tables, table_hidden_states, 4, shaper)
+    assert cell_predictions == [[[], []], [], []]
+    assert cell_batches == []
+    assert predictor.cell_pass_stats == (4, 2)
+
+    # The rows and columns still make a cell each
+    results = predictor.decode_batch_predictions(tables, cell_predictions, [(200, 100)] * len(tables), shaper)
+    assert [len(result.cells) for result in results] == [4, 0, 0]
+    assert sorted((cell.row_id, cell.col_id) for cell in results[0].cells) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+    # A likely merge, or a column span, runs the pass
+    assert predictor.needs_cell_pass(rows + [table_box("Table-column", columns[0]["bbox"], merge_prob=0.6)])
+    assert predictor.needs_cell_pass([table_box("Table-row", rows[0]["bbox"], colspan=2)] + columns)
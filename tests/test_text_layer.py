@@ -0,0 +1,19 @@
+import numpy as np
+
+from surya.input.text_layer import PageTextLayer
+
+
+def test_match_lines():
+    # A word and an unmapped character on a 100x100 point page, each character 10 points wide
+    chars = list("Hi \ue000")
+    boxes = np.array([[10 + 10 * idx, 10, 20 + 10 * idx, 20] for idx in range(len(chars))], dtype=np.float64)
+    text_layer = PageTextLayer(chars, boxes, (100, 100))
+
+    # The page image is rendered at twice the size
+    polygons = [
+        [[18, 18], [62, 18], [62, 42], [18, 42]],  # "Hi"
+        [[18, 18], [122, 18], [122, 42], [18, 42]],  # Includes the unmapped character
+        [[18, 18], [198, 18], [198, 42], [18, 42]],  # "Hi" only covers a small part of the line
+        [[18, 100], [62, 100], [62, 140], [18, 140]],  # No text
+    ]
+    assert text_layer.match_lines(polygons, (200, 200)) == ["Hi", None, None, None]